@@ -1,28 +1,97 @@
+import asyncio
+import uuid
+from datetime import datetime
+
 from fastapi import APIRouter
 
-from app.core.database import SessionLocal
-from app.core.models import QueryCache
-from app.services.redis_service import redis_service
+from app.core.config import settings
+from app.core.database import db_session, run_in_db_thread
+from app.core.models import QueryCache, TableQueryMapping
+from app.services.cache import cache_backend
+from app.services.local_cache import broadcast_invalidation
+from app.services.query_stats import query_stats
 
 router = APIRouter()
 
-@router.delete("/cache")
-async def clear_cache(clear_db:bool = False):
-    redis_keys_deleted = 0
+# Recent background flushes, newest last; only the last few are kept.
+clear_jobs: dict[str, dict] = {}
+MAX_TRACKED_JOBS = 20
+
+
+def _clear_query_records() -> int:
+    with db_session() as db:
+        # One transaction so metadata and any legacy table mappings go together.
+        db_records_deleted = db.query(QueryCache).delete(synchronize_session=False)
+        db.query(TableQueryMapping).delete(synchronize_session=False)
+        db.commit()
+        query_stats.reset()
+        return db_records_deleted
 
-    for key in redis_service.redis.keys("*"):
-        redis_service.redis.delete(key)
-        redis_keys_deleted += 1
+
+async def _clear(clear_db: bool, job: dict) -> dict:
+    def on_progress(deleted: int):
+        job["redis_keys_deleted"] = deleted
+
+    redis_keys_deleted = await cache_backend.clear_namespace(
+        settings.CACHE_CLEAR_BATCH_SIZE, on_progress
+    )
+    await broadcast_invalidation(all_keys=True)
 
     db_records_deleted = 0
     if clear_db:
-        db = SessionLocal()
-        db_records_deleted = db.query(QueryCache).delete()
-        db.commit()
-        db.close()
+        db_records_deleted = await run_in_db_thread(_clear_query_records)
+
+    job.update(
+        status="finished",
+        redis_keys_deleted=redis_keys_deleted,
+        db_records_deleted=db_records_deleted,
+        finished_at=datetime.now().isoformat(),
+    )
+    return job
+
+
+async def _run_clear_job(clear_db: bool, job: dict):
+    try:
+        await _clear(clear_db, job)
+    except Exception as e:
+        job.update(status="failed", error=str(e), finished_at=datetime.now().isoformat())
+
+
+@router.delete("/cache")
+async def clear_cache(clear_db:bool = False, background: bool = False):
+    job = {
+        "job_id": uuid.uuid4().hex,
+        "status": "running",
+        "redis_keys_deleted": 0,
+        "db_records_deleted": 0,
+        "started_at": datetime.now().isoformat(),
+    }
+
+    if background:
+        clear_jobs[job["job_id"]] = job
+        while len(clear_jobs) > MAX_TRACKED_JOBS:
+            del clear_jobs[next(iter(clear_jobs))]
+        job["task"] = asyncio.create_task(_run_clear_job(clear_db, job))
+
+        return {
+            "message": "Cache clear started",
+            "job_id": job["job_id"],
+            "status_url": f"/cache/jobs/{job['job_id']}"
+        }
+
+    await _clear(clear_db, job)
 
     return {
         "message": "Cache cleared successfully",
-        "redis_keys_deleted": redis_keys_deleted,
-        "db_records_deleted": db_records_deleted
-    }
\ No newline at end of file
+        "redis_keys_deleted": job["redis_keys_deleted"],
+        "db_records_deleted": job["db_records_deleted"]
+    }
+
+
+@router.get("/cache/jobs/{job_id}")
+async def get_clear_job(job_id: str):
+    job = clear_jobs.get(job_id)
+    if job is None:
+        return {"error": "Unknown job", "job_id": job_id}
+
+    return {key: value for key, value in job.items() if key != "task"}
@@ -1,16 +1,20 @@
 from fastapi import APIRouter
+from sqlalchemy import text
 
-from app.core.database import SessionLocal
-from app.core.models import QueryCache, TableQueryMapping
-from app.services.redis_service import redis_service
+from app.core.database import db_session, run_in_db_thread
+from app.services.cache import cache_backend
+from app.services.invalidation import invalidate_tables, invalidate_template, invalidate_write
+from app.services.normalizer import parse_params, query_key
 from app.services.sql_parser import get_query_type, extract_tables
+from app.services.tracing import span
 
 router = APIRouter()
 
 
 @router.post("/invalidate")
 async def invalidate_cache(sql:str):
-    query_type = get_query_type(sql)
+    with span("parse"):
+        query_type = get_query_type(sql)
 
     if query_type not in ["UPDATE","INSERT","DELETE"]:
         return {
@@ -26,24 +30,87 @@ async def invalidate_cache(sql:str):
             "tables": []
         }
 
-    db = SessionLocal()
-    invalidated_count = 0
+    tables, invalidated_count, kept_count = await invalidate_write(sql)
 
-    for table in tables:
-        mappings = db.query(TableQueryMapping).filter(
-            TableQueryMapping.table_name == table
-        ).all()
+    return {
+        "message": "Cache invalidated successfully",
+        "query_type": query_type,
+        "tables": tables,
+        "cache_keys_invalidated": invalidated_count,
+        "cache_keys_kept": kept_count
+    }
 
-        for mapping in mappings:
-            await redis_service.delete(mapping.query_hash)
-            invalidated_count += 1
+@router.post("/invalidate/template")
+async def invalidate_template_family(sql: str):
+    key = query_key(sql)
+    invalidated_count = await invalidate_template(key.template_hash)
 
-    db.close()
+    return {
+        "message": "Template invalidated successfully",
+        "template": key.template,
+        "cache_keys_invalidated": invalidated_count
+    }
 
 
-    return {
-        "message": "Cache invalidated successfully",
+def _execute_write(sql: str, params: dict | None) -> int:
+    with db_session() as db:
+        result = db.execute(text(sql), params or {})
+        db.commit()
+        return result.rowcount
+
+
+async def _invalidate_committed_write(sql: str) -> tuple[list[str], int, int, str | None]:
+    """invalidate_write() for a write that is already committed.
+
+    Falls back to dropping the tables' entries if that fails, and reports
+    the error instead of raising: the write cannot be undone anymore.
+    """
+    try:
+        return *await invalidate_write(sql), None
+    except Exception as e:
+        error = str(e)
+
+    tables = extract_tables(sql)
+    try:
+        await cache_backend.bump_versions(tables)
+        return tables, await invalidate_tables(tables), 0, error
+    except Exception as e:
+        return tables, 0, 0, f"{error}; table invalidation also failed: {e}"
+
+
+@router.post("/write")
+async def write_through(sql: str, params: str | None = None):
+    """Execute a write, commit it, then invalidate what it affects.
+
+    Table versions are bumped with the invalidation, so fills that started
+    before the write are discarded instead of caching stale rows.
+    """
+    query_type = get_query_type(sql)
+
+    if query_type not in ["UPDATE","INSERT","DELETE"]:
+        return {
+            "error": "Only UPDATE/INSERT/DELETE queries can be written through",
+            "query_type": query_type
+        }
+
+    try:
+        rows_affected = await run_in_db_thread(_execute_write, sql, parse_params(params))
+    except Exception as e:
+        return {
+            "error": str(e),
+            "query": sql
+        }
+
+    tables, invalidated_count, kept_count, invalidation_error = await _invalidate_committed_write(sql)
+
+    response = {
+        "message": "Write committed and cache invalidated",
         "query_type": query_type,
+        "rows_affected": rows_affected,
         "tables": tables,
-        "cache_keys_invalidated": invalidated_count
-    }
\ No newline at end of file
+        "cache_keys_invalidated": invalidated_count,
+        "cache_keys_kept": kept_count
+    }
+    if invalidation_error is not None:
+        response["invalidation_error"] = invalidation_error
+    return response
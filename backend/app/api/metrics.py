@@ -0,0 +1,35 @@
+from fastapi import APIRouter, Response
+
+from app.core.config import settings
+from app.services import metrics
+from app.services.cache import cache_backend
+from app.services.local_cache import local_cache
+from app.services.tracing import slowest_profiles
+
+router = APIRouter()
+
+
+async def _eviction_lines() -> list[str]:
+    # Kept by the L1 cache and by the cache backend; read as they are on each
+    # scrape. Redis counts evictions server-wide, not only QueryCache's keys.
+    name = "querycache_evictions_total"
+    return [
+        f"# HELP {name} Cache entries evicted for space.",
+        f"# TYPE {name} counter",
+        f'{name}{{cache="l1"}} {local_cache.evictions}',
+        f'{name}{{cache="{settings.CACHE_BACKEND}"}} {await cache_backend.evicted_keys()}',
+    ]
+
+
+@router.get("/metrics")
+async def get_metrics():
+    return Response(
+        content=metrics.render(await _eviction_lines()),
+        media_type="text/plain; version=0.0.4",
+    )
+
+
+@router.get("/debug/profiles")
+async def get_profiles():
+    """cProfile output of the slowest traced requests (TRACE_PROFILE_SLOWEST)."""
+    return {"profiles": slowest_profiles.snapshot()}
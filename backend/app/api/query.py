@@ -1,21 +1,108 @@
-import hashlib
+import asyncio
 import json
 import time
+from contextlib import ExitStack
+from functools import lru_cache
+from typing import Annotated
 
-from fastapi import APIRouter
+import orjson
+from fastapi import APIRouter, Header, Query, Response
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
 from datetime import datetime
-from sqlalchemy import text
+from sqlalchemy import TextClause, text
+from sqlalchemy.exc import IntegrityError
 
-from app.core.models import TableQueryMapping
-from app.core.database import SessionLocal
+from app.core.database import db_session, run_in_db_thread
 from app.core.models import QueryCache
-from app.services.redis_service import redis_service
-from app.services.normalizer import normalize_query
+from app.core.config import settings
+from app.services import admission, metrics
+from app.services.cache import cache_backend
+from app.services.cache_backend import template_tag
+from app.services.cache_entry import pack_entry, should_refresh, unpack_entry
+from app.services.hit_counter import hit_counter
+from app.services.local_cache import local_cache
+from app.services.result_codec import decode_rows, encode_rows, msgpack_envelope, rows_json
+from app.services.single_flight import single_flight
+from app.services.normalizer import QueryKey, parse_params, query_key
+from app.services.predicates import select_predicates
+from app.services.query_stats import query_stats
 from app.services.sql_parser import get_query_type, extract_tables
+from app.services.tracing import span
 
 router = APIRouter()
 
 
+@lru_cache(maxsize=settings.PARSE_CACHE_SIZE)
+def _statement(template: str) -> TextClause:
+    # One compiled statement per template; identical SQL text also lets the
+    # driver reuse its prepared statement across bind values.
+    return text(template)
+
+
+def _row_dict(row) -> dict:
+    row_dict = dict(row._mapping)
+    for key, value in row_dict.items():
+        if isinstance(value, datetime):
+            row_dict[key] = value.isoformat()
+    return row_dict
+
+
+def _run_select(template: str, params: dict) -> list[dict]:
+    with db_session() as db:
+        with span("db_execute"):
+            result = db.execute(_statement(template), params)
+        with span("row_conversion"):
+            return [_row_dict(row) for row in result]
+
+
+def _open_stream(template: str, params: dict):
+    # yield_per makes the driver use a server-side cursor where it has one
+    # and buffer only one chunk of rows at a time. The session outlives this
+    # call, so it is handed back to be closed by _close_stream.
+    with ExitStack() as stack:
+        db = stack.enter_context(db_session())
+        result = db.execute(
+            _statement(template), params,
+            execution_options={"yield_per": settings.STREAM_CHUNK_ROWS},
+        )
+        return stack.pop_all(), result
+
+
+def _fetch_chunk(result) -> list[dict]:
+    return [_row_dict(row) for row in result.fetchmany(settings.STREAM_CHUNK_ROWS)]
+
+
+def _close_stream(session: ExitStack, result):
+    with session:
+        result.close()
+
+
+def _save_query_metadata(query_hash: str, sql: str, rows: list[dict]):
+    with db_session() as db:
+        try:
+            cache_entry = db.query(QueryCache).filter(
+                QueryCache.query_hash == query_hash
+            ).first()
+
+            if not cache_entry:
+                # Kept for query_stats: the row's own attributes expire on commit.
+                created_at = datetime.now()
+                cache_entry = QueryCache(
+                    query_hash=query_hash,
+                    original_query=sql,
+                    # Serialized only for a new row, in the DB thread.
+                    cached_result=orjson.dumps(rows, default=str).decode(),
+                    created_at=created_at,
+                )
+                db.add(cache_entry)
+                db.commit()
+                query_stats.record_query(query_hash, sql, created_at)
+        except IntegrityError:
+            # Another worker recorded the same query first.
+            db.rollback()
+
+
 @router.get("/parse")
 async def parse_query(sql: str):
     return {
@@ -25,86 +112,531 @@ async def parse_query(sql: str):
     }
 
 
+def _table_label(sql: str) -> str:
+    """The tables a query reads, as a metrics label."""
+    return ",".join(sorted(extract_tables(sql))) or "none"
+
+
+def _entry_tags(key: QueryKey, sql: str) -> list[str]:
+    return [*extract_tables(sql), template_tag(key.template_hash)]
+
+
+def _cache_item(
+    key: QueryKey, sql: str, rows: list[dict], execution_time_ms: float, versions: dict[str, int]
+) -> dict:
+    """Arguments for cache_backend.set() storing one result.
+
+    `versions` are the table versions read before the query ran.
+    """
+    predicates = select_predicates(sql)
+    started = time.perf_counter()
+    with span("encode"):
+        value = pack_entry(encode_rows(rows), execution_time_ms)
+    metrics.serialization.observe(time.perf_counter() - started, "database", _table_label(sql))
+    return {
+        "key": key.query_hash,
+        "value": value,
+        "tags": extract_tables(sql),
+        "predicates": json.dumps(predicates) if predicates else None,
+        "template": key.template_hash,
+        "versions": versions,
+    }
+
+
+async def _store_result(
+    key: QueryKey, sql: str, rows: list[dict], execution_time_ms: float, versions: dict[str, int]
+) -> str | None:
+    """Cache a fresh result; returns why it was not cached, or None."""
+    item = _cache_item(key, sql, rows, execution_time_ms, versions)
+    with span("admission"):
+        reason = await admission.admit(key.query_hash, len(item["value"]), execution_time_ms)
+    if reason is None:
+        started = time.perf_counter()
+        with span("redis_set"):
+            stored = await cache_backend.set(**item)
+        metrics.redis_latency.observe(time.perf_counter() - started, "set")
+        # A write since the query started makes the result stale: don't cache it.
+        if stored:
+            local_cache.set(key.query_hash, item["value"], settings.CACHE_HARD_TTL, _entry_tags(key, sql))
+            metrics.cache_fills.inc(_table_label(sql))
+        else:
+            reason = admission.STALE
+    if reason is not None:
+        metrics.cache_not_cached.inc(reason)
+    with span("metadata_commit"):
+        await run_in_db_thread(_save_query_metadata, key.query_hash, sql, rows)
+    return reason
+
+
+async def _fill_from_database(key: QueryKey, sql: str, background: bool = False):
+    query_hash = key.query_hash
+    # Only one worker fills a given key; the rest wait for its result.
+    with span("lock"):
+        lock_token = await cache_backend.acquire_lock(query_hash, settings.FILL_LOCK_TTL_MS)
+    if lock_token is None:
+        if background:
+            return None
+
+        started = time.perf_counter()
+        with span("fill_wait"):
+            cached = await cache_backend.wait_for(
+                query_hash, settings.FILL_WAIT_TIMEOUT, settings.FILL_WAIT_INTERVAL
+            )
+        if cached:
+            hit_counter.record(query_hash)
+            waited_ms = round((time.perf_counter() - started) * 1000, 2)
+            return "cache", decode_rows(unpack_entry(cached).payload), waited_ms, None
+
+    try:
+        with span("versions"):
+            versions = await cache_backend.table_versions(extract_tables(sql), query_hash)
+        start_time = time.time()
+        rows = await run_in_db_thread(_run_select, key.template, key.params)
+        elapsed = time.time() - start_time
+        execution_time_ms = round(elapsed * 1000, 2)
+        metrics.db_execution.observe(elapsed, _table_label(sql))
+
+        not_cached = await _store_result(key, sql, rows, execution_time_ms, versions)
+    finally:
+        if lock_token:
+            await cache_backend.release_lock(query_hash, lock_token)
+
+    return "database", rows, execution_time_ms, not_cached
+
+
+async def refill(key: QueryKey, sql: str) -> bool:
+    """Run a query and cache its result without a waiting client.
+
+    Joins this worker's refresh flight for the key, and gives up if another
+    worker holds its fill lock. Returns whether a result was stored.
+    """
+    outcome = await single_flight.do(
+        f"refresh:{key.query_hash}",
+        lambda: _fill_from_database(key, sql, background=True),
+    )
+    return outcome is not None and outcome[3] is None
+
+
+_background_refreshes: set[asyncio.Task] = set()
+
+
+async def _refresh_entry(key: QueryKey, sql: str, served_created_at: float):
+    query_hash = key.query_hash
+    try:
+        # Another worker may have refreshed already; our copy could be an old L1 entry.
+        cached, ttl = await cache_backend.get_with_ttl(query_hash)
+        if cached and unpack_entry(cached).created_at > served_created_at:
+            local_cache.set(query_hash, cached, ttl, _entry_tags(key, sql))
+            return
+
+        await refill(key, sql)
+    except Exception as e:
+        print(f"⚠️ Background refresh failed: {e}")
+
+
+def _schedule_refresh(key: QueryKey, sql: str, served_created_at: float):
+    if single_flight.in_flight(f"refresh:{key.query_hash}"):
+        return
+
+    task = asyncio.create_task(_refresh_entry(key, sql, served_created_at))
+    _background_refreshes.add(task)
+    task.add_done_callback(_background_refreshes.discard)
+
+
+# Responses are assembled as bytes in the field order and compact form
+# FastAPI's JSONResponse would produce, without re-encoding cached results.
+_SOURCE_PREFIX = {
+    source: b'{"source":' + orjson.dumps(source) + b',"query":'
+    for source in ("cache", "database")
+}
+
+
+def _envelope(
+    source: str, sql: str, result_json: bytes, execution_time_ms: float, not_cached: str | None = None
+) -> bytes:
+    # `not_cached` is why a database result was not stored; omitted when it was.
+    return b"".join((
+        _SOURCE_PREFIX[source], orjson.dumps(sql),
+        b',"result":', result_json,
+        b',"execution_time_ms":', orjson.dumps(execution_time_ms),
+        b',"not_cached":' + orjson.dumps(not_cached) if not_cached else b"",
+        b"}",
+    ))
+
+
+def _json_response(
+    source: str, sql: str, result_json: bytes, execution_time_ms: float, not_cached: str | None = None
+) -> Response:
+    return Response(
+        content=_envelope(source, sql, result_json, execution_time_ms, not_cached),
+        media_type="application/json",
+    )
+
+
 @router.get("/query")
-async def execute_query(sql: str):
+async def execute_query(
+    sql: str,
+    params: str | None = None,
+    accept: Annotated[str | None, Header()] = None,
+):
+    """Run a SELECT through the cache.
+
+    `params` is an optional JSON object of values for the query's :name
+    placeholders; the template and the values key the result separately.
+    Clients accepting application/x-msgpack get cache hits as msgpack with
+    the stored columnar result copied through undecoded.
+    """
     if not sql.strip().upper().startswith("SELECT"):
         return {"error": "Only SELECT queries are allowed"}
 
-    normalized_sql = normalize_query(sql)
-    query_hash = hashlib.md5(normalized_sql.encode()).hexdigest()
+    try:
+        bind_params = parse_params(params)
+    except ValueError:
+        return {"error": "params must be a JSON object", "query": sql}
+
+    request_start = time.perf_counter()
+    key = query_key(sql, bind_params)
+    query_hash = key.query_hash
+    table = _table_label(sql)
+
+    layer = "l1"
+    with span("l1_get"):
+        cached = local_cache.get(query_hash)
+    if cached is None:
+        layer = settings.CACHE_BACKEND
+        started = time.perf_counter()
+        with span("redis_get"):
+            cached, ttl = await cache_backend.get_with_ttl(query_hash)
+        metrics.redis_latency.observe(time.perf_counter() - started, "get")
+        if cached:
+            if local_cache.enabled:
+                local_cache.set(query_hash, cached, ttl, _entry_tags(key, sql))
 
-    cached = await redis_service.get(query_hash)
     if cached:
-        db = SessionLocal()
-        cache_entry = db.query(QueryCache).filter(
-            QueryCache.query_hash == query_hash
-        ).first()
+        hit_counter.record(query_hash)
+        metrics.cache_hits.inc(layer, table)
 
-        if cache_entry:
-            cache_entry.hits += 1
-            db.commit()
-        db.close()
+        # Serve what we have; stale or nearly-expired entries refresh in the background.
+        entry = unpack_entry(cached)
+        if should_refresh(entry, time.time()):
+            _schedule_refresh(key, sql, entry.created_at)
 
+        # Time to look the result up, from the start of the request.
+        started = time.perf_counter()
+        lookup_ms = round((started - request_start) * 1000, 2)
+        with span("response"):
+            if accept and "application/x-msgpack" in accept:
+                response = Response(
+                    content=msgpack_envelope(
+                        {"source": "cache", "query": sql, "execution_time_ms": lookup_ms},
+                        entry.payload,
+                    ),
+                    media_type="application/x-msgpack",
+                )
+            else:
+                response = _json_response("cache", sql, rows_json(entry.payload), lookup_ms)
+        finished = time.perf_counter()
+        metrics.serialization.observe(finished - started, "cache", table)
+        metrics.request_duration.observe(finished - request_start, "cache", table)
+        return response
+
+    metrics.cache_misses.inc(table)
+
+    query_stats.record_miss()
+    try:
+        # Concurrent misses for the same query in this worker share one fill.
+        source, rows, execution_time_ms, not_cached = await single_flight.do(
+            query_hash, lambda: _fill_from_database(key, sql)
+        )
+
+        started = time.perf_counter()
+        with span("response"):
+            response = _json_response(source, sql, orjson.dumps(rows, default=str), execution_time_ms, not_cached)
+        finished = time.perf_counter()
+        metrics.serialization.observe(finished - started, source, table)
+        metrics.request_duration.observe(finished - request_start, source, table)
+        return response
+
+    except Exception as e:
+        metrics.request_duration.observe(time.perf_counter() - request_start, "error", table)
         return {
-            "source": "cache",
-            "query": sql,
-            "result": json.loads(cached),
-            "execution_time_ms": 2
+            "error": str(e),
+            "query": sql
         }
 
-    db = SessionLocal()
-    start_time = time.time()
+
+class _StreamEncoder:
+    """Encodes row chunks as NDJSON lines or as one chunked JSON array."""
+
+    def __init__(self, fmt: str):
+        self.ndjson = fmt == "ndjson"
+        self.started = False
+
+    def chunk(self, rows: list[dict]) -> bytes:
+        if self.ndjson:
+            return b"".join(orjson.dumps(row, default=str) + b"\n" for row in rows)
+        body = b",".join(orjson.dumps(row, default=str) for row in rows)
+        if not self.started:
+            self.started = True
+            return b"[" + body
+        return b"," + body if body else b""
+
+    def end(self) -> bytes:
+        if self.ndjson:
+            return b""
+        return b"]" if self.started else b"[]"
+
+
+async def _stream_cached(entry, encoder: _StreamEncoder):
+    rows = decode_rows(entry.payload)
+    for start in range(0, len(rows), settings.STREAM_CHUNK_ROWS):
+        yield encoder.chunk(rows[start:start + settings.STREAM_CHUNK_ROWS])
+    yield encoder.end()
+
+
+class _DatabaseStream:
+    """A miss read through a server-side cursor and streamed as it arrives.
+
+    open() runs the query and fetches the first chunk, so errors surface
+    before the response status is sent. Rows are tee'd into a cache buffer
+    until the encoded size passes the cutoff; past it the result is only
+    streamed, never held in memory.
+    """
+
+    def __init__(self, key: QueryKey, sql: str, encoder: _StreamEncoder):
+        self.key = key
+        self.sql = sql
+        self.encoder = encoder
+        self.lock_token = None
+        self.versions = {}
+        self.start_time = 0.0
+        self.session = self.result = None
+        self.first_rows = []
+
+    async def open(self):
+        try:
+            self.lock_token = await cache_backend.acquire_lock(self.key.query_hash, settings.FILL_LOCK_TTL_MS)
+            self.versions = await cache_backend.table_versions(extract_tables(self.sql), self.key.query_hash)
+            self.start_time = time.time()
+            self.session, self.result = await run_in_db_thread(_open_stream, self.key.template, self.key.params)
+            self.first_rows = await run_in_db_thread(_fetch_chunk, self.result)
+        except Exception:
+            await self.close()
+            raise
+
+    async def close(self):
+        if self.session is not None:
+            session, self.session = self.session, None
+            await run_in_db_thread(_close_stream, session, self.result)
+        if self.lock_token:
+            lock_token, self.lock_token = self.lock_token, None
+            await cache_backend.release_lock(self.key.query_hash, lock_token)
+
+    async def body(self):
+        buffered = [] if self.lock_token else None
+        streamed_bytes = 0
+        rows = self.first_rows
+        try:
+            while rows:
+                chunk = self.encoder.chunk(rows)
+                streamed_bytes += len(chunk)
+                if buffered is not None:
+                    if streamed_bytes > settings.STREAM_MAX_CACHEABLE_BYTES:
+                        buffered = None
+                    else:
+                        buffered.extend(rows)
+                yield chunk
+                rows = await run_in_db_thread(_fetch_chunk, self.result)
+            execution_time_ms = round((time.time() - self.start_time) * 1000, 2)
+            yield self.encoder.end()
+
+            if buffered is not None:
+                await _store_result(self.key, self.sql, buffered, execution_time_ms, self.versions)
+        finally:
+            await self.close()
+
+
+@router.get("/query/stream")
+async def stream_query(
+    sql: str,
+    params: str | None = None,
+    fmt: Annotated[str, Query(alias="format")] = "ndjson",
+):
+    """Stream a SELECT's rows as NDJSON (or a chunked JSON array with format=json).
+
+    Misses fetch with a server-side cursor, one chunk at a time, and fill the
+    cache on the way unless the result exceeds STREAM_MAX_CACHEABLE_BYTES.
+    The X-Cache-Source header tells whether rows came from the cache.
+    """
+    if not sql.strip().upper().startswith("SELECT"):
+        return {"error": "Only SELECT queries are allowed"}
+    if fmt not in ("ndjson", "json"):
+        return {"error": "format must be ndjson or json", "query": sql}
 
     try:
-        result = db.execute(text(sql))
-        time.sleep(0.02)
-
-        rows = []
-        for row in result:
-            row_dict = dict(row._mapping)
-            for key, value in row_dict.items():
-                if isinstance(value, datetime):
-                    row_dict[key] = value.isoformat()
-            rows.append(row_dict)
-
-        execution_time_ms = round((time.time() - start_time) * 1000, 2)
-
-        await redis_service.set(query_hash, json.dumps(rows))
-
-        cache_entry = db.query(QueryCache).filter(
-            QueryCache.query_hash == query_hash
-        ).first()
-
-        if not cache_entry:
-            cache_entry = QueryCache(
-                query_hash=query_hash,
-                original_query=sql,
-                cached_result=json.dumps(rows),
-            )
-            db.add(cache_entry)
+        bind_params = parse_params(params)
+    except ValueError:
+        return {"error": "params must be a JSON object", "query": sql}
 
-            tables = extract_tables(sql)
-            for table in tables:
-                mapping = TableQueryMapping(
-                    table_name=table,
-                    query_hash=query_hash
-                )
-                db.add(mapping)
+    key = query_key(sql, bind_params)
+    encoder = _StreamEncoder(fmt)
+    media_type = "application/x-ndjson" if fmt == "ndjson" else "application/json"
 
-            db.commit()
+    layer = "l1"
+    cached = local_cache.get(key.query_hash)
+    if cached is None:
+        layer = settings.CACHE_BACKEND
+        started = time.perf_counter()
+        cached = await cache_backend.get(key.query_hash)
+        metrics.redis_latency.observe(time.perf_counter() - started, "get")
 
-        db.close()
+    if cached:
+        hit_counter.record(key.query_hash)
+        metrics.cache_hits.inc(layer, _table_label(sql))
+        return StreamingResponse(
+            _stream_cached(unpack_entry(cached), encoder),
+            media_type=media_type, headers={"X-Cache-Source": "cache"},
+        )
 
-        return {
-            "source": "database",
-            "query": sql,
-            "result": rows,
-            "execution_time_ms": execution_time_ms
-        }
+    metrics.cache_misses.inc(_table_label(sql))
 
+    query_stats.record_miss()
+    stream = _DatabaseStream(key, sql, encoder)
+    try:
+        await stream.open()
     except Exception as e:
-        db.close()
         return {
             "error": str(e),
             "query": sql
-        }
\ No newline at end of file
+        }
+    return StreamingResponse(
+        stream.body(), media_type=media_type, headers={"X-Cache-Source": "database"},
+    )
+
+
+class BatchQuery(BaseModel):
+    sql: str
+    params: dict | None = None
+
+
+class BatchRequest(BaseModel):
+    queries: list[BatchQuery]
+
+
+def _save_many_metadata(records: list[tuple[str, str, list[dict]]]):
+    for query_hash, sql, rows in records:
+        _save_query_metadata(query_hash, sql, rows)
+
+
+@router.post("/query/batch")
+async def execute_batch(batch: BatchRequest):
+    """Run several SELECTs with one cache round trip.
+
+    Lookups go out as a single MGET, misses run concurrently on at most
+    BATCH_MAX_CONCURRENCY database threads, and every fill is written back
+    in one pipeline. Each result carries its own source and timing.
+    """
+    if len(batch.queries) > settings.BATCH_MAX_QUERIES:
+        return {"error": f"A batch holds at most {settings.BATCH_MAX_QUERIES} queries"}
+
+    start_time = time.time()
+    statements = [item.sql for item in batch.queries]
+    parts: list[bytes | None] = [None] * len(statements)
+    keys: dict[int, QueryKey] = {}
+    for i, item in enumerate(batch.queries):
+        if item.sql.strip().upper().startswith("SELECT"):
+            keys[i] = query_key(item.sql, item.params)
+        else:
+            parts[i] = orjson.dumps({"error": "Only SELECT queries are allowed", "query": item.sql})
+
+    cached = {i: local_cache.get(key.query_hash) for i, key in keys.items()}
+    remote = [i for i, value in cached.items() if value is None]
+    lookup_start = time.time()
+    for i, value in zip(remote, await cache_backend.mget([keys[i].query_hash for i in remote])):
+        cached[i] = value
+    lookup_ms = round((time.time() - lookup_start) * 1000, 2)
+    if remote:
+        metrics.redis_latency.observe(lookup_ms / 1000, "mget")
+
+    # Statements with the same key share one execution.
+    misses: dict[str, list[int]] = {}
+    for i, value in cached.items():
+        key = keys[i]
+        if not value:
+            misses.setdefault(key.query_hash, []).append(i)
+            metrics.cache_misses.inc(_table_label(statements[i]))
+            query_stats.record_miss()
+            continue
+
+        hit_counter.record(key.query_hash)
+        metrics.cache_hits.inc(settings.CACHE_BACKEND if i in remote else "l1", _table_label(statements[i]))
+        entry = unpack_entry(value)
+        if should_refresh(entry, time.time()):
+            _schedule_refresh(key, statements[i], entry.created_at)
+        parts[i] = _envelope("cache", statements[i], rows_json(entry.payload), lookup_ms)
+
+    semaphore = asyncio.Semaphore(settings.BATCH_MAX_CONCURRENCY)
+
+    async def run_miss(key: QueryKey, sql: str):
+        async with semaphore:
+            versions = await cache_backend.table_versions(extract_tables(sql), key.query_hash)
+            started = time.time()
+            rows = await run_in_db_thread(_run_select, key.template, key.params)
+            elapsed = time.time() - started
+            metrics.db_execution.observe(elapsed, _table_label(sql))
+            return rows, round(elapsed * 1000, 2), versions
+
+    groups = list(misses.values())
+    outcomes = await asyncio.gather(
+        *(run_miss(keys[indexes[0]], statements[indexes[0]]) for indexes in groups),
+        return_exceptions=True,
+    )
+
+    fills = []
+    for indexes, outcome in zip(groups, outcomes):
+        if isinstance(outcome, Exception):
+            for i in indexes:
+                parts[i] = orjson.dumps({"error": str(outcome), "query": statements[i]})
+            continue
+
+        rows, execution_time_ms, versions = outcome
+        fills.append((indexes, (keys[indexes[0]], statements[indexes[0]], rows, execution_time_ms, versions)))
+
+    if fills:
+        items = [_cache_item(*fill) for _, fill in fills]
+        refusals = await asyncio.gather(*(
+            admission.admit(item["key"], len(item["value"]), fill[3])
+            for (_, fill), item in zip(fills, items)
+        ))
+        admitted = [item for item, reason in zip(items, refusals) if reason is None]
+        stored = set()
+        if admitted:
+            started = time.perf_counter()
+            stored = set(await cache_backend.set_many(admitted))
+            metrics.redis_latency.observe(time.perf_counter() - started, "set")
+        for n, ((_, (key, sql, *_)), item) in enumerate(zip(fills, items)):
+            if refusals[n] is not None:
+                continue
+            # A write since the query started makes the result stale: don't cache it.
+            if key.query_hash in stored:
+                local_cache.set(key.query_hash, item["value"], settings.CACHE_HARD_TTL, _entry_tags(key, sql))
+                metrics.cache_fills.inc(_table_label(sql))
+            else:
+                refusals[n] = admission.STALE
+        for reason in refusals:
+            if reason is not None:
+                metrics.cache_not_cached.inc(reason)
+        await run_in_db_thread(_save_many_metadata, [
+            (key.query_hash, sql, rows) for _, (key, sql, rows, *_) in fills
+        ])
+
+        for (indexes, (_, _, rows, execution_time_ms, _)), reason in zip(fills, refusals):
+            result_json = orjson.dumps(rows, default=str)
+            for i in indexes:
+                parts[i] = _envelope("database", statements[i], result_json, execution_time_ms, reason)
+
+    body = b"".join((
+        b'{"results":[', b",".join(parts),
+        b'],"execution_time_ms":', orjson.dumps(round((time.time() - start_time) * 1000, 2)), b"}",
+    ))
+    return Response(content=body, media_type="application/json")
@@ -1,38 +1,56 @@
 from fastapi import APIRouter
-from sqlalchemy import func
 
-from app.core.database import SessionLocal
+from app.core.config import settings
+from app.core.database import db_session, engine, pool_metrics, run_in_db_thread
 from app.core.models import QueryCache
-from app.services.redis_service import redis_service
+from app.services.cache import cache_backend
+from app.services.local_cache import local_cache
+from app.services.query_stats import query_stats
 
 router = APIRouter()
 
 
-@router.get("/stats")
-async def get_stats():
-    db = SessionLocal()
+def _describe_queries(query_hashes: list[str]) -> list[tuple]:
+    with db_session() as db:
+        return db.query(
+            QueryCache.query_hash, QueryCache.original_query, QueryCache.created_at
+        ).filter(QueryCache.query_hash.in_(query_hashes)).all()
+
+
+async def _top_queries() -> list[dict]:
+    top = query_stats.top(settings.STATS_TOP_K)
+    # Queries that entered the top through hits alone; at most K lookups by
+    # the query_hash index, and remembered from then on.
+    unknown = [query_hash for query_hash, _, described in top if described is None]
+    if unknown:
+        for row in await run_in_db_thread(_describe_queries, unknown):
+            query_stats.describe(*row)
+        top = query_stats.top(settings.STATS_TOP_K)
 
-    total_queries = db.query(QueryCache).count()
-    total_hits = db.query(func.sum(QueryCache.hits)).scalar() or 0
+    return [
+        {"query": described[0], "hits": hits, "cached_at": described[1].isoformat()}
+        for _, hits, described in top
+        if described is not None
+    ]
 
-    top_queries = db.query(QueryCache).order_by(QueryCache.hits.desc()).limit(5).all()
 
-    db.close()
+@router.get("/stats")
+async def get_stats():
+    # Running totals; nothing here scans query_cache.
+    top_queries = await _top_queries()
 
-    cache_info = redis_service.redis.info("memory")
-    cache_size_bytes = cache_info.get("used_memory", 0)
+    # Bytes of QueryCache's own entries, not the whole Redis server.
+    cache_size_bytes = await cache_backend.cached_bytes()
     cache_size_kb = round(cache_size_bytes / 1024, 2)
 
     return {
-        "total_queries": total_queries,
-        "total_hits": int(total_hits),
+        "total_queries": query_stats.total_queries,
+        "total_hits": query_stats.total_hits,
+        "hit_rate": query_stats.window_totals(),
         "cache_size": f"{cache_size_kb} KB",
-        "top_queries":[
-        {
-            "query": q.original_query,
-            "hits": q.hits,
-            "cached_at": q.created_at.isoformat()
-        }
-            for q in top_queries
-    ]
-    }
\ No newline at end of file
+        "cache_bytes": cache_size_bytes,
+        "cache_byte_budget": settings.CACHE_BYTE_BUDGET,
+        "l1_cache": local_cache.stats(),
+        "db_pool": pool_metrics.snapshot(engine.pool),
+        "top_queries": top_queries
+    }
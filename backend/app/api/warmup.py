@@ -0,0 +1,165 @@
+import asyncio
+from datetime import datetime
+
+from fastapi import APIRouter
+from sqlalchemy import extract, func, literal
+
+from app.api.query import refill
+from app.core.config import settings
+from app.core.database import db_session, run_in_db_thread
+from app.core.models import QueryCache
+from app.services.cache import cache_backend
+from app.services.normalizer import query_key
+from app.services.sql_tokenizer import tokenize
+
+router = APIRouter()
+
+# The latest warm-up run; /health reports not ready while it is running.
+warmup_job: dict = {"status": "idle"}
+_warmup_tasks: set[asyncio.Task] = set()
+
+
+def _decayed_hits(dialect: str, now: datetime):
+    """Hits halved every WARMUP_HALF_LIFE_HOURS since the query was first
+    cached: old favourites that are no longer hot give way to recent ones."""
+    if dialect == "sqlite":
+        age_hours = (func.julianday(now) - func.julianday(QueryCache.created_at)) * 24
+    else:
+        age_hours = extract("epoch", literal(now) - QueryCache.created_at) / 3600
+    return QueryCache.hits * func.power(0.5, age_hours / settings.WARMUP_HALF_LIFE_HOURS)
+
+
+def _load_candidates(top_n: int, score: str) -> list[str]:
+    """Most valuable recorded queries: by hits, or by hits decayed with age."""
+    with db_session() as db:
+        if score == "hits":
+            ranking = QueryCache.hits
+        else:
+            ranking = _decayed_hits(db.get_bind().dialect.name, datetime.now())
+        records = db.query(QueryCache.original_query).order_by(ranking.desc()).limit(top_n)
+        return [sql for sql, in records]
+
+
+class _RateLimiter:
+    """Spaces calls at least 1/rate seconds apart; rate <= 0 means unlimited."""
+
+    def __init__(self, rate: float):
+        self.interval = 1 / rate if rate > 0 else 0
+        self.next_at = 0.0
+
+    async def wait(self):
+        if not self.interval:
+            return
+        now = asyncio.get_running_loop().time()
+        slot = max(now, self.next_at)
+        self.next_at = slot + self.interval
+        await asyncio.sleep(slot - now)
+
+
+async def _warm(job: dict, top_n: int, score: str):
+    candidates = await run_in_db_thread(_load_candidates, top_n, score)
+
+    # Queries recorded with explicit :name placeholders cannot be replayed
+    # without their values.
+    replayable = [
+        sql for sql in candidates
+        if not any(token.kind == "param" for token in tokenize(sql))
+    ]
+    job["skipped"] = len(candidates) - len(replayable)
+
+    keys = [query_key(sql) for sql in replayable]
+    cached = await cache_backend.mget([key.query_hash for key in keys])
+    pending = [(key, sql) for key, sql, value in zip(keys, replayable, cached) if value is None]
+    job["already_cached"] = len(replayable) - len(pending)
+    job["total"] = len(candidates)
+
+    semaphore = asyncio.Semaphore(settings.WARMUP_CONCURRENCY)
+    limiter = _RateLimiter(settings.WARMUP_RATE_LIMIT)
+
+    async def warm_one(key, sql):
+        async with semaphore:
+            await limiter.wait()
+            try:
+                # Shares the refresh flight so a concurrent refresh is not repeated.
+                if await refill(key, sql):
+                    job["warmed"] += 1
+                else:
+                    # Refused by admission, or filled by another worker.
+                    job["not_cached"] += 1
+            except Exception as e:
+                job["failed"] += 1
+                print(f"⚠️ Warm-up failed for {sql!r}: {e}")
+
+    await asyncio.gather(*(warm_one(key, sql) for key, sql in pending))
+
+
+def _begin_job(score: str | None) -> dict | None:
+    """Start tracking a new run, or None if one is already running."""
+    global warmup_job
+
+    if warmup_job["status"] == "running":
+        return None
+
+    warmup_job = {
+        "status": "running",
+        "score": score or settings.WARMUP_SCORE,
+        "total": 0,
+        "warmed": 0,
+        "already_cached": 0,
+        "not_cached": 0,
+        "skipped": 0,
+        "failed": 0,
+        "started_at": datetime.now().isoformat(),
+    }
+    return warmup_job
+
+
+async def _run_job(job: dict, top_n: int | None) -> dict:
+    try:
+        await _warm(job, top_n or settings.WARMUP_TOP_N, job["score"])
+        job.update(status="finished", finished_at=datetime.now().isoformat())
+    except Exception as e:
+        print(f"⚠️ Warm-up failed: {e}")
+        job.update(status="failed", error=str(e), finished_at=datetime.now().isoformat())
+    return job
+
+
+async def run_warmup(top_n: int | None = None, score: str | None = None) -> dict:
+    job = _begin_job(score)
+    if job is None:
+        return warmup_job
+    return await _run_job(job, top_n)
+
+
+def start_warmup_task(top_n: int | None = None, score: str | None = None) -> asyncio.Task | None:
+    # The job is marked running before the task starts, so /health never
+    # reports ready in between.
+    job = _begin_job(score)
+    if job is None:
+        return None
+
+    task = asyncio.create_task(_run_job(job, top_n))
+    _warmup_tasks.add(task)
+    task.add_done_callback(_warmup_tasks.discard)
+    return task
+
+
+def is_warming_up() -> bool:
+    return warmup_job["status"] == "running"
+
+
+@router.post("/warmup")
+async def start_warmup(top_n: int | None = None, score: str | None = None, background: bool = False):
+    if score not in (None, "hits", "decayed"):
+        return {"error": "score must be hits or decayed"}
+
+    if background:
+        start_warmup_task(top_n, score)
+        return {"message": "Warm-up started", "status_url": "/warmup"}
+
+    return await run_warmup(top_n, score)
+
+
+@router.get("/warmup")
+async def get_warmup():
+    return warmup_job
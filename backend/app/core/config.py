@@ -7,12 +7,130 @@ class Settings(BaseSettings):
     PORT: int = 8000
     BASE_URL: str = "http://localhost:8000"
 
+    # Where entries live: "redis", "memory" (this process only) or "sqlite"
+    # (a file on local disk shared by the host's workers, kept across restarts).
+    CACHE_BACKEND: str = "redis"
+    CACHE_SQLITE_PATH: str = "./querycache-cache.db"
+
     # Redis
     REDIS_HOST: str = "localhost"
     REDIS_PORT: int = 6379
+    REDIS_MAX_CONNECTIONS: int = 100
+    REDIS_POOL_TIMEOUT: float = 5.0
+    # Read replicas of the Redis above serve cache hits.
+    REDIS_REPLICA_URLS: list[str] = []
+    REDIS_READ_FROM_REPLICAS: bool = True
+    # Sharding: entries are spread over REDIS_SHARDS ("primary-url[,replica-url...]"
+    # each) by consistent hashing of the query hash, or over
+    # REDIS_CLUSTER_SHARDS hash tags of a Redis Cluster.
+    REDIS_SHARDS: list[str] = []
+    REDIS_SHARD_POINTS: int = 160
+    REDIS_CLUSTER_URL: str | None = None
+    REDIS_CLUSTER_SHARDS: int = 32
+    CACHE_KEY_PREFIX: str = "querycache:"
+    CACHE_CLEAR_BATCH_SIZE: int = 1000
+    # Entries are served fresh until the soft TTL, then served stale while a
+    # background refresh runs, and dropped by Redis at the hard TTL.
+    CACHE_SOFT_TTL: int = 300
+    CACHE_HARD_TTL: int = 900
+    XFETCH_BETA: float = 1.0
+    FILL_LOCK_TTL_MS: int = 5000
+    FILL_WAIT_TIMEOUT: float = 3.0
+    FILL_WAIT_INTERVAL: float = 0.025
+
+    # Stored result format: "json" (rows) or "columnar" (msgpack column arrays).
+    # JSON hits are spliced into the response as stored; columnar values are
+    # smaller and copied through to msgpack clients, but JSON hits re-encode
+    # them. Columnar values above the threshold are compressed ("zstd", "lz4", "none").
+    CACHE_VALUE_FORMAT: str = "json"
+    CACHE_COMPRESSION: str = "zstd"
+    CACHE_COMPRESSION_THRESHOLD: int = 16 * 1024
+
+    # Admission: entries above CACHE_MAX_ENTRY_BYTES are never cached, nor are
+    # results whose DB time x misses per window stays below the minimum cost.
+    # CACHE_BYTE_BUDGET caps the bytes of all entries under the prefix; the
+    # running total is recounted every CACHE_BYTES_RECONCILE_INTERVAL seconds.
+    # A fill that would pass it evicts the least recently used entries first
+    # (on Redis, the idlest of CACHE_EVICTION_SAMPLES sampled keys at a time).
+    # 0 disables a limit.
+    CACHE_MAX_ENTRY_BYTES: int = 4 * 1024 * 1024
+    CACHE_ADMISSION_MIN_COST_MS: float = 0.0
+    CACHE_ADMISSION_WINDOW: int = 3600
+    CACHE_BYTE_BUDGET: int = 256 * 1024 * 1024
+    CACHE_BYTES_RECONCILE_INTERVAL: float = 300.0
+    CACHE_EVICTION_SAMPLES: int = 64
+
+    # /query/stream fetches and emits rows in chunks; results whose encoded
+    # size passes the cutoff are streamed without being cached.
+    STREAM_CHUNK_ROWS: int = 1000
+    STREAM_MAX_CACHEABLE_BYTES: int = 8 * 1024 * 1024
+
+    # POST /query/batch: statements per request and concurrent misses
+    BATCH_MAX_QUERIES: int = 100
+    BATCH_MAX_CONCURRENCY: int = 8
+
+    # Warm-up replays the top recorded queries (score "hits" or "decayed" by
+    # age) on startup or via POST /warmup; /health is 503 until it finishes.
+    WARMUP_ON_STARTUP: bool = True
+    WARMUP_TOP_N: int = 100
+    WARMUP_SCORE: str = "hits"
+    WARMUP_HALF_LIFE_HOURS: float = 24.0
+    WARMUP_CONCURRENCY: int = 4
+    WARMUP_RATE_LIMIT: float = 20.0
+
+    # Per-stage timings of /query and /invalidate. A request sending
+    # "X-QueryCache-Trace: 1" gets them in a Server-Timing header; TRACE_STAGES
+    # records every request into /metrics; TRACE_PROFILE_SLOWEST > 0 profiles
+    # the database-thread work of requests with cProfile and keeps the N
+    # slowest for GET /debug/profiles.
+    TRACE_STAGES: bool = False
+    TRACE_PROFILE_SLOWEST: int = 0
+
+    # /stats is served from totals kept in memory: the STATS_TOP_K most-hit
+    # queries (tracked among STATS_TOP_CAPACITY) and hit rates over the last
+    # minute and hour. Totals are reloaded from the database every
+    # STATS_RESYNC_INTERVAL seconds to take in other workers' hits (0 never).
+    STATS_TOP_K: int = 5
+    STATS_TOP_CAPACITY: int = 100
+    STATS_RESYNC_INTERVAL: float = 300.0
+
+    # In-process L1 cache in front of Redis
+    L1_CACHE_ENABLED: bool = False
+    L1_CACHE_MAX_ENTRIES: int = 1000
+    L1_CACHE_MAX_BYTES: int = 64 * 1024 * 1024
+
+    # Parsed queries memoized per raw SQL text
+    PARSE_CACHE_SIZE: int = 10000
+
+    # Bind literals as parameters so queries differing only in values share
+    # one template (and one prepared statement)
+    AUTO_PARAMETERIZE: bool = True
+
+    # Skip invalidating cached SELECTs whose rows provably don't overlap a write.
+    # Up to PREDICATE_ROW_LOOKUP_LIMIT updated rows are read back to find out
+    # which rows an UPDATE touched (0 disables the lookup).
+    PREDICATE_INVALIDATION: bool = True
+    PREDICATE_ROW_LOOKUP_LIMIT: int = 100
+
+    # Change-data capture: invalidate tables written by other services.
+    # Changes are collected and deduplicated per table every CDC_BATCH_WINDOW
+    # seconds (SQLite triggers + change log, Postgres LISTEN/NOTIFY). An empty
+    # CDC_TABLES watches every table except QueryCache's own.
+    CDC_ENABLED: bool = False
+    CDC_BATCH_WINDOW: float = 1.0
+    CDC_TABLES: list[str] = []
 
     # Database
     DATABASE_URL: str = "sqlite:///./querycache.db"
+    DB_MAX_WORKERS: int = 16
+    # Connection pool (QueuePool). Size it for DB_MAX_WORKERS plus concurrent
+    # streams; checkout waits and saturation are reported in /stats.
+    DB_POOL_SIZE: int = 16
+    DB_MAX_OVERFLOW: int = 16
+    DB_POOL_TIMEOUT: float = 30.0
+    DB_POOL_RECYCLE: int = 1800
+    DB_POOL_PRE_PING: bool = True
+    HIT_FLUSH_INTERVAL: float = 5.0
 
     class Config:
         env_file = ".env"
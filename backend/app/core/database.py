@@ -1,10 +1,144 @@
-from sqlalchemy import create_engine
+import asyncio
+import contextvars
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from sqlalchemy import create_engine, event, exc
+from sqlalchemy.engine import make_url
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.orm import declarative_base
+from sqlalchemy.pool import QueuePool
 
 from app.core.config import settings
+from app.services.tracing import profiled
+
+
+class PoolMetrics:
+    """Connection checkout wait times and peak usage, across all threads."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.peak_checked_out = 0
+
+    def record_checkout(self, wait: float, checked_out: int, timed_out: bool = False):
+        with self._lock:
+            if timed_out:
+                self.timeouts += 1
+            else:
+                self.checkouts += 1
+            self.wait_total += wait
+            self.wait_max = max(self.wait_max, wait)
+            self.peak_checked_out = max(self.peak_checked_out, checked_out)
+
+    def snapshot(self, pool) -> dict:
+        if not isinstance(pool, QueuePool):
+            return {"pool": type(pool).__name__}
+
+        capacity = pool.size() + max(settings.DB_MAX_OVERFLOW, 0)
+        checked_out = pool.checkedout()
+        with self._lock:
+            attempts = self.checkouts + self.timeouts
+            return {
+                "size": pool.size(),
+                "max_overflow": settings.DB_MAX_OVERFLOW,
+                "checked_out": checked_out,
+                "peak_checked_out": self.peak_checked_out,
+                "saturation": round(checked_out / capacity, 3) if capacity > 0 else None,
+                "checkouts": self.checkouts,
+                "timeouts": self.timeouts,
+                "avg_wait_ms": round(self.wait_total / attempts * 1000, 3) if attempts else 0.0,
+                "max_wait_ms": round(self.wait_max * 1000, 3),
+            }
+
+
+pool_metrics = PoolMetrics()
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that records how long each checkout waited for a connection."""
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except exc.TimeoutError:
+            pool_metrics.record_checkout(time.perf_counter() - start, self.checkedout(), timed_out=True)
+            raise
+        pool_metrics.record_checkout(time.perf_counter() - start, self.checkedout())
+        return connection
+
 
+def _engine_options(url: str) -> dict:
+    parsed = make_url(url)
+    if parsed.get_backend_name() == "sqlite" and parsed.database in (None, "", ":memory:"):
+        # In-memory SQLite lives in one connection; keep SQLAlchemy's default pool.
+        return {}
 
-engine = create_engine(settings.DATABASE_URL)
+    return {
+        "poolclass": TimedQueuePool,
+        "pool_size": settings.DB_POOL_SIZE,
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+        "pool_timeout": settings.DB_POOL_TIMEOUT,
+        "pool_recycle": settings.DB_POOL_RECYCLE,
+        "pool_pre_ping": settings.DB_POOL_PRE_PING,
+    }
+
+
+engine = create_engine(settings.DATABASE_URL, **_engine_options(settings.DATABASE_URL))
 SessionLocal = sessionmaker(bind=engine)
-Base = declarative_base()
\ No newline at end of file
+Base = declarative_base()
+
+
+if engine.dialect.name == "sqlite":
+    @event.listens_for(engine, "connect")
+    def _set_sqlite_pragmas(dbapi_connection, connection_record):
+        # WAL lets readers run alongside the writer; NORMAL sync is safe with WAL
+        # and avoids an fsync per commit.
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.close()
+
+
+@contextmanager
+def db_session():
+    """A session that is rolled back if the block raises and always closed.
+
+    Plain blocking code, so it works the same in a request dependency and in
+    functions run through run_in_db_thread.
+    """
+    db = SessionLocal()
+    try:
+        yield db
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+def get_db():
+    """Per-request session dependency."""
+    with db_session() as db:
+        yield db
+
+
+# SQLAlchemy sessions are blocking, so database work runs on a bounded pool of
+# threads and never stalls the event loop.
+db_executor = ThreadPoolExecutor(
+    max_workers=settings.DB_MAX_WORKERS,
+    thread_name_prefix="querycache-db",
+)
+
+
+async def run_in_db_thread(func, *args):
+    loop = asyncio.get_running_loop()
+    # Like asyncio.to_thread, the call sees the caller's context variables.
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(db_executor, context.run, profiled(func), *args)
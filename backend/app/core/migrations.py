@@ -0,0 +1,73 @@
+"""
+Schema changes for databases created before a model changed.
+
+create_all() only adds missing tables, so indexes added to existing tables
+are applied here: once each, in order, and recorded in querycache_migrations.
+They run on startup; `python -m app.core.migrations` applies them by hand
+(worth doing before a deploy on a large query_cache, since building an index
+holds writes to the table until it is done).
+"""
+from sqlalchemy import delete, func, inspect, insert, select, text
+from sqlalchemy.engine import Connection, Engine
+
+from app.core.database import engine
+from app.core.models import QueryCache, SchemaMigration, TableQueryMapping
+
+
+def _table_index(table, name: str):
+    return next(index for index in table.indexes if index.name == name)
+
+
+def _index_query_cache_hits(connection: Connection):
+    # /stats loads the most-hit queries by walking this index.
+    if inspect(connection).has_table(QueryCache.__tablename__):
+        _table_index(QueryCache.__table__, "ix_query_cache_hits").create(connection, checkfirst=True)
+
+
+def _index_table_query_mapping(connection: Connection):
+    # Lookups by table, and one mapping per (table, query): concurrent misses
+    # used to record the same pair more than once.
+    table = TableQueryMapping.__table__
+    inspector = inspect(connection)
+    if not inspector.has_table(table.name):
+        return
+    _table_index(table, "ix_table_query_mapping_table_name").create(connection, checkfirst=True)
+
+    columns = ["table_name", "query_hash"]
+    unique = [constraint["column_names"] for constraint in inspector.get_unique_constraints(table.name)]
+    unique += [index["column_names"] for index in inspector.get_indexes(table.name) if index["unique"]]
+    if columns in unique:
+        return
+    keep = select(func.min(table.c.id)).group_by(table.c.table_name, table.c.query_hash)
+    connection.execute(delete(table).where(table.c.id.not_in(keep)))
+    # A unique index rather than a constraint: SQLite cannot add constraints.
+    connection.execute(text(
+        f"CREATE UNIQUE INDEX uq_table_query_mapping_table_name_query_hash ON {table.name} (table_name, query_hash)"
+    ))
+
+
+MIGRATIONS = [
+    ("0001_index_query_cache_hits", _index_query_cache_hits),
+    ("0002_index_table_query_mapping", _index_table_query_mapping),
+]
+
+
+def migrate(bind: Engine = engine) -> list[str]:
+    """Apply the migrations this database has not seen; returns their names."""
+    SchemaMigration.__table__.create(bind=bind, checkfirst=True)
+
+    applied = []
+    with bind.begin() as connection:
+        done = set(connection.scalars(select(SchemaMigration.name)))
+        for name, migration in MIGRATIONS:
+            if name in done:
+                continue
+            migration(connection)
+            connection.execute(insert(SchemaMigration).values(name=name))
+            applied.append(name)
+    return applied
+
+
+if __name__ == "__main__":
+    applied = migrate()
+    print(f"Applied: {', '.join(applied)}" if applied else "Database is up to date.")
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime
+from sqlalchemy import Column, Integer, String, DateTime, UniqueConstraint
 from datetime import datetime
 
 from app.core.database import Base
@@ -12,17 +12,46 @@ class QueryCache(Base):
     original_query = Column(String, nullable=False)
     cached_result = Column(String, nullable=False)
     created_at = Column(DateTime, default=datetime.now)
-    hits = Column(Integer, default=0)
+    # Indexed for the top queries in /stats; see app/core/migrations.py.
+    hits = Column(Integer, default=0, index=True)
 
 
 class TableQueryMapping(Base):
+    """Tables each cached query reads; no longer written.
+
+    The cache backend's tag sets track this now. Kept so rows in existing
+    databases are still cleared with query_cache.
+    """
     __tablename__ = "table_query_mapping"
+    __table_args__ = (UniqueConstraint("table_name", "query_hash"),)
+
     id = Column(Integer, primary_key=True)
-    table_name = Column(String,nullable=False)
+    table_name = Column(String,nullable=False, index=True)
     query_hash = Column(String,nullable=False)
     created_at = Column(DateTime, default=datetime.now)
 
 
+class ChangeLog(Base):
+    """Tables changed since the change-capture loop last looked (SQLite triggers).
+
+    One row per table: triggers replace it, so it always carries a fresh id.
+    """
+    __tablename__ = "querycache_change_log"
+    __table_args__ = {"sqlite_autoincrement": True}
+
+    id = Column(Integer, primary_key=True)
+    table_name = Column(String, nullable=False, unique=True)
+    changed_at = Column(DateTime, default=datetime.now)
+
+
+class SchemaMigration(Base):
+    """Migrations from app/core/migrations.py applied to this database."""
+    __tablename__ = "querycache_migrations"
+
+    name = Column(String, primary_key=True)
+    applied_at = Column(DateTime, default=datetime.now)
+
+
 class Product(Base):
     __tablename__ = 'products'
 
@@ -1,4 +1,4 @@
-from app.core.database import SessionLocal, engine, Base
+from app.core.database import db_session, engine, Base
 from app.core.models import Product, User, Order
 from datetime import datetime, timedelta
 import random
@@ -7,11 +7,14 @@ import random
 def seed_database():
     Base.metadata.create_all(bind=engine)
 
-    db = SessionLocal()
+    # The session is closed even if seeding fails halfway.
+    with db_session() as db:
+        _seed(db)
 
+
+def _seed(db):
     if db.query(Product).count() > 0:
         print("Database already contains data. Skipping seed.")
-        db.close()
         return
 
     print("Seeding database with large dataset...")
@@ -98,8 +101,6 @@ def seed_database():
     print(f"Added 5000 orders")
     print("Database seeding complete!")
 
-    db.close()
-
 
 if __name__ == "__main__":
     seed_database()
\ No newline at end of file
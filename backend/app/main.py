@@ -1,7 +1,12 @@
-from fastapi import FastAPI
+import asyncio
+
+from fastapi import Depends, FastAPI, Response
 from fastapi.middleware.cors import CORSMiddleware
+from sqlalchemy.orm import Session
 
-from app.api import query, stats, cache, invalidate
+from app.api import query, stats, cache, invalidate, warmup, metrics
+from app.core.database import get_db
+from app.services.tracing import TracingMiddleware
 
 app = FastAPI(
     title="QueryCache API",
@@ -19,13 +24,17 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Server-Timing"],
 )
+app.add_middleware(TracingMiddleware)
 
 # Include routers
 app.include_router(query.router, tags=["Query"])
 app.include_router(stats.router, tags=["Statistics"])
 app.include_router(cache.router, tags=["Cache"])
 app.include_router(invalidate.router, tags=["Invalidation"])
+app.include_router(warmup.router, tags=["Warm-up"])
+app.include_router(metrics.router, tags=["Statistics"])
 
 
 @app.get("/")
@@ -38,7 +47,11 @@ async def root():
 
 
 @app.get("/health")
-async def health_check():
+async def health_check(response: Response):
+    if warmup.is_warming_up():
+        # Not ready until the cache is warm.
+        response.status_code = 503
+        return {"status": "warming_up", "warmup": warmup.warmup_job}
     return {"status": "healthy"}
 
 
@@ -46,13 +59,13 @@ async def health_check():
 async def startup_event():
     """Seed database on startup if empty"""
     from app.core.seed_database import seed_database
-    from app.core.database import SessionLocal
+    from app.core.database import db_session
     from app.core.models import Product
 
-    db = SessionLocal()
     try:
-        # Check if database is empty
-        product_count = db.query(Product).count()
+        with db_session() as db:
+            # Check if database is empty
+            product_count = db.query(Product).count()
         if product_count == 0:
             print("📦 Database is empty, seeding...")
             seed_database()
@@ -61,18 +74,96 @@ async def startup_event():
             print(f"✅ Database already has {product_count} products")
     except Exception as e:
         print(f"⚠️ Seeding check failed: {e}")
-    finally:
-        db.close()
+
+
+@app.on_event("startup")
+async def start_query_stats():
+    """Apply pending schema migrations, then load the totals /stats serves"""
+    from app.core.config import settings
+    from app.core.database import run_in_db_thread
+    from app.core.migrations import migrate
+    from app.services.query_stats import load_query_stats, resync_query_stats_periodically
+
+    try:
+        applied = await run_in_db_thread(migrate)
+        if applied:
+            print(f"✅ Applied migrations: {', '.join(applied)}")
+        await load_query_stats()
+    except Exception as e:
+        print(f"⚠️ Loading query stats failed: {e}")
+
+    if settings.STATS_RESYNC_INTERVAL > 0:
+        app.state.stats_resync = asyncio.create_task(resync_query_stats_periodically())
+
+
+@app.on_event("startup")
+async def start_invalidation_listener():
+    """Keep this worker's L1 cache coherent with invalidations from other workers"""
+    from app.services.local_cache import local_cache, listen_for_invalidations
+
+    if local_cache.enabled:
+        app.state.invalidation_listener = asyncio.create_task(listen_for_invalidations())
+
+
+@app.on_event("startup")
+async def start_hit_flusher():
+    """Persist accumulated cache hits to the database in the background"""
+    from app.services.hit_counter import flush_hits_periodically
+
+    app.state.hit_flusher = asyncio.create_task(flush_hits_periodically())
+
+
+@app.on_event("startup")
+async def start_byte_accounting():
+    """Recount the bytes held by cached entries, correcting for expired keys"""
+    from app.services.admission import reconcile_bytes_periodically
+
+    app.state.byte_accounting = asyncio.create_task(reconcile_bytes_periodically())
+
+
+@app.on_event("startup")
+async def start_change_capture():
+    """Invalidate tables written by other services, from database change events"""
+    from app.core.config import settings
+    from app.services.change_capture import capture_changes
+
+    if settings.CDC_ENABLED:
+        app.state.change_capture = asyncio.create_task(capture_changes())
+
+
+@app.on_event("startup")
+async def start_cache_warmup():
+    """Replay the most-hit recorded queries so the first requests after a deploy hit the cache"""
+    from app.core.config import settings
+
+    if settings.WARMUP_ON_STARTUP:
+        app.state.warmup = warmup.start_warmup_task()
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Stop background tasks, flush pending hits and close the cache backend"""
+    from app.services.hit_counter import hit_counter
+    from app.services.cache import cache_backend
+
+    for name in (
+        "invalidation_listener", "hit_flusher", "byte_accounting", "warmup", "change_capture", "stats_resync",
+    ):
+        task = getattr(app.state, name, None)
+        if task:
+            task.cancel()
+
+    await hit_counter.flush()
+
+    await cache_backend.close()
 
 
 @app.get("/seed-now")
-async def manual_seed():
+def manual_seed(db: Session = Depends(get_db)):
     """Manual database seeding"""
     from app.core.seed_database import seed_database
-    from app.core.database import SessionLocal
     from app.core.models import Product
 
-    db = SessionLocal()
     try:
         count_before = db.query(Product).count()
         print(f"Products before seeding: {count_before}")
@@ -90,8 +181,6 @@ async def manual_seed():
     except Exception as e:
         print(f"ERROR: {e}")
         return {"status": "error", "message": str(e)}
-    finally:
-        db.close()
 
 
 if __name__ == "__main__":
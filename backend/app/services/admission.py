@@ -0,0 +1,50 @@
+"""
+Cache admission: whether a freshly computed result is worth storing.
+
+A result is refused when its entry is larger than CACHE_MAX_ENTRY_BYTES,
+when its cost -- database time x misses within CACHE_ADMISSION_WINDOW --
+is below CACHE_ADMISSION_MIN_COST_MS, or when it would take QueryCache's
+entries past CACHE_BYTE_BUDGET and evicting older entries cannot make room.
+The reason is reported to the client.
+"""
+import asyncio
+
+from app.core.config import settings
+from app.services.cache import cache_backend
+
+
+ENTRY_TOO_LARGE = "entry_too_large"
+BELOW_ADMISSION_COST = "below_admission_cost"
+OVER_BYTE_BUDGET = "over_byte_budget"
+# Not an admission decision: a write bumped a table while the query ran.
+STALE = "stale"
+
+
+async def admit(query_hash: str, size: int, execution_time_ms: float) -> str | None:
+    """None if the entry may be cached, else why not."""
+    if settings.CACHE_MAX_ENTRY_BYTES and size > settings.CACHE_MAX_ENTRY_BYTES:
+        return ENTRY_TOO_LARGE
+
+    if not settings.CACHE_ADMISSION_MIN_COST_MS and not settings.CACHE_BYTE_BUDGET:
+        return None
+
+    misses, used = await cache_backend.record_fill(query_hash, settings.CACHE_ADMISSION_WINDOW)
+    if execution_time_ms * misses < settings.CACHE_ADMISSION_MIN_COST_MS:
+        return BELOW_ADMISSION_COST
+    if settings.CACHE_BYTE_BUDGET and used + size > settings.CACHE_BYTE_BUDGET:
+        # No point emptying the cache for an entry that could never fit.
+        if size > settings.CACHE_BYTE_BUDGET:
+            return OVER_BYTE_BUDGET
+        needed = used + size - settings.CACHE_BYTE_BUDGET
+        if await cache_backend.evict(needed) < needed:
+            return OVER_BYTE_BUDGET
+    return None
+
+
+async def reconcile_bytes_periodically():
+    while True:
+        try:
+            await cache_backend.reconcile_bytes(settings.CACHE_CLEAR_BATCH_SIZE)
+        except Exception as e:
+            print(f"⚠️ Cache byte reconciliation failed: {e}")
+        await asyncio.sleep(settings.CACHE_BYTES_RECONCILE_INTERVAL)
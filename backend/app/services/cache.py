@@ -0,0 +1,25 @@
+"""
+The cache backend every endpoint goes through, picked by CACHE_BACKEND.
+"""
+from app.core.config import settings
+from app.services.cache_backend import CacheBackend
+
+
+def create_cache_backend() -> CacheBackend:
+    if settings.CACHE_BACKEND == "redis":
+        from app.services.redis_service import create_redis_service
+
+        return create_redis_service()
+    if settings.CACHE_BACKEND == "memory":
+        from app.services.memory_backend import MemoryBackend
+
+        return MemoryBackend()
+    if settings.CACHE_BACKEND == "sqlite":
+        from app.services.sqlite_backend import SQLiteBackend
+
+        return SQLiteBackend(settings.CACHE_SQLITE_PATH)
+    raise ValueError(f"Unknown CACHE_BACKEND: {settings.CACHE_BACKEND!r}")
+
+
+# Shared by every request in the worker.
+cache_backend = create_cache_backend()
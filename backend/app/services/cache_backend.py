@@ -0,0 +1,143 @@
+"""
+The interface every cache backend implements: Redis (redis_service), this
+process's memory (memory_backend) or a file on local disk (sqlite_backend).
+CACHE_BACKEND picks one for app.services.cache.
+
+Keys passed in are query hashes (entry, lock and frequency keys are derived
+by the backend); tags are table names or template tags. Dependents are
+reported as entry keys (see entry_key). Entries are bytes.
+"""
+import asyncio
+from abc import ABC, abstractmethod
+from collections.abc import AsyncIterator
+
+from app.core.config import settings
+
+
+def entry_key(query_hash: str, prefix: str | None = None) -> str:
+    return f"{prefix or settings.CACHE_KEY_PREFIX}q:{query_hash}"
+
+
+def query_hash_from_key(key: str) -> str:
+    return key[key.rindex(":") + 1:]
+
+
+def template_tag(template_hash: str) -> str:
+    """Tag shared by every cached result of one query template."""
+    return f"template:{template_hash}"
+
+
+class CacheBackend(ABC):
+    @abstractmethod
+    async def get(self, key: str) -> bytes | None: ...
+
+    @abstractmethod
+    async def get_with_ttl(self, key: str) -> tuple[bytes | None, int]: ...
+
+    @abstractmethod
+    async def mget(self, keys: list[str]) -> list[bytes | None]: ...
+
+    async def set(
+        self,
+        key: str,
+        value: bytes,
+        ttl: int = settings.CACHE_HARD_TTL,
+        tags: list[str] = (),
+        predicates: str | None = None,
+        template: str | None = None,
+        versions: dict[str, int] | None = None,
+    ) -> bool:
+        """Store a value and register it under each tag, atomically.
+
+        A tag expires together with its newest member (all entries share
+        the hard TTL), so tags of tables that stop being queried do not linger.
+        Row predicates (JSON) are kept per table for predicate-aware invalidation.
+        `template` also files the key under its template's tag. With `versions`
+        (table versions read before the query ran) the value is discarded if a
+        write bumped any of them since. Returns whether the value was stored.
+        """
+        item = {
+            "key": key, "value": value, "ttl": ttl, "tags": tags,
+            "predicates": predicates, "template": template, "versions": versions,
+        }
+        return bool(await self.set_many([item]))
+
+    @abstractmethod
+    async def set_many(self, items: list[dict]) -> list[str]:
+        """Store several values; items take set()'s arguments. Returns the keys that were stored."""
+
+    @abstractmethod
+    async def delete(self, key: str): ...
+
+    @abstractmethod
+    def scan(self, batch_size: int) -> AsyncIterator[str]:
+        """Query hashes of the cached entries, fetched `batch_size` at a time."""
+
+    @abstractmethod
+    async def table_versions(self, tables: list[str], key: str) -> dict[str, int]:
+        """Versions of `tables` as seen by the entry `key` will be stored in."""
+
+    @abstractmethod
+    async def bump_versions(self, tables: list[str]):
+        """Mark the tables as written; fills that read older versions are dropped."""
+
+    @abstractmethod
+    async def invalidate_tags(self, tags: list[str]) -> int: ...
+
+    @abstractmethod
+    async def get_dependents(self, tag: str) -> tuple[list[str], dict[str, str]]:
+        """Entry keys tagged with `tag` and the predicates recorded for them."""
+
+    @abstractmethod
+    async def unlink_dependents(self, tag: str, keys: list[str]) -> int: ...
+
+    @abstractmethod
+    async def cached_bytes(self) -> int: ...
+
+    @abstractmethod
+    async def record_fill(self, query_hash: str, window: int) -> tuple[int, int]:
+        """Count a miss within a `window`-second period; returns (misses, cached_bytes())."""
+
+    @abstractmethod
+    async def reconcile_bytes(self, batch_size: int) -> int: ...
+
+    @abstractmethod
+    async def evict(self, nbytes: int) -> int:
+        """Remove entries, least recently used first, until at least `nbytes`
+        are freed or none are left; returns the bytes freed."""
+
+    @abstractmethod
+    async def clear_namespace(self, batch_size: int, on_progress=None) -> int: ...
+
+    @abstractmethod
+    async def acquire_lock(self, key: str, ttl_ms: int) -> str | None: ...
+
+    @abstractmethod
+    async def release_lock(self, key: str, token: str): ...
+
+    @abstractmethod
+    async def wait_for(self, key: str, timeout: float, interval: float) -> bytes | None:
+        """Poll for a value another worker is filling; None if it never shows up."""
+
+    async def publish(self, channel: str, message: str):
+        """Send `message` to every worker listening on `channel`.
+
+        Backends that live in one process have no other workers to tell.
+        """
+
+    async def listen(self, channel: str) -> AsyncIterator[str]:
+        """Messages published on `channel`, including this worker's own.
+
+        Raises if the connection drops, as messages may have been missed.
+        """
+        await asyncio.Event().wait()
+        yield
+
+    @abstractmethod
+    async def evicted_keys(self) -> int: ...
+
+    @abstractmethod
+    async def ping(self) -> bool: ...
+
+    @abstractmethod
+    async def close(self): ...
@@ -0,0 +1,38 @@
+import math
+import random
+import time
+from typing import NamedTuple
+
+from app.core.config import settings
+
+
+class CacheEntry(NamedTuple):
+    created_at: float
+    delta_ms: float
+    soft_ttl: int
+    payload: bytes
+
+
+def pack_entry(payload: bytes, delta_ms: float, soft_ttl: int = settings.CACHE_SOFT_TTL) -> bytes:
+    """Prefix a cached payload with the metadata needed for early refresh.
+
+    delta_ms is how long the query took to compute; expensive queries get
+    refreshed earlier so a miss never has to wait for them.
+    """
+    return f"{time.time():.3f}:{delta_ms:.2f}:{soft_ttl}\n".encode() + payload
+
+
+def unpack_entry(raw: bytes) -> CacheEntry:
+    header, _, payload = raw.partition(b"\n")
+    created_at, delta_ms, soft_ttl = header.split(b":")
+    return CacheEntry(float(created_at), float(delta_ms), int(soft_ttl), payload)
+
+
+def should_refresh(entry: CacheEntry, now: float, beta: float = settings.XFETCH_BETA) -> bool:
+    """XFetch probabilistic early expiration.
+
+    Always true once the soft TTL has passed; before that the chance grows as
+    the soft expiry approaches, scaled by how expensive the query is.
+    """
+    gap = -entry.delta_ms / 1000 * beta * math.log(1.0 - random.random())
+    return now + gap >= entry.created_at + entry.soft_ttl
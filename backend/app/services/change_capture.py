@@ -0,0 +1,173 @@
+"""
+Change-data capture: invalidate tables that are written without going
+through /write or /invalidate.
+
+SQLite records writes with triggers into a one-row-per-table change log;
+Postgres triggers send NOTIFY on a channel this worker LISTENs to. Every
+CDC_BATCH_WINDOW seconds the changed tables are collected, deduplicated and
+invalidated in one go.
+"""
+import asyncio
+import re
+
+from sqlalchemy import delete, inspect, select, text
+
+from app.core.config import settings
+from app.core.database import engine, run_in_db_thread
+from app.core.models import ChangeLog, QueryCache, SchemaMigration, TableQueryMapping
+from app.services.cache import cache_backend
+from app.services.invalidation import invalidate_tables
+
+
+INTERNAL_TABLES = {
+    QueryCache.__tablename__,
+    TableQueryMapping.__tablename__,
+    ChangeLog.__tablename__,
+    SchemaMigration.__tablename__,
+}
+
+NOTIFY_CHANNEL = "querycache_changes"
+
+
+def watched_tables() -> list[str]:
+    if settings.CDC_TABLES:
+        return list(settings.CDC_TABLES)
+    return [
+        table for table in inspect(engine).get_table_names()
+        if table not in INTERNAL_TABLES
+    ]
+
+
+def _trigger_name(table: str, operation: str) -> str:
+    return f"querycache_cdc_{re.sub(r'[^A-Za-z0-9_]', '_', table)}_{operation.lower()}"
+
+
+def _quoted(table: str) -> str:
+    return '"' + table.replace('"', '""') + '"'
+
+
+class SQLiteTriggerSource:
+    """Triggers upsert the table's row in the change log; collect() drains it."""
+
+    def install(self, tables: list[str]):
+        ChangeLog.__table__.create(bind=engine, checkfirst=True)
+        with engine.begin() as connection:
+            for table in tables:
+                literal = table.replace("'", "''")
+                for operation in ("INSERT", "UPDATE", "DELETE"):
+                    connection.execute(text(
+                        f"CREATE TRIGGER IF NOT EXISTS {_trigger_name(table, operation)} "
+                        f"AFTER {operation} ON {_quoted(table)} BEGIN "
+                        f"INSERT OR REPLACE INTO {ChangeLog.__tablename__} (table_name, changed_at) "
+                        f"VALUES ('{literal}', CURRENT_TIMESTAMP); END"
+                    ))
+
+    def uninstall(self, tables: list[str]):
+        with engine.begin() as connection:
+            for table in tables:
+                for operation in ("INSERT", "UPDATE", "DELETE"):
+                    connection.execute(text(f"DROP TRIGGER IF EXISTS {_trigger_name(table, operation)}"))
+
+    def collect(self) -> set[str]:
+        log = ChangeLog.__table__
+        with engine.begin() as connection:
+            rows = connection.execute(select(log.c.id, log.c.table_name)).all()
+            if rows:
+                # A change logged after the SELECT replaces its row with a new
+                # id, so it survives this delete and is seen next window.
+                connection.execute(delete(log).where(log.c.id.in_([row.id for row in rows])))
+        return {row.table_name for row in rows}
+
+    def close(self):
+        pass
+
+
+class PostgresNotifySource:
+    """Statement-level triggers NOTIFY the table name; collect() drains the queue."""
+
+    def __init__(self):
+        self.connection = None
+
+    def install(self, tables: list[str]):
+        with engine.begin() as connection:
+            connection.execute(text(
+                "CREATE OR REPLACE FUNCTION querycache_notify_change() RETURNS trigger AS $$ "
+                f"BEGIN PERFORM pg_notify('{NOTIFY_CHANNEL}', TG_TABLE_NAME); RETURN NULL; END; "
+                "$$ LANGUAGE plpgsql"
+            ))
+            for table in tables:
+                connection.execute(text(f"DROP TRIGGER IF EXISTS querycache_cdc ON {_quoted(table)}"))
+                connection.execute(text(
+                    f"CREATE TRIGGER querycache_cdc "
+                    f"AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON {_quoted(table)} "
+                    f"FOR EACH STATEMENT EXECUTE PROCEDURE querycache_notify_change()"
+                ))
+        self._listen()
+
+    def uninstall(self, tables: list[str]):
+        with engine.begin() as connection:
+            for table in tables:
+                connection.execute(text(f"DROP TRIGGER IF EXISTS querycache_cdc ON {_quoted(table)}"))
+
+    def _listen(self):
+        # A dedicated connection outside the pool: LISTEN state must not leak
+        # into connections handed to queries.
+        raw = engine.raw_connection()
+        raw.detach()
+        self.connection = raw.dbapi_connection
+        self.connection.autocommit = True
+        with self.connection.cursor() as cursor:
+            cursor.execute(f"LISTEN {NOTIFY_CHANNEL}")
+
+    def collect(self) -> set[str]:
+        if self.connection is None or self.connection.closed:
+            # Notifications sent while disconnected are lost; treat every
+            # watched table as changed.
+            self._listen()
+            return set(watched_tables())
+
+        self.connection.poll()
+        tables = {notify.payload for notify in self.connection.notifies}
+        self.connection.notifies.clear()
+        return tables
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+
+def change_source():
+    if engine.dialect.name == "sqlite":
+        return SQLiteTriggerSource()
+    if engine.dialect.name == "postgresql":
+        return PostgresNotifySource()
+    return None
+
+
+async def apply_changes(source) -> list[str]:
+    """Invalidate every table changed since the last call; returns them."""
+    tables = sorted(await run_in_db_thread(source.collect))
+    if tables:
+        await cache_backend.bump_versions(tables)
+        await invalidate_tables(tables)
+    return tables
+
+
+async def capture_changes():
+    source = change_source()
+    if source is None:
+        print(f"⚠️ Change capture is not supported for {engine.dialect.name}")
+        return
+
+    try:
+        await run_in_db_thread(source.install, watched_tables())
+        while True:
+            await asyncio.sleep(settings.CDC_BATCH_WINDOW)
+            try:
+                await apply_changes(source)
+            except Exception as e:
+                print(f"⚠️ Change capture failed: {e}")
+                await run_in_db_thread(source.close)
+    finally:
+        await run_in_db_thread(source.close)
@@ -0,0 +1,70 @@
+import asyncio
+from collections import Counter
+
+from sqlalchemy import bindparam, update
+
+from app.core.config import settings
+from app.core.database import db_session, run_in_db_thread
+from app.core.models import QueryCache
+from app.services.query_stats import query_stats
+
+
+class HitCounter:
+    """Accumulates cache hits in memory and flushes them to query_cache in batches.
+
+    Keeps the hit path free of database I/O; /stats counts hits as they are
+    recorded (see query_stats).
+    """
+
+    def __init__(self):
+        self._pending: Counter[str] = Counter()
+
+    def record(self, query_hash: str):
+        self._pending[query_hash] += 1
+        query_stats.record_hit(query_hash)
+
+    def pending(self) -> dict[str, int]:
+        return dict(self._pending)
+
+    def total_pending(self) -> int:
+        return sum(self._pending.values())
+
+    async def flush(self):
+        if not self._pending:
+            return
+
+        batch, self._pending = self._pending, Counter()
+        try:
+            await run_in_db_thread(_apply_hits, batch)
+        except Exception:
+            # Keep the counts for the next flush rather than losing them.
+            self._pending.update(batch)
+            raise
+
+
+def _apply_hits(batch: Counter[str]):
+    table = QueryCache.__table__
+    statement = (
+        update(table)
+        .where(table.c.query_hash == bindparam("b_hash"))
+        .values(hits=table.c.hits + bindparam("b_hits"))
+    )
+
+    with db_session() as db:
+        db.execute(statement, [
+            {"b_hash": query_hash, "b_hits": hits}
+            for query_hash, hits in batch.items()
+        ])
+        db.commit()
+
+
+hit_counter = HitCounter()
+
+
+async def flush_hits_periodically():
+    while True:
+        await asyncio.sleep(settings.HIT_FLUSH_INTERVAL)
+        try:
+            await hit_counter.flush()
+        except Exception as e:
+            print(f"⚠️ Hit counter flush failed: {e}")
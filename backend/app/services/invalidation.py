@@ -0,0 +1,139 @@
+import json
+
+from sqlalchemy import column, select, table as table_clause
+
+from app.core.config import settings
+from app.core.database import db_session, run_in_db_thread
+from app.services import metrics
+from app.services.cache import cache_backend
+from app.services.cache_backend import query_hash_from_key, template_tag
+from app.services.local_cache import broadcast_invalidation
+from app.services.predicates import can_skip, parse_where, where_clause, write_predicates
+from app.services.sql_parser import extract_tables, get_query_type
+from app.services.tracing import span
+
+
+def _count_invalidation(labels: list[str], invalidated_count: int):
+    for label in labels:
+        metrics.invalidations.inc(label)
+    metrics.invalidated_keys.inc(amount=invalidated_count)
+
+
+async def _invalidate_tags(tags: list[str]) -> int:
+    with span("unlink"):
+        invalidated_count = await cache_backend.invalidate_tags(tags)
+    with span("broadcast"):
+        await broadcast_invalidation(tags=tags)
+    return invalidated_count
+
+
+async def invalidate_tables(tables: list[str]) -> int:
+    """Drop every cached query that depends on any of the tables."""
+    invalidated_count = await _invalidate_tags(tables)
+    _count_invalidation(tables, invalidated_count)
+    return invalidated_count
+
+
+async def invalidate_template(template_hash: str) -> int:
+    """Drop every cached result of one query template, whatever its bind values."""
+    invalidated_count = await _invalidate_tags([template_tag(template_hash)])
+    _count_invalidation(["template"], invalidated_count)
+    return invalidated_count
+
+
+def _row_filter(rows, predicates: dict) -> list:
+    conditions = []
+    for name, constraint in predicates.items():
+        value = rows.c[name]
+        if "eq" in constraint:
+            conditions.append(value.in_(constraint["eq"]))
+            continue
+        low, low_inclusive, high, high_inclusive = constraint["range"]
+        if low is not None:
+            conditions.append(value >= low if low_inclusive else value > low)
+        if high is not None:
+            conditions.append(value <= high if high_inclusive else value < high)
+    return conditions
+
+
+def _lookup_row_values(table: str, where: dict, columns: list[str], limit: int) -> dict | None:
+    """Values of `columns` on the rows an UPDATE touched, or None if there are too many.
+
+    The rows are selected by the write's parsed predicates, with bound values,
+    rather than by its WHERE text.
+    """
+    rows = table_clause(table, *(column(name) for name in sorted({*where, *columns})))
+    query = select(*(rows.c[name] for name in columns)).distinct().where(*_row_filter(rows, where))
+    with db_session() as db:
+        rows = db.execute(query.limit(limit + 1)).all()
+
+    if len(rows) > limit:
+        return None
+    return {column: {"eq": [row[i] for row in rows]} for i, column in enumerate(columns)}
+
+
+async def invalidate_write(sql: str) -> tuple[list[str], int, int]:
+    """Invalidate what a write can affect.
+
+    Returns (tables, keys invalidated, keys kept). Falls back to table-level
+    invalidation whenever the write's row set cannot be described.
+    """
+    tables = extract_tables(sql)
+    # First, so fills that read the tables before the write cannot store
+    # their results after the keys below are gone.
+    with span("bump_versions"):
+        await cache_backend.bump_versions(tables)
+
+    write = write_predicates(sql) if settings.PREDICATE_INVALIDATION else None
+    if write is None:
+        return tables, await invalidate_tables(tables), 0
+
+    table, predicates, set_columns = write
+    with span("dependents"):
+        members, stored_predicates = await cache_backend.get_dependents(table)
+    cached_predicates = {key: json.loads(value) for key, value in stored_predicates.items()}
+
+    undecided = [
+        key for key in members
+        if key in cached_predicates and not can_skip(cached_predicates[key], predicates, set_columns)
+    ]
+
+    # Read back the updated rows to learn the values of the columns cached
+    # queries filter on. Only safe when every WHERE condition was parsed, so
+    # the predicates select the same rows, and the SET leaves those columns
+    # alone, so they still select the rows that were written.
+    where = None
+    if undecided and get_query_type(sql) == "UPDATE" and settings.PREDICATE_ROW_LOOKUP_LIMIT > 0:
+        where = parse_where(where_clause(sql), complete=True)
+    if where and not any(column in where for column in set_columns):
+        columns = sorted({
+            column for key in undecided for column in cached_predicates[key]
+            if column not in set_columns
+        })
+        row_values = None
+        if columns:
+            try:
+                with span("row_lookup"):
+                    row_values = await run_in_db_thread(
+                        _lookup_row_values, table, where, columns, settings.PREDICATE_ROW_LOOKUP_LIMIT
+                    )
+            except Exception as e:
+                # An unknown column, say: nothing is known about the rows.
+                print(f"⚠️ Row lookup failed, invalidating {table}: {e}")
+                return tables, await invalidate_tables(tables), 0
+        if row_values is not None:
+            predicates = {**predicates, **row_values}
+            undecided = [
+                key for key in undecided
+                if not can_skip(cached_predicates[key], predicates, set_columns)
+            ]
+
+    undecided = set(undecided)
+    affected = [key for key in members if key not in cached_predicates or key in undecided]
+
+    with span("unlink"):
+        invalidated_count = await cache_backend.unlink_dependents(table, affected)
+    with span("broadcast"):
+        await broadcast_invalidation(keys=[query_hash_from_key(key) for key in affected])
+    _count_invalidation([table], invalidated_count)
+    return tables, invalidated_count, len(members) - len(affected)
@@ -0,0 +1,132 @@
+import asyncio
+import json
+import time
+from collections import OrderedDict
+
+from app.core.config import settings
+from app.services.cache import cache_backend
+
+
+INVALIDATION_CHANNEL = f"{settings.CACHE_KEY_PREFIX}invalidations"
+
+
+class LocalCache:
+    """Per-worker LRU of serialized query results, sitting in front of the cache backend.
+
+    Entries are stored as bytes and bounded both by count and total size.
+    Other workers are kept coherent through the backend's invalidation channel.
+    """
+
+    def __init__(self, enabled: bool, max_entries: int, max_bytes: int):
+        self.enabled = enabled
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries: OrderedDict[str, tuple[bytes, float, tuple[str, ...]]] = OrderedDict()
+        self._tags: dict[str, set[str]] = {}
+        self._size_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: str) -> bytes | None:
+        if not self.enabled:
+            return None
+
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        value, expires_at, _ = entry
+        if expires_at <= time.monotonic():
+            self._remove(key)
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: str, value: bytes, ttl: float, tags: list[str] = ()):
+        if not self.enabled or ttl <= 0 or len(value) > self.max_bytes:
+            return
+
+        self._remove(key)
+        self._entries[key] = (value, time.monotonic() + ttl, tuple(tags))
+        self._size_bytes += len(value)
+        for tag in tags:
+            self._tags.setdefault(tag, set()).add(key)
+
+        while len(self._entries) > self.max_entries or self._size_bytes > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.evictions += 1
+
+    def delete(self, key: str):
+        self._remove(key)
+
+    def clear(self):
+        self._entries.clear()
+        self._tags.clear()
+        self._size_bytes = 0
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "entries": len(self._entries),
+            "size_bytes": self._size_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+    def _remove(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+
+        value, _, tags = entry
+        self._size_bytes -= len(value)
+        for tag in tags:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+    def apply_invalidation(self, message: dict):
+        if message.get("all"):
+            self.clear()
+        for key in message.get("keys", []):
+            self._remove(key)
+        for tag in message.get("tags", []):
+            for key in list(self._tags.get(tag, ())):
+                self._remove(key)
+
+
+local_cache = LocalCache(
+    enabled=settings.L1_CACHE_ENABLED,
+    max_entries=settings.L1_CACHE_MAX_ENTRIES,
+    max_bytes=settings.L1_CACHE_MAX_BYTES,
+)
+
+
+async def broadcast_invalidation(keys: list[str] = (), tags: list[str] = (), all_keys: bool = False):
+    """Drop entries locally and tell every other worker to do the same."""
+    if not local_cache.enabled:
+        return
+
+    message = {"all": True} if all_keys else {"keys": list(keys), "tags": list(tags)}
+    local_cache.apply_invalidation(message)
+    await cache_backend.publish(INVALIDATION_CHANNEL, json.dumps(message))
+
+
+async def listen_for_invalidations():
+    while True:
+        try:
+            async for message in cache_backend.listen(INVALIDATION_CHANNEL):
+                local_cache.apply_invalidation(json.loads(message))
+        except Exception:
+            # Invalidations may have been missed while disconnected.
+            local_cache.clear()
+            await asyncio.sleep(1)
@@ -0,0 +1,211 @@
+"""
+Cache backend in this process's memory, for a single worker without Redis.
+
+Nothing is shared between workers or kept across restarts. Every method
+runs to completion on the event loop without awaiting, so each is atomic
+the way a Redis script is. CACHE_BYTE_BUDGET bounds the memory it takes;
+entries are kept in least-recently-used order for eviction.
+"""
+import asyncio
+import time
+import uuid
+
+from app.core.config import settings
+from app.services.cache_backend import CacheBackend, entry_key, query_hash_from_key, template_tag
+
+
+class MemoryBackend(CacheBackend):
+    def __init__(self):
+        # query hash -> (value, expires at), least recently used first;
+        # tag -> query hashes; tag -> {query hash: predicates JSON}
+        self._entries: dict[str, tuple[bytes, float]] = {}
+        self._tags: dict[str, set[str]] = {}
+        self._predicates: dict[str, dict[str, str]] = {}
+        self._versions: dict[str, int] = {}
+        self._fills: dict[str, tuple[int, float]] = {}
+        self._locks: dict[str, tuple[str, float]] = {}
+        self._bytes = 0
+        self._evictions = 0
+
+    def _live(self, key: str) -> bytes | None:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[1] <= time.monotonic():
+            self._remove(key)
+            return None
+        # Move to the most recently used end.
+        self._entries[key] = self._entries.pop(key)
+        return entry[0]
+
+    def _remove(self, key: str) -> bool:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return False
+        self._bytes -= len(entry[0])
+        return True
+
+    def _locked(self, key: str) -> bool:
+        lock = self._locks.get(key)
+        return lock is not None and lock[1] > time.monotonic()
+
+    async def get(self, key: str) -> bytes | None:
+        return self._live(key)
+
+    async def get_with_ttl(self, key: str) -> tuple[bytes | None, int]:
+        value = self._live(key)
+        if value is None:
+            return None, -2
+        return value, int(self._entries[key][1] - time.monotonic())
+
+    async def mget(self, keys: list[str]) -> list[bytes | None]:
+        return [self._live(key) for key in keys]
+
+    async def set_many(self, items: list[dict]) -> list[str]:
+        stored = []
+        for item in items:
+            versions = item.get("versions") or {}
+            if any(self._versions.get(table, 0) != version for table, version in versions.items()):
+                continue
+
+            key, value = item["key"], item["value"]
+            self._remove(key)
+            self._entries[key] = (value, time.monotonic() + item.get("ttl", settings.CACHE_HARD_TTL))
+            self._bytes += len(value)
+
+            tables = list(item.get("tags", ()))
+            tags = tables + ([template_tag(item["template"])] if item.get("template") else [])
+            for tag in tags:
+                self._tags.setdefault(tag, set()).add(key)
+            if item.get("predicates"):
+                for table in tables:
+                    self._predicates.setdefault(table, {})[key] = item["predicates"]
+            stored.append(key)
+        return stored
+
+    async def delete(self, key: str):
+        self._remove(key)
+
+    async def scan(self, batch_size: int):
+        keys = list(self._entries)
+        for start in range(0, len(keys), batch_size):
+            for key in keys[start:start + batch_size]:
+                if self._live(key) is not None:
+                    yield key
+            await asyncio.sleep(0)
+
+    async def table_versions(self, tables: list[str], key: str) -> dict[str, int]:
+        return {table: self._versions.get(table, 0) for table in tables}
+
+    async def bump_versions(self, tables: list[str]):
+        for table in tables:
+            self._versions[table] = self._versions.get(table, 0) + 1
+
+    async def invalidate_tags(self, tags: list[str]) -> int:
+        removed = 0
+        for tag in tags:
+            for key in self._tags.pop(tag, ()):
+                removed += self._remove(key)
+            self._predicates.pop(tag, None)
+        return removed
+
+    async def get_dependents(self, tag: str) -> tuple[list[str], dict[str, str]]:
+        members = [entry_key(key) for key in self._tags.get(tag, ())]
+        predicates = {entry_key(key): value for key, value in self._predicates.get(tag, {}).items()}
+        return members, predicates
+
+    async def unlink_dependents(self, tag: str, keys: list[str]) -> int:
+        removed = 0
+        members = self._tags.get(tag, set())
+        predicates = self._predicates.get(tag, {})
+        for key in map(query_hash_from_key, keys):
+            removed += self._remove(key)
+            members.discard(key)
+            predicates.pop(key, None)
+        return removed
+
+    async def cached_bytes(self) -> int:
+        return self._bytes
+
+    async def record_fill(self, query_hash: str, window: int) -> tuple[int, int]:
+        now = time.monotonic()
+        misses, expires_at = self._fills.get(query_hash, (0, 0.0))
+        if expires_at <= now:
+            misses, expires_at = 0, now + window
+        self._fills[query_hash] = (misses + 1, expires_at)
+        return misses + 1, self._bytes
+
+    async def reconcile_bytes(self, batch_size: int) -> int:
+        """Drop expired entries, fill counts and locks, and the tag members
+        they leave behind; the byte total itself is always exact here."""
+        now = time.monotonic()
+        for key in [key for key, (_, expires_at) in self._entries.items() if expires_at <= now]:
+            self._remove(key)
+        for tag in list(self._tags):
+            self._tags[tag] = {key for key in self._tags[tag] if key in self._entries}
+            if not self._tags[tag]:
+                del self._tags[tag]
+        for tag in list(self._predicates):
+            self._predicates[tag] = {
+                key: value for key, value in self._predicates[tag].items() if key in self._entries
+            }
+            if not self._predicates[tag]:
+                del self._predicates[tag]
+        self._fills = {key: fill for key, fill in self._fills.items() if fill[1] > now}
+        self._locks = {key: lock for key, lock in self._locks.items() if lock[1] > now}
+        return self._bytes
+
+    async def evict(self, nbytes: int) -> int:
+        freed = 0
+        for key in list(self._entries):
+            if freed >= nbytes:
+                break
+            freed += len(self._entries[key][0])
+            self._remove(key)
+            self._evictions += 1
+        return freed
+
+    async def clear_namespace(self, batch_size: int, on_progress=None) -> int:
+        # Versions are kept, so fills that read a table before a write stay stale.
+        stores = (self._entries, self._tags, self._predicates, self._fills, self._locks)
+        deleted = sum(len(store) for store in stores)
+        for store in stores:
+            store.clear()
+        self._bytes = 0
+        if on_progress:
+            on_progress(deleted)
+        return deleted
+
+    async def acquire_lock(self, key: str, ttl_ms: int) -> str | None:
+        if self._locked(key):
+            return None
+        token = uuid.uuid4().hex
+        self._locks[key] = (token, time.monotonic() + ttl_ms / 1000)
+        return token
+
+    async def release_lock(self, key: str, token: str):
+        lock = self._locks.get(key)
+        if lock is not None and lock[0] == token:
+            del self._locks[key]
+
+    async def wait_for(self, key: str, timeout: float, interval: float) -> bytes | None:
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while loop.time() < deadline:
+            await asyncio.sleep(interval)
+            value = self._live(key)
+            if value is not None:
+                return value
+            if not self._locked(key):
+                # The filling request gave up without storing anything.
+                return None
+        return None
+
+    async def evicted_keys(self) -> int:
+        return self._evictions
+
+    async def ping(self) -> bool:
+        return True
+
+    async def close(self):
+        pass
@@ -0,0 +1,118 @@
+"""
+In-process metrics, served by /metrics in the Prometheus text format.
+
+Counters and histograms are plain dicts keyed by label values and are only
+updated from the event loop, so an update is a dict lookup and an add with
+no lock. A scrape formats what is already in memory; nothing is queried.
+"""
+from bisect import bisect_left
+
+
+# Seconds: from a sub-millisecond Redis round trip to a multi-second scan.
+LATENCY_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: tuple[str, ...], values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value: float) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labels: tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = labels
+        self.values: dict[tuple, float] = {}
+
+    def inc(self, *labels, amount: float = 1):
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        for labels, value in sorted(self.values.items()):
+            lines.append(f"{self.name}{_labels(self.label_names, labels)} {_number(value)}")
+        return lines
+
+
+class Histogram:
+    """Per-bucket counts plus a sum; buckets are made cumulative when rendered."""
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labels: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = LATENCY_BUCKETS,
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = labels
+        self.buckets = buckets
+        # label values -> [count per bucket..., count above the last bucket, sum]
+        self.series: dict[tuple, list] = {}
+
+    def observe(self, seconds: float, *labels):
+        series = self.series.get(labels)
+        if series is None:
+            series = self.series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+        series[bisect_left(self.buckets, seconds)] += 1
+        series[-1] += seconds
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        for labels, series in sorted(self.series.items()):
+            cumulative = 0
+            for bound, count in zip((*self.buckets, "+Inf"), series):
+                cumulative += count
+                le = f'le="{bound}"'
+                lines.append(f"{self.name}_bucket{_labels(self.label_names, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.label_names, labels)} {_number(series[-1])}")
+            lines.append(f"{self.name}_count{_labels(self.label_names, labels)} {cumulative}")
+        return lines
+
+
+cache_hits = Counter("querycache_cache_hits_total", "Queries answered from the cache.", ("layer", "table"))
+cache_misses = Counter("querycache_cache_misses_total", "Queries not found in the cache.", ("table",))
+cache_fills = Counter("querycache_cache_fills_total", "Database results stored in the cache.", ("table",))
+cache_not_cached = Counter(
+    "querycache_cache_not_cached_total", "Database results not stored, by reason.", ("reason",)
+)
+invalidations = Counter(
+    "querycache_invalidations_total", "Invalidations, by table (or template).", ("table",)
+)
+invalidated_keys = Counter("querycache_invalidated_keys_total", "Cache entries removed by invalidations.")
+
+redis_latency = Histogram("querycache_redis_seconds", "Cache backend command latency.", ("operation",))
+db_execution = Histogram("querycache_db_execution_seconds", "Database time of cache fills.", ("table",))
+serialization = Histogram(
+    "querycache_serialization_seconds", "Time spent encoding results and responses.", ("source", "table")
+)
+request_duration = Histogram(
+    "querycache_request_seconds", "End-to-end /query request time.", ("source", "table")
+)
+stage_duration = Histogram(
+    "querycache_stage_seconds", "Time per stage of traced requests.", ("endpoint", "stage")
+)
+
+REGISTRY = (
+    cache_hits, cache_misses, cache_fills, cache_not_cached, invalidations, invalidated_keys,
+    redis_latency, db_execution, serialization, request_duration, stage_duration,
+)
+
+
+def render(extra: list[str] = ()) -> str:
+    lines = [line for metric in REGISTRY for line in metric.render()]
+    lines.extend(extra)
+    return "\n".join(lines) + "\n"
@@ -1,9 +1,58 @@
-import re
+import hashlib
+import json
+from typing import NamedTuple
+
+from app.core.config import settings
+from app.services.sql_tokenizer import AUTO_PARAM_PREFIX, analyze_query
+from app.services.tracing import span
+
+
+class QueryKey(NamedTuple):
+    query_hash: str
+    template: str
+    template_hash: str
+    params: dict
 
 
 def normalize_query(sql: str) -> str:
-    sql = sql.lower()
-    sql = sql.strip()
-    sql = re.sub(r"\s+", " ", sql)
-    return sql
+    """Canonical text used for cache keys: no comments, single spaces,
+    lowercase keywords and identifiers, literals untouched."""
+    return analyze_query(sql).normalized
+
+
+def parse_params(params: str | None) -> dict | None:
+    """Decode a `params` request argument; ValueError unless it is a JSON object."""
+    if not params:
+        return None
+    value = json.loads(params)
+    if not isinstance(value, dict):
+        raise ValueError("params must be a JSON object")
+    return value
+
+
+def query_key(sql: str, params: dict | None = None) -> QueryKey:
+    """Template and bind values for a query, and the cache key they form.
+
+    Explicit `params` bind the query's own placeholders (:name). With
+    AUTO_PARAMETERIZE, literals in value positions become :_p1, :_p2, ...
+    so queries differing only in values share a template.
+    """
+    with span("normalize"):
+        parsed = analyze_query(sql)
+    if settings.AUTO_PARAMETERIZE:
+        template = parsed.template
+        bound = {f"{AUTO_PARAM_PREFIX}{i}": value for i, value in enumerate(parsed.params, 1)}
+    else:
+        template = parsed.normalized
+        bound = {}
+    if params:
+        bound.update(params)
+
+    with span("hash"):
+        template_hash = hashlib.md5(template.encode()).hexdigest()
+        if not bound:
+            return QueryKey(template_hash, template, template_hash, bound)
 
+        values = json.dumps(bound, sort_keys=True, separators=(",", ":"), default=str)
+        query_hash = hashlib.md5(f"{template}\n{values}".encode()).hexdigest()
+    return QueryKey(query_hash, template, template_hash, bound)
@@ -0,0 +1,335 @@
+"""
+Row-level predicates for cached SELECTs and for the writes that invalidate them.
+
+Only simple single-table statements get predicates: a top-level AND of
+`col = literal`, `col IN (...)`, `col <,<=,>,>= number` and `col BETWEEN a AND b`.
+Anything else is either ignored (an unrecognised AND-ed condition only makes
+the row set look bigger) or, for OR, subqueries and joins, means "unknown" and
+falls back to table-level invalidation.
+
+Statements are parsed in the tokenizer's canonical form, so comments cannot
+hide or invent conditions. Upserts (INSERT OR REPLACE, REPLACE, ON CONFLICT
+DO UPDATE, ON DUPLICATE KEY UPDATE) can rewrite existing rows and are unknown.
+
+A predicate is a JSON-friendly dict: {column: {"eq": [values]}} or
+{column: {"range": [low, low_inclusive, high, high_inclusive]}}.
+"""
+import re
+
+from app.services.sql_parser import extract_tables, get_query_type
+from app.services.sql_tokenizer import analyze_query
+
+
+IDENTIFIER = r'(?:[a-z_][a-z0-9_]*\.)?([a-z_][a-z0-9_]*)'
+# The canonical form spaces a sign from its number: `- 1`.
+LITERAL = r"(-?\s*\d+(?:\.\d+)?|'(?:[^']|'')*')"
+
+EQ_PATTERN = re.compile(rf'^{IDENTIFIER}\s*==?\s*{LITERAL}$', re.IGNORECASE)
+IN_PATTERN = re.compile(rf'^{IDENTIFIER}\s+in\s*\((.*)\)$', re.IGNORECASE | re.DOTALL)
+COMPARE_PATTERN = re.compile(rf'^{IDENTIFIER}\s*(<=|>=|<|>)\s*{LITERAL}$', re.IGNORECASE)
+BETWEEN_PATTERN = re.compile(rf'^{IDENTIFIER}\s+between\s+{LITERAL}\s+and\s+{LITERAL}$', re.IGNORECASE)
+
+UPSERT = re.compile(
+    r'^replace\b|^insert\s+or\s+replace\b|\bon\s+conflict\b.*\bdo\s+update\b|\bon\s+duplicate\s+key\s+update\b',
+    re.IGNORECASE | re.DOTALL,
+)
+
+CLAUSE_END = re.compile(r'\b(group\s+by|order\s+by|having|limit|offset|returning|window)\b', re.IGNORECASE)
+
+
+def _parse_literal(text: str):
+    if text.startswith("'"):
+        return text[1:-1].replace("''", "'")
+    text = text.replace(" ", "")
+    return float(text) if "." in text else int(text)
+
+
+def _without_comments(sql: str) -> str:
+    return analyze_query(sql).normalized
+
+
+def _split_top_level(text: str, separator: str) -> list[str] | None:
+    """Split on a keyword or comma outside parentheses and quotes.
+
+    Returns None if the text cannot be split safely (unbalanced quotes/parens).
+    BETWEEN's own AND is kept with its conjunct.
+    """
+    parts = []
+    depth = 0
+    start = 0
+    i = 0
+    pending_between = False
+    lowered = text.lower()
+
+    while i < len(text):
+        char = text[i]
+        if char == "'":
+            end = i + 1
+            while True:
+                end = text.find("'", end)
+                if end == -1:
+                    return None
+                if end + 1 < len(text) and text[end + 1] == "'":
+                    end += 2
+                    continue
+                break
+            i = end + 1
+            continue
+        if char == "(":
+            depth += 1
+        elif char == ")":
+            depth -= 1
+            if depth < 0:
+                return None
+        elif depth == 0:
+            if separator == "," and char == ",":
+                parts.append(text[start:i])
+                start = i + 1
+            elif separator != "," and re.match(rf'\b{separator}\b', lowered[i:]) and (i == 0 or not lowered[i - 1].isalnum() and lowered[i - 1] != "_"):
+                if separator == "and" and pending_between:
+                    pending_between = False
+                else:
+                    parts.append(text[start:i])
+                    start = i + len(separator)
+                i += len(separator)
+                continue
+            elif re.match(r'between\b', lowered[i:]) and (i == 0 or not lowered[i - 1].isalnum()):
+                pending_between = True
+        i += 1
+
+    if depth != 0:
+        return None
+    parts.append(text[start:])
+    return [part.strip() for part in parts]
+
+
+def where_clause(sql: str) -> str | None:
+    sql = _without_comments(sql)
+    match = re.search(r'\bwhere\b', sql, re.IGNORECASE)
+    if not match:
+        return None
+    clause = sql[match.end():].strip().rstrip(";")
+    end = CLAUSE_END.search(clause)
+    return clause[:end.start()] if end else clause
+
+
+def _parse_condition(condition: str):
+    match = EQ_PATTERN.match(condition)
+    if match:
+        return match.group(1).lower(), {"eq": [_parse_literal(match.group(2))]}
+
+    match = IN_PATTERN.match(condition)
+    if match:
+        items = _split_top_level(match.group(2), ",")
+        if items and all(re.fullmatch(LITERAL, item) for item in items):
+            return match.group(1).lower(), {"eq": [_parse_literal(item) for item in items]}
+        return None
+
+    match = BETWEEN_PATTERN.match(condition)
+    if match:
+        low, high = _parse_literal(match.group(2)), _parse_literal(match.group(3))
+        if isinstance(low, str) or isinstance(high, str):
+            return None
+        return match.group(1).lower(), {"range": [low, True, high, True]}
+
+    match = COMPARE_PATTERN.match(condition)
+    if match:
+        value = _parse_literal(match.group(3))
+        if isinstance(value, str):
+            return None
+        operator = match.group(2)
+        if operator.startswith("<"):
+            bounds = [None, False, value, operator == "<="]
+        else:
+            bounds = [value, operator == ">=", None, False]
+        return match.group(1).lower(), {"range": bounds}
+
+    return None
+
+
+def _intersect(a: dict, b: dict) -> dict | None:
+    """Combine two constraints on the same column (both must hold)."""
+    if "eq" in a and "eq" in b:
+        return {"eq": [value for value in a["eq"] if any(_same(value, other) for other in b["eq"])]}
+    if "eq" in a or "eq" in b:
+        eq, other = (a, b) if "eq" in a else (b, a)
+        return {"eq": [value for value in eq["eq"] if not _outside(value, other["range"])]}
+    return None
+
+
+def parse_where(where: str | None, complete: bool = False) -> dict | None:
+    """Predicates for a WHERE clause; {} means "every row", None means unknown.
+
+    With `complete`, a condition that is not recognised makes the result
+    unknown too, so the predicates select exactly the rows the WHERE does.
+    """
+    if where is None:
+        return {}
+
+    conditions = _split_top_level(where, "and")
+    if conditions is None:
+        return None
+    if any(_split_top_level(condition, "or") != [condition] for condition in conditions):
+        # A top-level OR can widen the row set beyond any single conjunct.
+        return None
+
+    predicates = {}
+    for condition in conditions:
+        parsed = _parse_condition(condition)
+        if parsed is None:
+            if complete:
+                return None
+            continue
+        column, constraint = parsed
+        if column in predicates:
+            combined = _intersect(predicates[column], constraint)
+            if combined is None:
+                if complete:
+                    return None
+                continue
+            constraint = combined
+        predicates[column] = constraint
+    return predicates
+
+
+def _single_table(sql: str) -> str | None:
+    tables = extract_tables(sql)
+    if len(tables) != 1:
+        return None
+    # Subqueries can reference the same table under another alias.
+    if len(re.findall(r'\bselect\b', sql, re.IGNORECASE)) > (1 if get_query_type(sql) == "SELECT" else 0):
+        return None
+    return tables[0]
+
+
+def select_predicates(sql: str) -> dict | None:
+    """Predicates describing which rows a cached SELECT depends on."""
+    sql = _without_comments(sql)
+    if _single_table(sql) is None:
+        return None
+    if re.search(r'\b(join|union|intersect|except)\b', sql, re.IGNORECASE):
+        return None
+    return parse_where(where_clause(sql)) or None
+
+
+def _set_columns(sql: str) -> list[str] | None:
+    match = re.search(r'\bset\b(.*?)(?:\bwhere\b|$)', sql, re.IGNORECASE | re.DOTALL)
+    if not match:
+        return None
+    assignments = _split_top_level(match.group(1).strip().rstrip(";"), ",")
+    if not assignments:
+        return None
+
+    columns = []
+    for assignment in assignments:
+        column = re.match(rf'^{IDENTIFIER}\s*=', assignment, re.IGNORECASE)
+        if not column:
+            return None
+        columns.append(column.group(1).lower())
+    return columns
+
+
+def _insert_predicates(sql: str) -> dict | None:
+    match = re.search(r'\binto\s+\S+\s*\(([^)]*)\)\s*values\s*(.*)$', sql, re.IGNORECASE | re.DOTALL)
+    if not match:
+        return None
+
+    columns = [column.strip().strip('"').lower() for column in match.group(1).split(",")]
+    rows = _split_top_level(match.group(2).strip().rstrip(";"), ",")
+    if not rows:
+        return None
+
+    predicates = {column: {"eq": []} for column in columns}
+    for row in rows:
+        if not (row.startswith("(") and row.endswith(")")):
+            return None
+        values = _split_top_level(row[1:-1], ",")
+        if values is None or len(values) != len(columns):
+            return None
+        for column, value in zip(columns, values):
+            if re.fullmatch(LITERAL, value):
+                predicates[column]["eq"].append(_parse_literal(value))
+            else:
+                # A non-literal value could be anything.
+                predicates[column] = None
+
+    return {column: constraint for column, constraint in predicates.items() if constraint}
+
+
+def write_predicates(sql: str) -> tuple[str, dict, list[str]] | None:
+    """(table, predicates, columns changed by SET) for a write, or None if unknown."""
+    sql = _without_comments(sql)
+    table = _single_table(sql)
+    if table is None:
+        return None
+
+    query_type = get_query_type(sql)
+    if query_type not in ("INSERT", "UPDATE", "DELETE") or UPSERT.search(sql):
+        return None
+    if query_type == "INSERT":
+        predicates = _insert_predicates(sql)
+        return (table, predicates, []) if predicates else None
+
+    predicates = parse_where(where_clause(sql))
+    if not predicates:
+        return None
+
+    if query_type == "UPDATE":
+        set_columns = _set_columns(sql)
+        if set_columns is None:
+            return None
+        return table, predicates, set_columns
+
+    return table, predicates, []
+
+
+def _same(a, b) -> bool:
+    if isinstance(a, str) != isinstance(b, str):
+        # Mixed types may still compare equal after the database coerces them.
+        return True
+    if isinstance(a, str):
+        # Case-insensitive, so NOCASE collations are still treated conservatively.
+        return a.casefold() == b.casefold()
+    return a == b
+
+
+def _outside(value, bounds: list) -> bool:
+    if not isinstance(value, (int, float)):
+        return False
+    low, low_inclusive, high, high_inclusive = bounds
+    if low is not None and (value < low or (value == low and not low_inclusive)):
+        return True
+    if high is not None and (value > high or (value == high and not high_inclusive)):
+        return True
+    return False
+
+
+def _disjoint(a: dict, b: dict) -> bool:
+    if "eq" in a and "eq" in b:
+        return not any(_same(x, y) for x in a["eq"] for y in b["eq"])
+    if "eq" in a or "eq" in b:
+        eq, other = (a, b) if "eq" in a else (b, a)
+        return all(_outside(value, other["range"]) for value in eq["eq"])
+
+    a_low, a_low_inc, a_high, a_high_inc = a["range"]
+    b_low, b_low_inc, b_high, b_high_inc = b["range"]
+    if a_high is not None and b_low is not None:
+        if a_high < b_low or (a_high == b_low and not (a_high_inc and b_low_inc)):
+            return True
+    if b_high is not None and a_low is not None:
+        if b_high < a_low or (b_high == a_low and not (b_high_inc and a_low_inc)):
+            return True
+    return False
+
+
+def can_skip(cached: dict, write: dict, set_columns: list[str]) -> bool:
+    """True only if the write provably cannot change the cached result.
+
+    Needs a column constrained by both sides with disjoint constraints that the
+    write does not modify: rows the write touches are outside the cached set
+    before the write and, since that column is unchanged, after it too.
+    """
+    for column, constraint in cached.items():
+        if column in write and column not in set_columns and _disjoint(constraint, write[column]):
+            return True
+    return False
@@ -0,0 +1,163 @@
+"""
+/stats figures kept up to date as queries are recorded and hit, so serving
+them reads memory instead of aggregating query_cache.
+
+Totals are loaded from the database once, then moved by this worker's own
+events. Other workers' hits reach them when the totals are reloaded, every
+STATS_RESYNC_INTERVAL seconds. The top queries are kept with the
+Space-Saving algorithm: STATS_TOP_CAPACITY counters, where a query that
+displaces the least-hit one inherits its count. A count can overstate a
+query's hits by at most the smallest tracked count, so the top few of a
+skewed workload are exact in practice. Hit rates are per worker.
+"""
+import asyncio
+import threading
+import time
+
+from sqlalchemy import func
+
+from app.core.config import settings
+from app.core.database import db_session, run_in_db_thread
+from app.core.models import QueryCache
+
+
+class Window:
+    """Hits and misses over the last `span` seconds, in `buckets` slots.
+
+    Counts leave the window a slot at a time, so the total covers between
+    span - span/buckets and span seconds.
+    """
+
+    def __init__(self, span: float, buckets: int):
+        self.width = span / buckets
+        # slot -> [period it counts, hits, misses]
+        self._slots = [[-1, 0, 0] for _ in range(buckets)]
+
+    def record(self, hit: bool, now: float):
+        period = int(now // self.width)
+        slot = self._slots[period % len(self._slots)]
+        if slot[0] != period:
+            slot[:] = [period, 0, 0]
+        slot[1 if hit else 2] += 1
+
+    def totals(self, now: float) -> dict:
+        oldest = int(now // self.width) - len(self._slots) + 1
+        hits = sum(slot[1] for slot in self._slots if slot[0] >= oldest)
+        misses = sum(slot[2] for slot in self._slots if slot[0] >= oldest)
+        requests = hits + misses
+        return {
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": round(hits / requests, 4) if requests else None,
+        }
+
+
+class QueryStats:
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        # Queries are recorded from DB threads, hits from the event loop.
+        self._lock = threading.Lock()
+        self.total_queries = 0
+        self.total_hits = 0
+        # query hash -> hits, and (query, cached at) where known
+        self._counts: dict[str, int] = {}
+        self._queries: dict[str, tuple[str, object]] = {}
+        self.windows = {"last_minute": Window(60, 60), "last_hour": Window(3600, 60)}
+
+    def _count(self, query_hash: str, hits: int):
+        if query_hash in self._counts or len(self._counts) < self.capacity:
+            self._counts[query_hash] = self._counts.get(query_hash, 0) + hits
+            return
+        # Space-Saving: replace the least-hit query; O(capacity), and only
+        # for queries that are not tracked already.
+        least = min(self._counts, key=self._counts.get)
+        floor = self._counts.pop(least)
+        self._queries.pop(least, None)
+        self._counts[query_hash] = floor + hits
+
+    def record_query(self, query_hash: str, query: str, cached_at):
+        with self._lock:
+            self.total_queries += 1
+            if len(self._counts) < self.capacity:
+                self._counts.setdefault(query_hash, 0)
+            if query_hash in self._counts:
+                self._queries[query_hash] = (query, cached_at)
+
+    def record_hit(self, query_hash: str):
+        with self._lock:
+            self.total_hits += 1
+            self._count(query_hash, 1)
+            now = time.time()
+            for window in self.windows.values():
+                window.record(True, now)
+
+    def record_miss(self):
+        with self._lock:
+            now = time.time()
+            for window in self.windows.values():
+                window.record(False, now)
+
+    def describe(self, query_hash: str, query: str, cached_at):
+        with self._lock:
+            if query_hash in self._counts:
+                self._queries[query_hash] = (query, cached_at)
+
+    def top(self, k: int) -> list[tuple[str, int, tuple | None]]:
+        """The k most-hit queries as (hash, hits, (query, cached at) or None)."""
+        with self._lock:
+            ranked = sorted(self._counts.items(), key=lambda item: item[1], reverse=True)[:k]
+            return [(query_hash, hits, self._queries.get(query_hash)) for query_hash, hits in ranked]
+
+    def window_totals(self) -> dict:
+        now = time.time()
+        with self._lock:
+            return {name: window.totals(now) for name, window in self.windows.items()}
+
+    def reset(self):
+        """query_cache was emptied."""
+        with self._lock:
+            self.total_queries = 0
+            self.total_hits = 0
+            self._counts.clear()
+            self._queries.clear()
+
+    def replace(self, total_queries: int, total_hits: int, top: list, pending: dict[str, int]):
+        """Start over from the database's figures plus hits not flushed to it yet."""
+        with self._lock:
+            self.total_queries = total_queries
+            self.total_hits = total_hits + sum(pending.values())
+            self._counts = {query_hash: hits for query_hash, hits, _, _ in top}
+            self._queries = {query_hash: (query, cached_at) for query_hash, _, query, cached_at in top}
+            for query_hash, hits in pending.items():
+                self._count(query_hash, hits)
+
+
+query_stats = QueryStats(capacity=settings.STATS_TOP_CAPACITY)
+
+
+def _load_totals(capacity: int):
+    with db_session() as db:
+        total_queries = db.query(func.count(QueryCache.id)).scalar()
+        total_hits = db.query(func.sum(QueryCache.hits)).scalar() or 0
+        # Walks the hits index; no sort of the table.
+        top = db.query(
+            QueryCache.query_hash, QueryCache.hits, QueryCache.original_query, QueryCache.created_at
+        ).order_by(QueryCache.hits.desc()).limit(capacity).all()
+        return total_queries, int(total_hits), [tuple(row) for row in top]
+
+
+async def load_query_stats():
+    """(Re)load the totals; the one place they are aggregated from the table."""
+    from app.services.hit_counter import hit_counter
+
+    total_queries, total_hits, top = await run_in_db_thread(_load_totals, query_stats.capacity)
+    query_stats.replace(total_queries, total_hits, top, hit_counter.pending())
+
+
+async def resync_query_stats_periodically():
+    while True:
+        await asyncio.sleep(settings.STATS_RESYNC_INTERVAL)
+        try:
+            await load_query_stats()
+        except Exception as e:
+            print(f"⚠️ Query stats reload failed: {e}")
@@ -1,34 +1,712 @@
-import redis
+import asyncio
+import bisect
+import hashlib
 import os
+import random
+import uuid
+
+import redis.asyncio as redis
+from redis.asyncio.cluster import RedisCluster
+
 from app.core.config import settings
+from app.services.cache_backend import CacheBackend, entry_key, query_hash_from_key, template_tag
+
+
+RELEASE_LOCK_SCRIPT = """
+if redis.call("GET", KEYS[1]) == ARGV[1] then
+    return redis.call("DEL", KEYS[1])
+end
+return 0
+"""
+
+# KEYS holds N tag sets, their N predicate hashes and the byte counter.
+# Unlinks every key tagged with any of the tags, then the tags and predicate
+# hashes themselves, and takes the unlinked entries' sizes off the counter.
+# UNLINK frees memory off the main thread; members go in chunks to stay well
+# below Lua's unpack() limit.
+INVALIDATE_TAGS_SCRIPT = """
+local removed = 0
+local freed = 0
+local count = tonumber(ARGV[1])
+for t = 1, count do
+    local members = redis.call("SMEMBERS", KEYS[t])
+    for i = 1, #members do
+        freed = freed + redis.call("STRLEN", members[i])
+    end
+    for i = 1, #members, 1000 do
+        removed = removed + redis.call("UNLINK", unpack(members, i, math.min(i + 999, #members)))
+    end
+    redis.call("UNLINK", KEYS[t], KEYS[count + t])
+end
+if freed > 0 then
+    redis.call("DECRBY", KEYS[2 * count + 1], freed)
+end
+return removed
+"""
+
+# KEYS: the entry, the byte counter, its tag sets, the predicate hashes of the
+# first ARGV[4] tags, then the version keys it was filled under. ARGV: value,
+# ttl, tag count, predicate hash count, predicates JSON, the versions read.
+# Stores nothing (returns 0) if a write bumped a version since; otherwise sets
+# the entry, moves the byte counter by the change in its size and files it
+# under its tags. One script per entry, so it also works in Redis Cluster,
+# where all of an entry's keys share a hash slot.
+STORE_ENTRY_SCRIPT = """
+local tags = tonumber(ARGV[3])
+local predicates = tonumber(ARGV[4])
+local versions = 2 + tags + predicates
+for i = versions + 1, #KEYS do
+    if tonumber(redis.call("GET", KEYS[i]) or "0") ~= tonumber(ARGV[5 + i - versions]) then
+        return 0
+    end
+end
+local previous = redis.call("STRLEN", KEYS[1])
+redis.call("SET", KEYS[1], ARGV[1], "EX", ARGV[2])
+redis.call("INCRBY", KEYS[2], string.len(ARGV[1]) - previous)
+for i = 3, 2 + tags do
+    redis.call("SADD", KEYS[i], KEYS[1])
+    redis.call("EXPIRE", KEYS[i], ARGV[2])
+end
+for i = 3 + tags, versions do
+    redis.call("HSET", KEYS[i], KEYS[1], ARGV[5])
+    redis.call("EXPIRE", KEYS[i], ARGV[2])
+end
+return 1
+"""
+
+# KEYS: the byte counter, then (if ARGV[1] is "1") a tag set and its predicate
+# hash or (if ARGV[1] is "2") the eviction counter, then entries. Unlinks the
+# entries, takes their sizes off the byte counter and drops them from the tag,
+# or adds how many there were to the eviction counter.
+UNLINK_ENTRIES_SCRIPT = """
+local first = 2
+if ARGV[1] == "1" then
+    first = 4
+elseif ARGV[1] == "2" then
+    first = 3
+end
+local freed = 0
+for i = first, #KEYS do
+    freed = freed + redis.call("STRLEN", KEYS[i])
+end
+local removed = redis.call("UNLINK", unpack(KEYS, first, #KEYS))
+if ARGV[1] == "1" then
+    redis.call("SREM", KEYS[2], unpack(KEYS, first, #KEYS))
+    redis.call("HDEL", KEYS[3], unpack(KEYS, first, #KEYS))
+end
+if ARGV[1] == "2" and removed > 0 then
+    redis.call("INCRBY", KEYS[2], removed)
+end
+if freed > 0 then
+    redis.call("DECRBY", KEYS[1], freed)
+end
+return removed
+"""
+
+
+# Everything QueryCache stores lives under one prefix so it can be scanned and
+# flushed without touching other data in the same Redis database. A shard may
+# use its own prefix (Redis Cluster shards add a hash tag to it). Entry keys
+# are built by cache_backend.entry_key, which every backend shares.
+def tag_key(table: str, prefix: str | None = None) -> str:
+    return f"{prefix or settings.CACHE_KEY_PREFIX}tag:{table}"
+
+
+def pred_key(table: str, prefix: str | None = None) -> str:
+    return f"{prefix or settings.CACHE_KEY_PREFIX}pred:{table}"
+
+
+def version_key(table: str, prefix: str | None = None) -> str:
+    return f"{prefix or settings.CACHE_KEY_PREFIX}ver:{table}"
+
+
+def bytes_key(prefix: str | None = None) -> str:
+    """Running total of the bytes held by cached entries."""
+    return f"{prefix or settings.CACHE_KEY_PREFIX}bytes"
+
+
+def evictions_key(prefix: str | None = None) -> str:
+    """Entries evicted to keep the cache under CACHE_BYTE_BUDGET."""
+    return f"{prefix or settings.CACHE_KEY_PREFIX}evictions"
+
+
+def frequency_key(query_hash: str, prefix: str | None = None) -> str:
+    return f"{prefix or settings.CACHE_KEY_PREFIX}freq:{query_hash}"
+
+
+def lock_key(query_hash: str, prefix: str | None = None) -> str:
+    return f"{prefix or settings.CACHE_KEY_PREFIX}lock:{query_hash}"
+
+
+def _connection_pool(decode_responses: bool, url: str | None = None) -> redis.BlockingConnectionPool:
+    redis_url = url or os.getenv('REDIS_URL')
+
+    # The blocking pool makes callers wait for a free connection instead of
+    # failing under bursts.
+    if redis_url:
+        return redis.BlockingConnectionPool.from_url(
+            redis_url,
+            decode_responses=decode_responses,
+            max_connections=settings.REDIS_MAX_CONNECTIONS,
+            timeout=settings.REDIS_POOL_TIMEOUT,
+        )
+
+    return redis.BlockingConnectionPool(
+        host=settings.REDIS_HOST,
+        port=settings.REDIS_PORT,
+        decode_responses=decode_responses,
+        max_connections=settings.REDIS_MAX_CONNECTIONS,
+        timeout=settings.REDIS_POOL_TIMEOUT,
+    )
+
+
+async def _listen(client: redis.Redis, channel: str):
+    pubsub = client.pubsub()
+    try:
+        await pubsub.subscribe(channel)
+        while True:
+            message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+            if message and message["type"] == "message":
+                yield message["data"]
+    finally:
+        await pubsub.aclose()
+
+
+class RedisService(CacheBackend):
+    """The cache on one Redis server (optionally with read replicas), or on one
+    hash slot's worth of keys in a Redis Cluster."""
+
+    def __init__(
+        self,
+        text_client: redis.Redis | RedisCluster,
+        binary_client: redis.Redis | RedisCluster,
+        replicas: list[redis.Redis] = (),
+        prefix: str | None = None,
+    ):
+        # Text for tags, locks and pub/sub, binary for cache entries (encoded
+        # results are not UTF-8). Replicas serve cache reads.
+        self.redis = text_client
+        self.binary = binary_client
+        self.replicas = list(replicas)
+        self.prefix = prefix or settings.CACHE_KEY_PREFIX
+
+        self._release_lock = self.redis.register_script(RELEASE_LOCK_SCRIPT)
+        self._invalidate_tags = self.redis.register_script(INVALIDATE_TAGS_SCRIPT)
+        self._unlink_entries = self.redis.register_script(UNLINK_ENTRIES_SCRIPT)
+        self._store_entry = self.binary.register_script(STORE_ENTRY_SCRIPT)
+
+    @classmethod
+    def from_url(cls, url: str | None = None, replica_urls: list[str] = ()) -> "RedisService":
+        """A standalone server: REDIS_URL / REDIS_HOST:REDIS_PORT unless `url` is given."""
+        # Pools are shared by every request in the worker.
+        return cls(
+            redis.Redis(connection_pool=_connection_pool(decode_responses=True, url=url)),
+            redis.Redis(connection_pool=_connection_pool(decode_responses=False, url=url)),
+            [
+                redis.Redis(connection_pool=_connection_pool(decode_responses=False, url=replica))
+                for replica in replica_urls
+            ],
+        )
+
+    def _reader(self):
+        # Hits may lag the primary by the replication delay.
+        if self.replicas and settings.REDIS_READ_FROM_REPLICAS:
+            return random.choice(self.replicas)
+        return self.binary
+
+    def _store_args(self, item: dict) -> tuple[list[str], list]:
+        ttl = item.get("ttl", settings.CACHE_HARD_TTL)
+        tables = list(item.get("tags", ()))
+        tags = tables + ([template_tag(item["template"])] if item.get("template") else [])
+        predicates = tables if item.get("predicates") else []
+        versions = item.get("versions") or {}
+
+        keys = [
+            entry_key(item["key"], self.prefix), bytes_key(self.prefix),
+            *(tag_key(tag, self.prefix) for tag in tags),
+            *(pred_key(table, self.prefix) for table in predicates),
+            *(version_key(table, self.prefix) for table in versions),
+        ]
+        args = [item["value"], ttl, len(tags), len(predicates), item.get("predicates") or "", *versions.values()]
+        return keys, args
+
+    async def set_many(self, items: list[dict]) -> list[str]:
+        """Store several values; each is stored or dropped atomically on its own.
+
+        Items whose table versions moved on are dropped. Returns the keys stored.
+        """
+        if not items:
+            return []
+        if len(items) == 1:
+            keys, args = self._store_args(items[0])
+            return [items[0]["key"]] if await self._store_entry(keys=keys, args=args) else []
+
+        async with self.binary.pipeline(transaction=False) as pipe:
+            for item in items:
+                keys, args = self._store_args(item)
+                pipe.eval(STORE_ENTRY_SCRIPT, len(keys), *keys, *args)
+            results = await pipe.execute()
+        return [item["key"] for item, stored in zip(items, results) if stored]
+
+    async def table_versions(self, tables: list[str], key: str | None = None) -> dict[str, int]:
+        if not tables:
+            return {}
+        values = await self.redis.mget([version_key(table, self.prefix) for table in tables])
+        return {table: int(value or 0) for table, value in zip(tables, values)}
+
+    async def bump_versions(self, tables: list[str]):
+        if not tables:
+            return
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for table in tables:
+                pipe.incr(version_key(table, self.prefix))
+            await pipe.execute()
+
+    async def invalidate_tags(self, tags: list[str]) -> int:
+        if not tags:
+            return 0
+        keys = (
+            [tag_key(tag, self.prefix) for tag in tags]
+            + [pred_key(tag, self.prefix) for tag in tags]
+            + [bytes_key(self.prefix)]
+        )
+        return await self._invalidate_tags(keys=keys, args=[len(tags)])
+
+    async def get_dependents(self, tag: str) -> tuple[list[str], dict[str, str]]:
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.smembers(tag_key(tag, self.prefix))
+            pipe.hgetall(pred_key(tag, self.prefix))
+            members, predicates = await pipe.execute()
+        return list(members), predicates
+
+    async def unlink_dependents(self, tag: str, keys: list[str]) -> int:
+        removed = 0
+        for start in range(0, len(keys), settings.CACHE_CLEAR_BATCH_SIZE):
+            batch = keys[start:start + settings.CACHE_CLEAR_BATCH_SIZE]
+            removed += await self._unlink_entries(
+                keys=[bytes_key(self.prefix), tag_key(tag, self.prefix), pred_key(tag, self.prefix), *batch],
+                args=["1"],
+            )
+        return removed
+
+    async def get(self, key: str) -> bytes | None:
+        return await self._reader().get(entry_key(key, self.prefix))
+
+    async def mget(self, keys: list[str]) -> list[bytes | None]:
+        if not keys:
+            return []
+        return await self._reader().mget([entry_key(key, self.prefix) for key in keys])
+
+    async def get_with_ttl(self, key: str) -> tuple[bytes | None, int]:
+        async with self._reader().pipeline(transaction=False) as pipe:
+            pipe.get(entry_key(key, self.prefix))
+            pipe.ttl(entry_key(key, self.prefix))
+            value, ttl = await pipe.execute()
+        return value, ttl
+
+    async def delete(self, key: str):
+        await self._unlink_entries(keys=[bytes_key(self.prefix), entry_key(key, self.prefix)], args=["0"])
+
+    async def scan(self, batch_size: int):
+        async for key in self.redis.scan_iter(match=entry_key("*", self.prefix), count=batch_size):
+            yield query_hash_from_key(key)
+
+    async def cached_bytes(self) -> int:
+        """Bytes held by cached entries (see reconcile_bytes for the error bound)."""
+        return max(0, int(await self.redis.get(bytes_key(self.prefix)) or 0))
+
+    async def record_fill(self, query_hash: str, window: int) -> tuple[int, int]:
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.set(frequency_key(query_hash, self.prefix), 0, ex=window, nx=True)
+            pipe.incr(frequency_key(query_hash, self.prefix))
+            pipe.get(bytes_key(self.prefix))
+            _, misses, total = await pipe.execute()
+        return misses, max(0, int(total or 0))
+
+    async def reconcile_bytes(self, batch_size: int) -> int:
+        """Recount the byte total from the entries themselves.
+
+        Sets and invalidations keep the counter current; this corrects for
+        entries Redis expired or evicted on its own. Writes that land while
+        the scan runs can leave it off by their size until the next pass.
+        """
+        total = 0
+        batch = []
+
+        async def measure_batch():
+            nonlocal total
+            async with self.redis.pipeline(transaction=False) as pipe:
+                for key in batch:
+                    pipe.strlen(key)
+                total += sum(await pipe.execute())
+            batch.clear()
+
+        async for key in self.redis.scan_iter(match=entry_key("*", self.prefix), count=batch_size):
+            batch.append(key)
+            if len(batch) >= batch_size:
+                await measure_batch()
 
+        if batch:
+            await measure_batch()
+        await self.redis.set(bytes_key(self.prefix), total)
+        return total
 
-class RedisService:
-    def __init__(self):
+    def _scan_target(self) -> dict:
+        # In Redis Cluster a shard's keys share one hash slot, so one node
+        # holds them all and can be scanned with a plain cursor.
+        if isinstance(self.redis, RedisCluster):
+            return {"target_nodes": self.redis.get_node_from_key(entry_key("", self.prefix))}
+        return {}
 
-        redis_url = os.getenv('REDIS_URL')
+    async def _eviction_sample(self) -> list[tuple[int, str, int]]:
+        """(idle seconds, key, size) for up to CACHE_EVICTION_SAMPLES entries,
+        scanned from a random point in the keyspace."""
+        pattern = entry_key("*", self.prefix)
+        target = self._scan_target()
+        start = random.randrange(max(await self.redis.dbsize(**target), 1))
+        cursor, keys = start, []
+        while len(keys) < settings.CACHE_EVICTION_SAMPLES:
+            cursor, batch = await self.redis.scan(
+                cursor, match=pattern, count=settings.CACHE_EVICTION_SAMPLES, **target
+            )
+            if target:
+                cursor = cursor[target["target_nodes"].name]
+            keys.extend(batch)
+            if cursor == 0:
+                if start == 0:
+                    break
+                # Wrapped around: go over the part before the random start.
+                start = 0
+        keys = list(dict.fromkeys(keys))
+        if not keys:
+            return []
+
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for key in keys:
+                pipe.object("idletime", key)
+                pipe.strlen(key)
+            # OBJECT IDLETIME is refused under an LFU maxmemory-policy.
+            results = await pipe.execute(raise_on_error=False)
+        return [
+            (idle if isinstance(idle, int) else 0, key, size)
+            for key, idle, size in zip(keys, results[::2], results[1::2])
+        ]
 
-        if redis_url:
-            self.redis = redis.from_url(redis_url, decode_responses=True)
-        else:
+    async def evict(self, nbytes: int) -> int:
+        """Approximate LRU, as Redis does it: evict the idlest sampled entries.
 
-            self.redis = redis.Redis(
-                host=settings.REDIS_HOST,
-                port=settings.REDIS_PORT,
-                decode_responses=True,
+        Idle time is tracked by this server; reads served by replicas do not
+        count as use.
+        """
+        freed = 0
+        while freed < nbytes:
+            sample = sorted(await self._eviction_sample(), reverse=True)
+            if not sample:
+                break
+            victims = []
+            for _, key, size in sample:
+                if freed >= nbytes:
+                    break
+                victims.append(key)
+                freed += size
+            await self._unlink_entries(
+                keys=[bytes_key(self.prefix), evictions_key(self.prefix), *victims], args=["2"]
             )
+        return freed
+
+    async def clear_namespace(self, batch_size: int, on_progress=None) -> int:
+        """Remove every QueryCache key with SCAN + pipelined UNLINK.
+
+        SCAN walks the keyspace incrementally and UNLINK frees memory in a
+        background thread, so neither blocks Redis for other clients. Table
+        versions are kept: resetting them would let a fill that read a table
+        before a later write match its version again. So is the eviction
+        count, which /metrics reports as a counter.
+        """
+        deleted = 0
+        batch = []
+        versions = version_key("", self.prefix)
+        evictions = evictions_key(self.prefix)
+
+        async def unlink_batch():
+            nonlocal deleted
+            async with self.redis.pipeline(transaction=False) as pipe:
+                for key in batch:
+                    pipe.unlink(key)
+                deleted += sum(await pipe.execute())
+            batch.clear()
+            if on_progress:
+                on_progress(deleted)
+            # Let request handlers run between batches.
+            await asyncio.sleep(0)
+
+        async for key in self.redis.scan_iter(match=f"{self.prefix}*", count=batch_size):
+            if key.startswith(versions) or key == evictions:
+                continue
+            batch.append(key)
+            if len(batch) >= batch_size:
+                await unlink_batch()
+
+        if batch:
+            await unlink_batch()
+        return deleted
+
+    async def acquire_lock(self, key: str, ttl_ms: int) -> str | None:
+        token = uuid.uuid4().hex
+        if await self.redis.set(lock_key(key, self.prefix), token, nx=True, px=ttl_ms):
+            return token
+        return None
+
+    async def release_lock(self, key: str, token: str):
+        await self._release_lock(keys=[lock_key(key, self.prefix)], args=[token])
+
+    async def wait_for(self, key: str, timeout: float, interval: float) -> bytes | None:
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while loop.time() < deadline:
+            await asyncio.sleep(interval)
+            # From the primary: the lock and a just-stored value live there first.
+            async with self.binary.pipeline(transaction=False) as pipe:
+                pipe.get(entry_key(key, self.prefix))
+                pipe.exists(lock_key(key, self.prefix))
+                value, locked = await pipe.execute()
+            if value is not None:
+                return value
+            if not locked:
+                # The filling worker gave up without storing anything.
+                return None
+        return None
+
+    async def publish(self, channel: str, message: str):
+        await self.redis.publish(channel, message)
+
+    def listen(self, channel: str):
+        return _listen(self.redis, channel)
+
+    async def _maxmemory_evictions(self) -> int:
+        if isinstance(self.redis, RedisCluster):
+            stats = await self.redis.info("stats", target_nodes=RedisCluster.PRIMARIES)
+            return sum(node.get("evicted_keys", 0) for node in stats.values())
+        return (await self.redis.info("stats")).get("evicted_keys", 0)
+
+    async def _budget_evictions(self) -> int:
+        return int(await self.redis.get(evictions_key(self.prefix)) or 0)
+
+    async def evicted_keys(self) -> int:
+        """Keys Redis evicted at maxmemory plus entries evict() removed."""
+        return await self._maxmemory_evictions() + await self._budget_evictions()
+
+    async def ping(self) -> bool:
+        return await self.redis.ping()
+
+    async def close(self):
+        for client in (self.redis, self.binary, *self.replicas):
+            if isinstance(client, RedisCluster):
+                await client.aclose()
+            else:
+                await client.connection_pool.disconnect()
+
+
+class HashRing:
+    """Consistent hashing: each node owns the arcs before its virtual points.
+
+    Adding or removing one of N nodes moves only about 1/N of the keys.
+    """
+
+    def __init__(self, nodes: list[str], points_per_node: int):
+        ring = sorted(
+            (self._hash(f"{node}#{i}"), index)
+            for index, node in enumerate(nodes)
+            for i in range(points_per_node)
+        )
+        self._points = [point for point, _ in ring]
+        self._owners = [index for _, index in ring]
+
+    @staticmethod
+    def _hash(value: str) -> int:
+        return int.from_bytes(hashlib.md5(value.encode()).digest()[:8], "big")
+
+    def node_for(self, key: str) -> int:
+        i = bisect.bisect(self._points, self._hash(key))
+        return self._owners[i % len(self._points)]
+
+
+class ShardedRedisService(CacheBackend):
+    """Entries spread over several RedisServices by consistent hashing of the
+    query hash.
+
+    Each shard keeps the tags, predicates and version counters of its own
+    entries, so a store stays atomic on one shard; tag invalidations and
+    version bumps go to every shard.
+    """
+
+    def __init__(self, shards: list[RedisService], names: list[str], control: redis.Redis):
+        self.shards = shards
+        self.ring = HashRing(names, settings.REDIS_SHARD_POINTS)
+        # Pub/sub and other whole-cache traffic go to one node; in a cluster
+        # PUBLISH reaches subscribers on every node.
+        self.redis = control
 
-    async def set(self, key: str, value: str, ttl: int = 300):
-        self.redis.set(key, value, ex=ttl)
+    def shard(self, key: str) -> RedisService:
+        return self.shards[self.ring.node_for(key)]
 
-    async def get(self, key: str) -> str | None:
-        return self.redis.get(key)
+    def _by_shard(self, keys: list[str]) -> dict[int, list[int]]:
+        groups: dict[int, list[int]] = {}
+        for i, key in enumerate(keys):
+            groups.setdefault(self.ring.node_for(key), []).append(i)
+        return groups
+
+    async def _each(self, method: str, *args) -> list:
+        return await asyncio.gather(*(getattr(shard, method)(*args) for shard in self.shards))
+
+    async def get(self, key: str) -> bytes | None:
+        return await self.shard(key).get(key)
+
+    async def get_with_ttl(self, key: str) -> tuple[bytes | None, int]:
+        return await self.shard(key).get_with_ttl(key)
+
+    async def mget(self, keys: list[str]) -> list[bytes | None]:
+        values: list[bytes | None] = [None] * len(keys)
+        groups = self._by_shard(keys)
+        results = await asyncio.gather(*(
+            self.shards[shard].mget([keys[i] for i in indexes]) for shard, indexes in groups.items()
+        ))
+        for indexes, shard_values in zip(groups.values(), results):
+            for i, value in zip(indexes, shard_values):
+                values[i] = value
+        return values
+
+    async def set_many(self, items: list[dict]) -> list[str]:
+        groups = self._by_shard([item["key"] for item in items])
+        stored = await asyncio.gather(*(
+            self.shards[shard].set_many([items[i] for i in indexes]) for shard, indexes in groups.items()
+        ))
+        return [key for keys in stored for key in keys]
 
     async def delete(self, key: str):
-        self.redis.delete(key)
+        await self.shard(key).delete(key)
+
+    async def table_versions(self, tables: list[str], key: str) -> dict[str, int]:
+        return await self.shard(key).table_versions(tables, key)
+
+    async def bump_versions(self, tables: list[str]):
+        await self._each("bump_versions", tables)
+
+    async def invalidate_tags(self, tags: list[str]) -> int:
+        return sum(await self._each("invalidate_tags", tags))
+
+    async def get_dependents(self, tag: str) -> tuple[list[str], dict[str, str]]:
+        members, predicates = [], {}
+        for shard_members, shard_predicates in await self._each("get_dependents", tag):
+            members.extend(shard_members)
+            predicates.update(shard_predicates)
+        return members, predicates
+
+    async def unlink_dependents(self, tag: str, keys: list[str]) -> int:
+        groups = self._by_shard([query_hash_from_key(key) for key in keys])
+        removed = await asyncio.gather(*(
+            self.shards[shard].unlink_dependents(tag, [keys[i] for i in indexes])
+            for shard, indexes in groups.items()
+        ))
+        return sum(removed)
+
+    async def scan(self, batch_size: int):
+        for shard in self.shards:
+            async for key in shard.scan(batch_size):
+                yield key
+
+    async def cached_bytes(self) -> int:
+        return sum(await self._each("cached_bytes"))
+
+    async def record_fill(self, query_hash: str, window: int) -> tuple[int, int]:
+        misses, _ = await self.shard(query_hash).record_fill(query_hash, window)
+        return misses, await self.cached_bytes()
+
+    async def reconcile_bytes(self, batch_size: int) -> int:
+        return sum(await self._each("reconcile_bytes", batch_size))
+
+    async def evict(self, nbytes: int) -> int:
+        freed = 0
+        for shard in random.sample(self.shards, len(self.shards)):
+            if freed >= nbytes:
+                break
+            freed += await shard.evict(nbytes - freed)
+        return freed
+
+    async def clear_namespace(self, batch_size: int, on_progress=None) -> int:
+        deleted = 0
+        for shard in self.shards:
+            done = deleted
+            deleted += await shard.clear_namespace(
+                batch_size, (lambda count: on_progress(done + count)) if on_progress else None
+            )
+        return deleted
+
+    async def acquire_lock(self, key: str, ttl_ms: int) -> str | None:
+        return await self.shard(key).acquire_lock(key, ttl_ms)
+
+    async def release_lock(self, key: str, token: str):
+        await self.shard(key).release_lock(key, token)
+
+    async def wait_for(self, key: str, timeout: float, interval: float) -> bytes | None:
+        return await self.shard(key).wait_for(key, timeout, interval)
+
+    async def publish(self, channel: str, message: str):
+        await self.redis.publish(channel, message)
+
+    def listen(self, channel: str):
+        return _listen(self.redis, channel)
+
+    async def evicted_keys(self) -> int:
+        # Cluster shards share one client; count each server once.
+        servers = {id(shard.redis): shard for shard in self.shards}
+        return sum(await asyncio.gather(
+            *(shard._maxmemory_evictions() for shard in servers.values()),
+            *(shard._budget_evictions() for shard in self.shards),
+        ))
 
     async def ping(self) -> bool:
-        return self.redis.ping()
+        return all(await self._each("ping"))
+
+    async def close(self):
+        closed = set()
+        for shard in self.shards:
+            if id(shard.redis) not in closed:
+                closed.add(id(shard.redis))
+                await shard.close()
+        await self.redis.connection_pool.disconnect()
+
+
+def _sharded() -> ShardedRedisService:
+    # Each REDIS_SHARDS entry is "primary-url[,replica-url...]".
+    shards, names = [], []
+    for spec in settings.REDIS_SHARDS:
+        primary, *replicas = [url.strip() for url in spec.split(",")]
+        shards.append(RedisService.from_url(primary, replicas))
+        names.append(primary)
+    control = redis.Redis(connection_pool=_connection_pool(decode_responses=True, url=names[0]))
+    return ShardedRedisService(shards, names, control)
+
+
+def _cluster() -> ShardedRedisService:
+    # Cluster slots are spread by Redis; the ring spreads entries over
+    # REDIS_CLUSTER_SHARDS hash tags, each holding one shard's keys in a
+    # single slot so its scripts stay slot-local.
+    options = {
+        "read_from_replicas": settings.REDIS_READ_FROM_REPLICAS,
+        "max_connections": settings.REDIS_MAX_CONNECTIONS,
+    }
+    text = RedisCluster.from_url(settings.REDIS_CLUSTER_URL, decode_responses=True, **options)
+    binary = RedisCluster.from_url(settings.REDIS_CLUSTER_URL, decode_responses=False, **options)
+    names = [f"{{{i}}}" for i in range(settings.REDIS_CLUSTER_SHARDS)]
+    shards = [RedisService(text, binary, prefix=f"{settings.CACHE_KEY_PREFIX}{name}:") for name in names]
+    control = redis.Redis(connection_pool=_connection_pool(decode_responses=True, url=settings.REDIS_CLUSTER_URL))
+    return ShardedRedisService(shards, names, control)
 
 
-redis_service = RedisService()
\ No newline at end of file
+def create_redis_service() -> CacheBackend:
+    if settings.REDIS_CLUSTER_URL:
+        return _cluster()
+    if settings.REDIS_SHARDS:
+        return _sharded()
+    return RedisService.from_url(replica_urls=settings.REDIS_REPLICA_URLS)
@@ -0,0 +1,101 @@
+"""
+Encoding of cached query results.
+
+Columnar values are a msgpack map {"columns": [...], "data": [[col0...], ...]}:
+column names are written once and each column is one typed array. The first
+byte tells formats apart: b"C" plain columnar, b"Z" zstd- and b"L"
+lz4-compressed columnar. Row JSON (the default CACHE_VALUE_FORMAT="json",
+and entries written before columnar existed) starts with "[" and needs no tag.
+"""
+import msgpack
+import orjson
+
+from app.core.config import settings
+
+try:
+    import zstandard
+except ImportError:  # optional: values are stored uncompressed
+    zstandard = None
+
+try:
+    import lz4.frame
+except ImportError:  # optional: values are stored uncompressed
+    lz4 = None
+
+
+COLUMNAR = b"C"
+ZSTD = b"Z"
+LZ4 = b"L"
+
+
+def _compress(packed: bytes) -> bytes:
+    if len(packed) < settings.CACHE_COMPRESSION_THRESHOLD:
+        return COLUMNAR + packed
+
+    if settings.CACHE_COMPRESSION == "zstd" and zstandard is not None:
+        compressed = ZSTD + zstandard.compress(packed)
+    elif settings.CACHE_COMPRESSION == "lz4" and lz4 is not None:
+        compressed = LZ4 + lz4.frame.compress(packed)
+    else:
+        return COLUMNAR + packed
+
+    return compressed if len(compressed) < len(packed) else COLUMNAR + packed
+
+
+def encode_rows(rows: list[dict], value_format: str | None = None) -> bytes:
+    if (value_format or settings.CACHE_VALUE_FORMAT) == "json":
+        return orjson.dumps(rows, default=str)
+
+    columns = list(rows[0]) if rows else []
+    data = list(zip(*(row.values() for row in rows)))
+    packed = msgpack.packb({"columns": columns, "data": data}, default=str)
+    return _compress(packed)
+
+
+def columnar_bytes(payload: bytes) -> bytes | None:
+    """The msgpack columnar value inside a payload, or None for row JSON."""
+    tag = payload[:1]
+    if tag == COLUMNAR:
+        return payload[1:]
+    if tag == ZSTD:
+        if zstandard is None:
+            raise RuntimeError("zstandard is required to read this cache entry")
+        return zstandard.decompress(payload[1:])
+    if tag == LZ4:
+        if lz4 is None:
+            raise RuntimeError("lz4 is required to read this cache entry")
+        return lz4.frame.decompress(payload[1:])
+    return None
+
+
+def decode_rows(payload: bytes) -> list[dict]:
+    packed = columnar_bytes(payload)
+    if packed is None:
+        return orjson.loads(payload)
+
+    value = msgpack.unpackb(packed, use_list=False)
+    columns = value["columns"]
+    return [dict(zip(columns, values)) for values in zip(*value["data"])]
+
+
+def rows_json(payload: bytes) -> bytes:
+    """Row JSON for a payload; stored row JSON is returned without a copy."""
+    if payload[:1] == b"[":
+        return payload
+    return orjson.dumps(decode_rows(payload), default=str)
+
+
+def msgpack_envelope(fields: dict, payload: bytes) -> bytes:
+    """A msgpack map of `fields` plus "result", reusing columnar bytes as-is."""
+    packer = msgpack.Packer(default=str)
+    parts = [packer.pack_map_header(len(fields) + 1)]
+    for name, value in fields.items():
+        parts.append(packer.pack(name))
+        parts.append(packer.pack(value))
+    parts.append(packer.pack("result"))
+
+    packed = columnar_bytes(payload)
+    if packed is None:
+        packed = packer.pack(orjson.loads(payload))
+    parts.append(packed)
+    return b"".join(parts)
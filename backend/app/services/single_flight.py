@@ -0,0 +1,41 @@
+import asyncio
+
+
+class SingleFlight:
+    """Coalesces concurrent calls for the same key into one execution.
+
+    The first caller runs the function; everyone arriving while it is in
+    flight awaits the same result (or exception).
+    """
+
+    def __init__(self):
+        self._calls: dict[str, asyncio.Future] = {}
+
+    async def do(self, key: str, func):
+        future = self._calls.get(key)
+        if future is not None:
+            return await asyncio.shield(future)
+
+        future = asyncio.get_running_loop().create_future()
+        self._calls[key] = future
+        try:
+            result = await func()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Mark the exception as retrieved when nobody else was waiting.
+            future.exception()
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            del self._calls[key]
+
+    def in_flight(self, key: str) -> bool:
+        return key in self._calls
+
+
+single_flight = SingleFlight()
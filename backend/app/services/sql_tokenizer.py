@@ -0,0 +1,254 @@
+"""
+Single-pass SQL tokenizer producing a canonical query text, a parameterized
+template and the tables a query references.
+
+The canonical form drops comments, collapses whitespace, lowercases keywords
+and unquoted identifiers, and keeps string literals and quoted identifiers
+exactly as written. The template is the canonical form with literals in value
+positions (comparisons, IN lists, BETWEEN, LIMIT/OFFSET) replaced by bind
+parameters, so `id = 1` and `id = 2` share one template. Results are memoized
+per raw SQL text.
+"""
+import re
+from functools import lru_cache
+from typing import NamedTuple
+
+from app.core.config import settings
+
+
+TOKEN_PATTERN = re.compile(r"""
+    (?P<space>\s+)
+  | (?P<comment>--[^\n]*|/\*.*?(?:\*/|\Z))
+  | (?P<string>[eEnNxXbB]?'(?:[^']|'')*'?)
+  | (?P<quoted>"(?:[^"]|"")*"?|`[^`]*`?|\[[^\]]*\]?)
+  | (?P<number>(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?)
+  | (?P<word>[A-Za-z_][A-Za-z0-9_$]*)
+  | (?P<param>[:@$][A-Za-z0-9_]+|\?)
+  | (?P<op><=|>=|<>|!=|==|\|\||::|[-+*/%<>=(),.;|&^~!])
+  | (?P<other>.)
+""", re.VERBOSE | re.DOTALL)
+
+# Words after which a table reference list starts.
+TABLE_INTRODUCERS = {"from", "join", "update", "into"}
+
+# Words that end a FROM list (besides closing parentheses).
+FROM_LIST_END = {
+    "where", "group", "order", "having", "limit", "offset", "union", "intersect",
+    "except", "window", "fetch", "for", "returning", "set", "values", "select",
+}
+
+# Words inside a FROM list that are not table names; a top-level comma after
+# any of them still starts another table reference.
+JOIN_WORDS = {
+    "on", "using", "join", "inner", "left", "right", "full", "cross", "natural",
+    "lateral", "outer",
+}
+
+# Operators and words after which a literal is a value that can be bound.
+VALUE_INTRODUCERS = {
+    "=", "==", "<>", "!=", "<", ">", "<=", ">=", "like", "ilike", "between",
+    "limit", "offset",
+}
+
+# Auto-extracted literals are bound as :_p1, :_p2, ... in order.
+AUTO_PARAM_PREFIX = "_p"
+
+NO_SPACE_BEFORE = {",", ")", ".", ";", "::"}
+NO_SPACE_AFTER = {"(", ".", "::"}
+
+
+class Token(NamedTuple):
+    kind: str
+    text: str
+
+
+class ParsedQuery(NamedTuple):
+    query_type: str
+    normalized: str
+    tables: tuple[str, ...]
+    template: str
+    params: tuple
+
+
+def tokenize(sql: str) -> list[Token]:
+    tokens = []
+    for match in TOKEN_PATTERN.finditer(sql):
+        kind = match.lastgroup
+        if kind == "space" or kind == "comment":
+            continue
+        tokens.append(Token(kind, match.group()))
+    return tokens
+
+
+def _identifier_name(token: Token) -> str:
+    # Quoted identifiers are case-sensitive (on Postgres, at least).
+    if token.kind == "quoted":
+        return token.text[1:-1].replace('""', '"')
+    return token.text.lower()
+
+
+def _canonical(tokens: list[Token]) -> str:
+    parts = []
+    previous = None
+    for token in tokens:
+        text = token.text.lower() if token.kind == "word" else token.text
+        if parts and text not in NO_SPACE_BEFORE and previous not in NO_SPACE_AFTER:
+            parts.append(" ")
+        parts.append(text)
+        previous = text
+    return "".join(parts)
+
+
+def _literal_value(token: Token):
+    if token.kind == "string":
+        return token.text[1:-1].replace("''", "'")
+    try:
+        return int(token.text)
+    except ValueError:
+        return float(token.text)
+
+
+def _is_bindable(tokens: list[Token], i: int) -> bool:
+    token = tokens[i]
+    if token.kind == "string":
+        # Prefixed strings (E'', X'', N'') change meaning once unquoted.
+        if token.text[0] != "'" or len(token.text) < 2 or token.text[-1] != "'":
+            return False
+    elif token.kind != "number":
+        return False
+    # A cast right after the literal would read as part of the placeholder.
+    return i + 1 >= len(tokens) or tokens[i + 1].text != "::"
+
+
+def _extract_literals(tokens: list[Token]) -> tuple[list[Token], list]:
+    """Replace literals in value positions with numbered bind parameters."""
+    template = []
+    values = []
+    # Per parenthesis depth: whether the group is an IN (...) list.
+    in_list = [False]
+    after_between = False
+    previous = None
+
+    for i, token in enumerate(tokens):
+        text = token.text.lower() if token.kind == "word" else token.text
+        bind = False
+
+        if _is_bindable(tokens, i):
+            bind = (
+                previous in VALUE_INTRODUCERS
+                or (previous == "and" and after_between)
+                or (previous in ("(", ",") and in_list[-1])
+            )
+
+        if text == "(":
+            in_list.append(previous == "in")
+        elif text == ")" and len(in_list) > 1:
+            in_list.pop()
+
+        if previous == "between":
+            after_between = True
+        elif previous == "and":
+            after_between = False
+
+        if bind:
+            values.append(_literal_value(token))
+            template.append(Token("param", f":{AUTO_PARAM_PREFIX}{len(values)}"))
+        else:
+            template.append(token)
+        previous = text
+
+    return template, values
+
+
+def _referenced_tables(tokens: list[Token]) -> tuple[str, ...]:
+    tables = []
+    cte_names = set()
+    # Per parenthesis depth: whether a SELECT/UPDATE/DELETE was seen at that
+    # depth, so FROM inside EXTRACT(... FROM ...) or TRIM(...) is not a table
+    # list while UPDATE ... SET ... FROM is.
+    statement_at_depth = [False]
+    # Per parenthesis depth: whether we are between FROM and the end of its
+    # list, where a comma (even after a JOIN's ON clause) starts a table.
+    from_list_at_depth = [False]
+    # The word that introduced the table reference we expect next, if any.
+    expecting_table = None
+    previous = None
+    i = 0
+
+    while i < len(tokens):
+        token = tokens[i]
+        word = token.text.lower() if token.kind == "word" else None
+
+        if token.text == "(":
+            statement_at_depth.append(False)
+            from_list_at_depth.append(False)
+            expecting_table = None
+        elif token.text == ")":
+            if len(statement_at_depth) > 1:
+                statement_at_depth.pop()
+                from_list_at_depth.pop()
+        elif token.kind in ("word", "quoted") and i + 1 < len(tokens) and tokens[i + 1].text.lower() == "as" \
+                and i + 2 < len(tokens) and tokens[i + 2].text == "(" and len(statement_at_depth) == 1 \
+                and not from_list_at_depth[0]:
+            # CTE definition: name AS ( ... )
+            cte_names.add(_identifier_name(token))
+        elif word in ("select", "delete"):
+            statement_at_depth[-1] = True
+        elif word == "from" and previous == "distinct":
+            pass  # IS [NOT] DISTINCT FROM
+        elif word == "update" and previous in ("for", "do", "key"):
+            pass  # FOR UPDATE, ON CONFLICT DO UPDATE, ON DUPLICATE KEY UPDATE
+        elif word in TABLE_INTRODUCERS:
+            if word == "update":
+                statement_at_depth[-1] = True
+            if word != "from" or statement_at_depth[-1]:
+                expecting_table = word
+                if word == "from":
+                    from_list_at_depth[-1] = True
+        elif expecting_table and token.kind in ("word", "quoted"):
+            # Schema-qualified names: keep the last part.
+            j = i
+            while j + 2 < len(tokens) and tokens[j + 1].text == "." and tokens[j + 2].kind in ("word", "quoted"):
+                j += 2
+            # FROM f(...) is a table function; INTO t (...) is a column list.
+            is_function = expecting_table in ("from", "join") and j + 1 < len(tokens) and tokens[j + 1].text == "("
+            if word not in FROM_LIST_END and word not in JOIN_WORDS and not is_function:
+                name = _identifier_name(tokens[j])
+                if name not in tables:
+                    tables.append(name)
+            expecting_table = None
+            i = j
+        elif word in FROM_LIST_END:
+            from_list_at_depth[-1] = False
+            expecting_table = None
+        elif word in JOIN_WORDS:
+            expecting_table = None
+        elif token.text == "," and from_list_at_depth[-1]:
+            # Comma join: another table follows.
+            expecting_table = "from"
+        previous = word or token.text
+        i += 1
+
+    return tuple(table for table in tables if table not in cte_names)
+
+
+@lru_cache(maxsize=settings.PARSE_CACHE_SIZE)
+def analyze_query(sql: str) -> ParsedQuery:
+    tokens = tokenize(sql)
+    while tokens and tokens[-1].text == ";":
+        tokens.pop()
+
+    query_type = "UNKNOWN"
+    if tokens and tokens[0].kind == "word":
+        first = tokens[0].text.upper()
+        if first in ("SELECT", "INSERT", "UPDATE", "DELETE"):
+            query_type = first
+
+    template, values = _extract_literals(tokens)
+    return ParsedQuery(
+        query_type,
+        _canonical(tokens),
+        _referenced_tables(tokens),
+        _canonical(template),
+        tuple(values),
+    )
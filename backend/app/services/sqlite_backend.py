@@ -0,0 +1,387 @@
+"""
+Cache backend in a SQLite file on local disk, for deployments without Redis.
+
+Entries survive restarts, so a restarted worker serves hits straight away
+and warm-up finds the top queries already cached. Several workers on one
+host can share the file: writes are serialized by SQLite's lock, and
+invalidation messages for their L1 caches go through a table they poll.
+
+Calls run on one thread with one connection in WAL mode, so reads don't
+wait for writers in other processes. Expiry is by wall clock; expired rows
+are skipped when read and deleted by reconcile_bytes.
+"""
+import asyncio
+import sqlite3
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from app.core.config import settings
+from app.services.cache_backend import CacheBackend, entry_key, query_hash_from_key, template_tag
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    key TEXT PRIMARY KEY,
+    value BLOB NOT NULL,
+    expires_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS entries_expires_at ON entries (expires_at);
+CREATE TABLE IF NOT EXISTS tags (
+    tag TEXT NOT NULL,
+    key TEXT NOT NULL,
+    predicates TEXT,
+    PRIMARY KEY (tag, key)
+);
+CREATE INDEX IF NOT EXISTS tags_key ON tags (key);
+CREATE TABLE IF NOT EXISTS versions (name TEXT PRIMARY KEY, version INTEGER NOT NULL);
+CREATE TABLE IF NOT EXISTS fills (key TEXT PRIMARY KEY, misses INTEGER NOT NULL, expires_at REAL NOT NULL);
+CREATE TABLE IF NOT EXISTS locks (key TEXT PRIMARY KEY, token TEXT NOT NULL, expires_at REAL NOT NULL);
+CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL);
+INSERT OR IGNORE INTO counters VALUES ('bytes', 0);
+INSERT OR IGNORE INTO counters VALUES ('evictions', 0);
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    channel TEXT NOT NULL,
+    message TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+"""
+
+# Cache tables, in the order clear_namespace empties them. Table versions
+# are kept, so fills that read a table before a write stay stale.
+CACHE_TABLES = ("entries", "tags", "fills", "locks")
+# Keeps SQL variables per statement well under SQLite's limit.
+CHUNK_SIZE = 500
+# How often listeners look for new messages, and how long messages are kept.
+MESSAGE_POLL_INTERVAL = 0.1
+MESSAGE_RETENTION = 60.0
+
+
+def _placeholders(values: list) -> str:
+    return ",".join("?" * len(values))
+
+
+class SQLiteBackend(CacheBackend):
+    def __init__(self, path: str):
+        self.path = path
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sqlite-cache")
+        # Autocommit; writes open their own IMMEDIATE transactions.
+        self._db = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute("PRAGMA busy_timeout=5000")
+        self._db.executescript(SCHEMA)
+
+    async def _run(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    def _write(self, func, *args):
+        self._db.execute("BEGIN IMMEDIATE")
+        try:
+            result = func(*args)
+        except BaseException:
+            self._db.execute("ROLLBACK")
+            raise
+        self._db.execute("COMMIT")
+        return result
+
+    def _add_bytes(self, delta: int):
+        if delta:
+            self._db.execute("UPDATE counters SET value = value + ? WHERE name = 'bytes'", (delta,))
+
+    def _bytes(self) -> int:
+        return max(0, self._db.execute("SELECT value FROM counters WHERE name = 'bytes'").fetchone()[0])
+
+    def _unlink(self, keys: list[str]) -> int:
+        removed = 0
+        for start in range(0, len(keys), CHUNK_SIZE):
+            chunk = keys[start:start + CHUNK_SIZE]
+            marks = _placeholders(chunk)
+            freed = self._db.execute(
+                f"SELECT COALESCE(SUM(length(value)), 0) FROM entries WHERE key IN ({marks})", chunk
+            ).fetchone()[0]
+            removed += self._db.execute(f"DELETE FROM entries WHERE key IN ({marks})", chunk).rowcount
+            self._db.execute(f"DELETE FROM tags WHERE key IN ({marks})", chunk)
+            self._add_bytes(-freed)
+        return removed
+
+    def _get(self, key: str) -> tuple[bytes | None, int]:
+        row = self._db.execute(
+            "SELECT value, expires_at FROM entries WHERE key = ? AND expires_at > ?", (key, time.time())
+        ).fetchone()
+        if row is None:
+            return None, -2
+        return row[0], int(row[1] - time.time())
+
+    async def get(self, key: str) -> bytes | None:
+        value, _ = await self._run(self._get, key)
+        return value
+
+    async def get_with_ttl(self, key: str) -> tuple[bytes | None, int]:
+        return await self._run(self._get, key)
+
+    def _mget(self, keys: list[str]) -> list[bytes | None]:
+        values = {}
+        now = time.time()
+        for start in range(0, len(keys), CHUNK_SIZE):
+            chunk = keys[start:start + CHUNK_SIZE]
+            values.update(self._db.execute(
+                f"SELECT key, value FROM entries WHERE key IN ({_placeholders(chunk)}) AND expires_at > ?",
+                (*chunk, now),
+            ))
+        return [values.get(key) for key in keys]
+
+    async def mget(self, keys: list[str]) -> list[bytes | None]:
+        if not keys:
+            return []
+        return await self._run(self._mget, keys)
+
+    def _set_many(self, items: list[dict]) -> list[str]:
+        stored = []
+        now = time.time()
+        for item in items:
+            versions = item.get("versions") or {}
+            if versions:
+                current = dict(self._db.execute(
+                    f"SELECT name, version FROM versions WHERE name IN ({_placeholders(list(versions))})",
+                    list(versions),
+                ))
+                if any(current.get(table, 0) != version for table, version in versions.items()):
+                    continue
+
+            key, value = item["key"], item["value"]
+            previous = self._db.execute("SELECT length(value) FROM entries WHERE key = ?", (key,)).fetchone()
+            self._db.execute(
+                "INSERT OR REPLACE INTO entries VALUES (?, ?, ?)",
+                (key, value, now + item.get("ttl", settings.CACHE_HARD_TTL)),
+            )
+            self._add_bytes(len(value) - (previous[0] if previous else 0))
+
+            tables = list(item.get("tags", ()))
+            predicates = item.get("predicates")
+            rows = [(table, key, predicates) for table in tables]
+            if item.get("template"):
+                rows.append((template_tag(item["template"]), key, None))
+            self._db.executemany("INSERT OR REPLACE INTO tags VALUES (?, ?, ?)", rows)
+            stored.append(key)
+        return stored
+
+    async def set_many(self, items: list[dict]) -> list[str]:
+        if not items:
+            return []
+        return await self._run(self._write, self._set_many, items)
+
+    async def delete(self, key: str):
+        await self._run(self._write, self._unlink, [key])
+
+    def _scan_page(self, after: str, batch_size: int) -> list[str]:
+        return [row[0] for row in self._db.execute(
+            "SELECT key FROM entries WHERE key > ? AND expires_at > ? ORDER BY key LIMIT ?",
+            (after, time.time(), batch_size),
+        )]
+
+    async def scan(self, batch_size: int):
+        after = ""
+        while True:
+            keys = await self._run(self._scan_page, after, batch_size)
+            for key in keys:
+                yield key
+            if len(keys) < batch_size:
+                return
+            after = keys[-1]
+
+    def _table_versions(self, tables: list[str]) -> dict[str, int]:
+        current = dict(self._db.execute(
+            f"SELECT name, version FROM versions WHERE name IN ({_placeholders(tables)})", tables
+        ))
+        return {table: current.get(table, 0) for table in tables}
+
+    async def table_versions(self, tables: list[str], key: str) -> dict[str, int]:
+        if not tables:
+            return {}
+        return await self._run(self._table_versions, tables)
+
+    def _bump_versions(self, tables: list[str]):
+        self._db.executemany(
+            "INSERT INTO versions VALUES (?, 1) ON CONFLICT (name) DO UPDATE SET version = version + 1",
+            [(table,) for table in tables],
+        )
+
+    async def bump_versions(self, tables: list[str]):
+        if tables:
+            await self._run(self._write, self._bump_versions, tables)
+
+    def _invalidate_tags(self, tags: list[str]) -> int:
+        keys = [row[0] for row in self._db.execute(
+            f"SELECT DISTINCT key FROM tags WHERE tag IN ({_placeholders(tags)})", tags
+        )]
+        removed = self._unlink(keys)
+        self._db.execute(f"DELETE FROM tags WHERE tag IN ({_placeholders(tags)})", tags)
+        return removed
+
+    async def invalidate_tags(self, tags: list[str]) -> int:
+        if not tags:
+            return 0
+        return await self._run(self._write, self._invalidate_tags, tags)
+
+    def _get_dependents(self, tag: str) -> tuple[list[str], dict[str, str]]:
+        members, predicates = [], {}
+        for key, value in self._db.execute("SELECT key, predicates FROM tags WHERE tag = ?", (tag,)):
+            members.append(entry_key(key))
+            if value is not None:
+                predicates[entry_key(key)] = value
+        return members, predicates
+
+    async def get_dependents(self, tag: str) -> tuple[list[str], dict[str, str]]:
+        return await self._run(self._get_dependents, tag)
+
+    async def unlink_dependents(self, tag: str, keys: list[str]) -> int:
+        if not keys:
+            return 0
+        return await self._run(self._write, self._unlink, [query_hash_from_key(key) for key in keys])
+
+    async def cached_bytes(self) -> int:
+        return await self._run(self._bytes)
+
+    def _record_fill(self, query_hash: str, window: int) -> tuple[int, int]:
+        now = time.time()
+        misses = self._db.execute(
+            "INSERT INTO fills VALUES (?, 1, ?) ON CONFLICT (key) DO UPDATE SET "
+            "misses = CASE WHEN expires_at > ? THEN misses + 1 ELSE 1 END, "
+            "expires_at = CASE WHEN expires_at > ? THEN expires_at ELSE excluded.expires_at END "
+            "RETURNING misses",
+            (query_hash, now + window, now, now),
+        ).fetchone()[0]
+        return misses, self._bytes()
+
+    async def record_fill(self, query_hash: str, window: int) -> tuple[int, int]:
+        return await self._run(self._write, self._record_fill, query_hash, window)
+
+    def _reconcile_bytes(self) -> int:
+        now = time.time()
+        self._db.execute("DELETE FROM entries WHERE expires_at <= ?", (now,))
+        self._db.execute("DELETE FROM tags WHERE key NOT IN (SELECT key FROM entries)")
+        self._db.execute("DELETE FROM fills WHERE expires_at <= ?", (now,))
+        self._db.execute("DELETE FROM locks WHERE expires_at <= ?", (now,))
+        self._db.execute("DELETE FROM messages WHERE created_at <= ?", (now - MESSAGE_RETENTION,))
+        total = self._db.execute("SELECT COALESCE(SUM(length(value)), 0) FROM entries").fetchone()[0]
+        self._db.execute("UPDATE counters SET value = ? WHERE name = 'bytes'", (total,))
+        return total
+
+    async def reconcile_bytes(self, batch_size: int) -> int:
+        """Delete expired rows and recount the byte total from the entries left."""
+        return await self._run(self._write, self._reconcile_bytes)
+
+    def _evict(self, nbytes: int) -> int:
+        # Reads are not recorded, so the earliest-filled entries (all share
+        # the hard TTL) stand in for the least recently used.
+        keys, freed = [], 0
+        for key, size in self._db.execute(
+            "SELECT key, length(value) FROM entries ORDER BY expires_at"
+        ):
+            if freed >= nbytes:
+                break
+            keys.append(key)
+            freed += size
+        self._unlink(keys)
+        self._db.execute("UPDATE counters SET value = value + ? WHERE name = 'evictions'", (len(keys),))
+        return freed
+
+    async def evict(self, nbytes: int) -> int:
+        return await self._run(self._write, self._evict, nbytes)
+
+    def _clear_batch(self, table: str, batch_size: int) -> int:
+        if table == "entries":
+            # Through _unlink, to keep the byte total in step.
+            keys = [row[0] for row in self._db.execute("SELECT key FROM entries LIMIT ?", (batch_size,))]
+            return self._unlink(keys)
+        return self._db.execute(
+            f"DELETE FROM {table} WHERE rowid IN (SELECT rowid FROM {table} LIMIT ?)", (batch_size,)
+        ).rowcount
+
+    async def clear_namespace(self, batch_size: int, on_progress=None) -> int:
+        """Empty the cache tables in batches, so other workers sharing the
+        file are not locked out for the whole clear."""
+        deleted = 0
+        for table in CACHE_TABLES:
+            while count := await self._run(self._write, self._clear_batch, table, batch_size):
+                deleted += count
+                if on_progress:
+                    on_progress(deleted)
+        return deleted
+
+    def _acquire_lock(self, key: str, token: str, ttl_ms: int) -> bool:
+        now = time.time()
+        self._db.execute("DELETE FROM locks WHERE key = ? AND expires_at <= ?", (key, now))
+        return self._db.execute(
+            "INSERT OR IGNORE INTO locks VALUES (?, ?, ?)", (key, token, now + ttl_ms / 1000)
+        ).rowcount == 1
+
+    async def acquire_lock(self, key: str, ttl_ms: int) -> str | None:
+        token = uuid.uuid4().hex
+        if await self._run(self._write, self._acquire_lock, key, token, ttl_ms):
+            return token
+        return None
+
+    def _release_lock(self, key: str, token: str):
+        self._db.execute("DELETE FROM locks WHERE key = ? AND token = ?", (key, token))
+
+    async def release_lock(self, key: str, token: str):
+        await self._run(self._release_lock, key, token)
+
+    def _poll_fill(self, key: str) -> tuple[bytes | None, bool]:
+        value, _ = self._get(key)
+        locked = self._db.execute(
+            "SELECT 1 FROM locks WHERE key = ? AND expires_at > ?", (key, time.time())
+        ).fetchone()
+        return value, locked is not None
+
+    async def wait_for(self, key: str, timeout: float, interval: float) -> bytes | None:
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while loop.time() < deadline:
+            await asyncio.sleep(interval)
+            value, locked = await self._run(self._poll_fill, key)
+            if value is not None:
+                return value
+            if not locked:
+                # The filling worker gave up without storing anything.
+                return None
+        return None
+
+    def _publish(self, channel: str, message: str):
+        self._db.execute(
+            "INSERT INTO messages (channel, message, created_at) VALUES (?, ?, ?)",
+            (channel, message, time.time()),
+        )
+
+    async def publish(self, channel: str, message: str):
+        await self._run(self._publish, channel, message)
+
+    def _messages_after(self, channel: str, last_id: int) -> list[tuple[int, str]]:
+        return self._db.execute(
+            "SELECT id, message FROM messages WHERE id > ? AND channel = ? ORDER BY id",
+            (last_id, channel),
+        ).fetchall()
+
+    async def listen(self, channel: str):
+        last_id = await self._run(
+            lambda: self._db.execute("SELECT COALESCE(MAX(id), 0) FROM messages").fetchone()[0]
+        )
+        while True:
+            await asyncio.sleep(MESSAGE_POLL_INTERVAL)
+            for last_id, message in await self._run(self._messages_after, channel, last_id):
+                yield message
+
+    async def evicted_keys(self) -> int:
+        return await self._run(
+            lambda: self._db.execute("SELECT value FROM counters WHERE name = 'evictions'").fetchone()[0]
+        )
+
+    async def ping(self) -> bool:
+        return await self._run(lambda: self._db.execute("SELECT 1").fetchone()[0] == 1)
+
+    async def close(self):
+        await self._run(self._db.close)
+        self._executor.shutdown()
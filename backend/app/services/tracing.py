@@ -0,0 +1,183 @@
+"""
+Per-stage timing of /query and /invalidate requests.
+
+Code marks its stages with `with span("redis_get"):`. Spans only record when
+the request is traced: it sent "X-QueryCache-Trace: 1" (timings come back in
+a Server-Timing header), TRACE_STAGES is on (timings feed the
+querycache_stage_seconds histogram), or TRACE_PROFILE_SLOWEST is set
+(the request's database-thread work runs under cProfile and the profiles of
+the N slowest requests are kept). Otherwise a span is a context variable
+lookup returning a shared no-op.
+
+cProfile hooks one thread. Enabled on the event loop, it would also record
+every coroutine that ran while the request awaited, so only the blocking
+calls made through run_in_db_thread are profiled, each in its own thread.
+"""
+import cProfile
+import heapq
+import io
+import itertools
+import pstats
+import time
+from contextvars import ContextVar
+from urllib.parse import parse_qs
+
+from starlette.datastructures import Headers, MutableHeaders
+
+from app.core.config import settings
+from app.services import metrics
+
+
+TRACED_PATHS = {"/query", "/invalidate"}
+TRACE_HEADER = "x-querycache-trace"
+
+
+class Trace:
+    def __init__(self, endpoint: str, profile: bool = False):
+        self.endpoint = endpoint
+        self.started = time.perf_counter()
+        self.stages: dict[str, float] = {}
+        # One profile per profiled call; None when the request isn't profiled.
+        self.profiles: list[cProfile.Profile] | None = [] if profile else None
+
+    def add(self, stage: str, seconds: float):
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    def server_timing(self) -> str:
+        total = time.perf_counter() - self.started
+        parts = [f"{stage};dur={seconds * 1000:.3f}" for stage, seconds in self.stages.items()]
+        parts.append(f"total;dur={total * 1000:.3f}")
+        return ", ".join(parts)
+
+
+_current_trace: ContextVar[Trace | None] = ContextVar("querycache_trace", default=None)
+
+
+class _Span:
+    __slots__ = ("trace", "stage", "started")
+
+    def __init__(self, trace: Trace, stage: str):
+        self.trace = trace
+        self.stage = stage
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.trace.add(self.stage, time.perf_counter() - self.started)
+
+
+class _NoSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return None
+
+
+_NO_SPAN = _NoSpan()
+
+
+def span(stage: str):
+    trace = _current_trace.get()
+    if trace is None:
+        return _NO_SPAN
+    return _Span(trace, stage)
+
+
+def profiled(func):
+    """`func`, run under its own cProfile if the current request is profiled.
+
+    Call it where the request's context is current; the returned function
+    may then run on any thread.
+    """
+    trace = _current_trace.get()
+    if trace is None or trace.profiles is None:
+        return func
+
+    def run(*args):
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            return func(*args)
+        finally:
+            profiler.disable()
+            trace.profiles.append(profiler)
+
+    return run
+
+
+class SlowestProfiles:
+    """The N slowest profiled requests, slowest first."""
+
+    def __init__(self):
+        self._heap: list[tuple[float, int, dict]] = []
+        self._sequence = itertools.count()
+
+    def offer(self, trace: Trace, query: str | None, total: float):
+        limit = settings.TRACE_PROFILE_SLOWEST
+        if not trace.profiles or (len(self._heap) >= limit and total <= self._heap[0][0]):
+            return
+
+        output = io.StringIO()
+        stats = pstats.Stats(trace.profiles[0], stream=output)
+        for profiler in trace.profiles[1:]:
+            stats.add(profiler)
+        stats.sort_stats("cumulative").print_stats(30)
+        record = {
+            "endpoint": trace.endpoint,
+            "query": query,
+            "total_ms": round(total * 1000, 3),
+            "stages_ms": {stage: round(seconds * 1000, 3) for stage, seconds in trace.stages.items()},
+            # Time on the event loop, awaits included, is not in the profile.
+            "profile_scope": "db_threads",
+            "profiled_calls": len(trace.profiles),
+            "profile": output.getvalue(),
+        }
+        heapq.heappush(self._heap, (total, next(self._sequence), record))
+        while len(self._heap) > limit:
+            heapq.heappop(self._heap)
+
+    def snapshot(self) -> list[dict]:
+        return [record for _, _, record in sorted(self._heap, reverse=True)]
+
+
+slowest_profiles = SlowestProfiles()
+
+
+class TracingMiddleware:
+    """Starts a Trace for requests to TRACED_PATHS that need one."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] not in TRACED_PATHS:
+            return await self.app(scope, receive, send)
+
+        requested = Headers(scope=scope).get(TRACE_HEADER) in ("1", "true")
+        profile = settings.TRACE_PROFILE_SLOWEST > 0
+        if not (requested or settings.TRACE_STAGES or profile):
+            return await self.app(scope, receive, send)
+
+        trace = Trace(scope["path"], profile)
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                MutableHeaders(scope=message).append("Server-Timing", trace.server_timing())
+            await send(message)
+
+        token = _current_trace.set(trace)
+        try:
+            await self.app(scope, receive, send_with_timing if requested else send)
+        finally:
+            _current_trace.reset(token)
+            total = time.perf_counter() - trace.started
+            if profile:
+                query = parse_qs(scope["query_string"].decode()).get("sql", [None])[0]
+                slowest_profiles.offer(trace, query, total)
+            if settings.TRACE_STAGES:
+                for stage, seconds in trace.stages.items():
+                    metrics.stage_duration.observe(seconds, trace.endpoint, stage)
+                metrics.stage_duration.observe(total, trace.endpoint, "total")
@@ -0,0 +1,138 @@
+"""
+Cache value encoding benchmark: memory per entry and hit latency.
+
+Stores synthetic product rows (10, 1k and 100k by default) as row JSON and as
+columnar msgpack, uncompressed and with zstd/lz4, then reports the time of a
+hit: get + decode to rows (JSON clients) and get + msgpack envelope with the
+columnar bytes copied through (msgpack clients). On Redis it also reports
+MEMORY USAGE per entry. Runs against the configured cache backend, or the one
+given with --backend; it only touches entries keyed "bench:enc:...".
+
+    python -m benchmarks.bench_encoding --sizes 10 1000 100000 --output encoding.json
+    python -m benchmarks.bench_encoding --backend sqlite
+"""
+import argparse
+import asyncio
+import json
+import time
+
+from app.core.config import settings
+from app.services.cache_entry import pack_entry, unpack_entry
+from app.services.result_codec import decode_rows, encode_rows, msgpack_envelope
+
+
+# (label, value format, compression)
+VARIANTS = [
+    ("json", "json", "none"),
+    ("columnar", "columnar", "none"),
+    ("columnar+zstd", "columnar", "zstd"),
+    ("columnar+lz4", "columnar", "lz4"),
+]
+
+CATEGORIES = ["Electronics", "Audio", "Books", "Home", "Toys"]
+
+
+def make_rows(count: int) -> list[dict]:
+    return [
+        {
+            "id": i,
+            "name": f"Product {i}",
+            "description": f"Description of product {i}",
+            "price": round(10 + (i % 500) * 1.25, 2),
+            "stock": i % 100,
+            "category": CATEGORIES[i % len(CATEGORIES)],
+            "created_at": f"2024-01-{i % 28 + 1:02d}T12:00:00",
+        }
+        for i in range(count)
+    ]
+
+
+async def time_hits(cache_backend, key: str, repeat: int, decode) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        raw = await cache_backend.get(key)
+        decode(unpack_entry(raw).payload)
+    return (time.perf_counter() - start) * 1000 / repeat
+
+
+async def redis_memory(cache_backend, key: str) -> int | None:
+    """MEMORY USAGE of the entry; None on backends other than Redis."""
+    from app.services.cache_backend import entry_key
+    from app.services.redis_service import RedisService, ShardedRedisService
+
+    if isinstance(cache_backend, ShardedRedisService):
+        cache_backend = cache_backend.shard(key)
+    if not isinstance(cache_backend, RedisService):
+        return None
+    return await cache_backend.binary.memory_usage(entry_key(key, cache_backend.prefix))
+
+
+async def bench_size(cache_backend, count: int) -> list[dict]:
+    rows = make_rows(count)
+    repeat = max(3, min(200, 200_000 // count))
+    envelope = {"source": "cache", "query": "bench", "execution_time_ms": 2}
+    results = []
+
+    for label, value_format, compression in VARIANTS:
+        settings.CACHE_COMPRESSION = compression
+        key = f"bench:enc:{label}:{count}"
+
+        start = time.perf_counter()
+        payload = encode_rows(rows, value_format)
+        encode_ms = (time.perf_counter() - start) * 1000
+
+        await cache_backend.set(key, pack_entry(payload, encode_ms), ttl=600)
+        memory = await redis_memory(cache_backend, key)
+
+        results.append({
+            "rows": count,
+            "format": label,
+            "value_bytes": len(payload),
+            "redis_memory_bytes": memory,
+            "encode_ms": round(encode_ms, 3),
+            "hit_rows_ms": round(await time_hits(cache_backend, key, repeat, decode_rows), 3),
+            "hit_msgpack_ms": round(
+                await time_hits(cache_backend, key, repeat, lambda p: msgpack_envelope(envelope, p)), 3
+            ),
+        })
+        await cache_backend.delete(key)
+
+    return results
+
+
+async def main(args):
+    # Imported here, after --backend has set CACHE_BACKEND.
+    from app.services.cache import cache_backend
+
+    compression = settings.CACHE_COMPRESSION
+    results = []
+    try:
+        for count in args.sizes:
+            results.extend(await bench_size(cache_backend, count))
+    finally:
+        settings.CACHE_COMPRESSION = compression
+        await cache_backend.close()
+
+    print(f"backend: {settings.CACHE_BACKEND}")
+    print(f"{'rows':>7} {'format':<14} {'value B':>11} {'redis B':>11} "
+          f"{'encode ms':>10} {'hit rows ms':>12} {'hit msgpack ms':>15}")
+    for r in results:
+        memory = "-" if r["redis_memory_bytes"] is None else r["redis_memory_bytes"]
+        print(f"{r['rows']:>7} {r['format']:<14} {r['value_bytes']:>11} {memory:>11} "
+              f"{r['encode_ms']:>10.3f} {r['hit_rows_ms']:>12.3f} {r['hit_msgpack_ms']:>15.3f}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"backend": settings.CACHE_BACKEND, "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="QueryCache value encoding benchmark")
+    parser.add_argument("--backend", choices=["redis", "memory", "sqlite"], help="cache backend to store entries in")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 1000, 100000])
+    parser.add_argument("--output", help="write results as JSON to this file")
+    args = parser.parse_args()
+    if args.backend:
+        # Read when main() first imports the cache backend.
+        settings.CACHE_BACKEND = args.backend
+    asyncio.run(main(args))
@@ -0,0 +1,58 @@
+"""
+Cache-hit response microbenchmark: CPU spent turning a stored payload into a
+response body.
+
+Compares the previous path (json.loads, then FastAPI's jsonable_encoder and
+JSONResponse) with the byte-splicing path of /query for stored row JSON and
+for columnar values. Runs in-process; no Redis or database needed.
+
+    python -m benchmarks.bench_hit_response --sizes 1000 10000 100000
+"""
+import argparse
+import json
+import time
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+from app.api.query import _json_response
+from app.services.result_codec import encode_rows, rows_json
+from benchmarks.bench_encoding import make_rows
+
+
+SQL = "SELECT * FROM products"
+
+
+def previous_hit(payload: bytes) -> bytes:
+    content = {"source": "cache", "query": SQL, "result": json.loads(payload), "execution_time_ms": 2}
+    return JSONResponse(jsonable_encoder(content)).body
+
+
+def spliced_hit(payload: bytes) -> bytes:
+    return _json_response("cache", SQL, rows_json(payload), 2).body
+
+
+def cpu_ms(func, payload: bytes, repeat: int) -> float:
+    start = time.process_time()
+    for _ in range(repeat):
+        func(payload)
+    return (time.process_time() - start) * 1000 / repeat
+
+
+def main(args):
+    print(f"{'rows':>7} {'previous ms':>12} {'spliced json ms':>16} {'spliced columnar ms':>20}")
+    for count in args.sizes:
+        rows = make_rows(count)
+        repeat = max(3, min(500, 500_000 // count))
+        legacy_payload = json.dumps(rows).encode()
+
+        previous = cpu_ms(previous_hit, legacy_payload, repeat)
+        spliced_json = cpu_ms(spliced_hit, encode_rows(rows, "json"), repeat)
+        spliced_columnar = cpu_ms(spliced_hit, encode_rows(rows, "columnar"), repeat)
+        print(f"{count:>7} {previous:>12.3f} {spliced_json:>16.3f} {spliced_columnar:>20.3f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="QueryCache cache-hit response benchmark")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    main(parser.parse_args())
@@ -0,0 +1,66 @@
+"""
+Invalidation benchmark: one table with tens of thousands of dependent queries.
+
+Compares the old approach (one delete round trip per dependent key) with the
+tag invalidation used by /invalidate. Runs against the configured cache
+backend, or the one given with --backend; it only touches entries keyed
+"bench:q:..." and the "bench:products" tag.
+
+    python -m benchmarks.bench_invalidation --keys 50000
+    python -m benchmarks.bench_invalidation --backend memory
+"""
+import argparse
+import asyncio
+import time
+
+from app.core.config import settings
+
+
+TABLE = "bench:products"
+
+
+async def populate(cache_backend, count: int) -> list[str]:
+    keys = [f"bench:q:{i}" for i in range(count)]
+    for start in range(0, count, 5000):
+        await cache_backend.set_many([
+            {"key": key, "value": b"[]", "ttl": 600, "tags": [TABLE]} for key in keys[start:start + 5000]
+        ])
+    return keys
+
+
+async def per_key_delete(cache_backend, keys: list[str]) -> int:
+    for key in keys:
+        await cache_backend.delete(key)
+    return len(keys)
+
+
+async def main(args):
+    # Imported here, after --backend has set CACHE_BACKEND.
+    from app.services.cache import cache_backend
+
+    print(f"backend: {settings.CACHE_BACKEND}")
+    keys = await populate(cache_backend, args.keys)
+    start = time.perf_counter()
+    deleted = await per_key_delete(cache_backend, keys)
+    per_key_ms = (time.perf_counter() - start) * 1000
+    await cache_backend.invalidate_tags([TABLE])
+    print(f"per-key delete : {deleted:>7} keys in {per_key_ms:>9.1f} ms")
+
+    await populate(cache_backend, args.keys)
+    start = time.perf_counter()
+    deleted = await cache_backend.invalidate_tags([TABLE])
+    tagged_ms = (time.perf_counter() - start) * 1000
+    print(f"tag invalidation: {deleted:>6} keys in {tagged_ms:>9.1f} ms")
+
+    await cache_backend.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="QueryCache invalidation benchmark")
+    parser.add_argument("--backend", choices=["redis", "memory", "sqlite"], help="cache backend to invalidate in")
+    parser.add_argument("--keys", type=int, default=50000, help="dependent queries on the table")
+    args = parser.parse_args()
+    if args.backend:
+        # Read when main() first imports the cache backend.
+        settings.CACHE_BACKEND = args.backend
+    asyncio.run(main(args))
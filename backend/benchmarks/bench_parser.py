@@ -0,0 +1,42 @@
+"""
+Parsing throughput microbenchmark for normalization + table extraction.
+
+Compares a cold parse of every statement with the memoized path that repeated
+queries take. Pure Python, no Redis or database needed:
+
+    python -m benchmarks.bench_parser --iterations 20000
+"""
+import argparse
+import time
+
+from app.services.sql_tokenizer import analyze_query
+
+
+QUERIES = [
+    "SELECT * FROM products WHERE id = 1",
+    "SELECT id, name, price FROM products WHERE category = 'Audio' ORDER BY price DESC LIMIT 20",
+    "SELECT u.username, COUNT(o.id) FROM users u JOIN orders o ON o.user_id = u.id GROUP BY u.username",
+    "WITH recent AS (SELECT * FROM orders WHERE created_at > '2025-01-01') "
+    "SELECT p.name, SUM(r.quantity) FROM recent r, products p WHERE r.product_id = p.id GROUP BY p.name",
+    "SELECT * FROM products WHERE id IN (SELECT product_id FROM orders WHERE quantity > 5) -- hot path",
+]
+
+
+def measure(label: str, func, iterations: int):
+    start = time.perf_counter()
+    for i in range(iterations):
+        func(QUERIES[i % len(QUERIES)])
+    elapsed = time.perf_counter() - start
+    print(f"{label:<10} {iterations / elapsed:>12,.0f} parses/s  ({elapsed / iterations * 1e6:.2f} us each)")
+
+
+def main(args):
+    measure("cold", analyze_query.__wrapped__, args.iterations)
+    analyze_query.cache_clear()
+    measure("memoized", analyze_query, args.iterations)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="SQL parsing throughput")
+    parser.add_argument("--iterations", type=int, default=20000)
+    main(parser.parse_args())
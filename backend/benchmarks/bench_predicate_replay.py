@@ -0,0 +1,83 @@
+"""
+Replay a write-heavy products workload and compare cache hit rates with
+table-level and predicate-aware invalidation.
+
+Runs the app in-process, so it needs the seeded database and a reachable Redis
+(the cache is cleared before each run):
+
+    python -m benchmarks.bench_predicate_replay --operations 5000 --write-ratio 0.3
+"""
+import argparse
+import random
+
+from fastapi.testclient import TestClient
+
+from app.core.config import settings
+from app.main import app
+
+
+CATEGORIES = ["Electronics", "Audio", "Gaming", "Accessories", "Furniture", "Software"]
+
+
+def zipf_id(rng: random.Random, count: int, skew: float = 1.1) -> int:
+    # Inverse-CDF sampling over a truncated power law; id 1 is the hottest.
+    return min(count, int(rng.paretovariate(skew)))
+
+
+def build_trace(seed: int, operations: int, write_ratio: float) -> list[tuple[str, str]]:
+    rng = random.Random(seed)
+    trace = []
+    for _ in range(operations):
+        if rng.random() < write_ratio:
+            roll = rng.random()
+            if roll < 0.7:
+                sql = f"UPDATE products SET price = {rng.randint(100, 99999)} WHERE id = {zipf_id(rng, 1000)}"
+            elif roll < 0.9:
+                sql = f"UPDATE products SET stock = {rng.randint(0, 150)} WHERE category = '{rng.choice(CATEGORIES)}'"
+            else:
+                sql = f"DELETE FROM orders WHERE id = {rng.randint(1, 5000)}"
+            trace.append(("write", sql))
+        else:
+            roll = rng.random()
+            if roll < 0.6:
+                sql = f"SELECT * FROM products WHERE id = {zipf_id(rng, 1000)}"
+            elif roll < 0.9:
+                sql = f"SELECT id, name, price FROM products WHERE category = '{rng.choice(CATEGORIES)}'"
+            else:
+                sql = f"SELECT COUNT(*) FROM products WHERE price < {rng.choice([5000, 50000, 500000])}"
+            trace.append(("read", sql))
+    return trace
+
+
+def replay(client: TestClient, trace: list[tuple[str, str]]) -> dict:
+    client.delete("/cache")
+    reads = hits = 0
+    for kind, sql in trace:
+        if kind == "write":
+            client.post("/invalidate", params={"sql": sql})
+            continue
+        reads += 1
+        if client.get("/query", params={"sql": sql}).json().get("source") == "cache":
+            hits += 1
+    return {"reads": reads, "hits": hits, "hit_rate": round(hits / reads, 4) if reads else 0.0}
+
+
+def main(args):
+    trace = build_trace(args.seed, args.operations, args.write_ratio)
+    with TestClient(app) as client:
+        settings.PREDICATE_INVALIDATION = False
+        table_level = replay(client, trace)
+        settings.PREDICATE_INVALIDATION = True
+        predicate_aware = replay(client, trace)
+        client.delete("/cache")
+
+    print(f"table-level     : hit rate {table_level['hit_rate']:.1%} ({table_level['hits']}/{table_level['reads']})")
+    print(f"predicate-aware : hit rate {predicate_aware['hit_rate']:.1%} ({predicate_aware['hits']}/{predicate_aware['reads']})")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Predicate-aware invalidation replay")
+    parser.add_argument("--operations", type=int, default=5000)
+    parser.add_argument("--write-ratio", type=float, default=0.3)
+    parser.add_argument("--seed", type=int, default=42)
+    main(parser.parse_args())
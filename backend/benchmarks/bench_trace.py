@@ -0,0 +1,247 @@
+"""
+Trace-driven benchmark: replays a skewed mix of SELECTs and writes.
+
+The trace draws from a catalogue of reads on the seeded products, users and
+orders tables (point lookups, filters, aggregates, a join) with Zipfian
+popularity, mixed with UPDATEs sent through POST /write on equally skewed
+rows. The same trace is replayed at every concurrency level, each starting
+from an empty cache, against the app in-process (default; needs the seeded
+database and a reachable Redis) or against a running server with --url:
+
+    python -m benchmarks.bench_trace --operations 5000 --concurrency 1 16 64 --output trace.json
+    python -m benchmarks.bench_trace --url http://localhost:8000 --trace trace-ops.json
+    python -m benchmarks.bench_trace --backend sqlite --output trace-sqlite.json
+
+Reports throughput, p50/p95/p99 latency, hit rate and the SELECTs executed on
+the database (from /metrics). Results are written as JSON, tagged with the
+git commit, so runs can be diffed between commits. --save-trace and --trace
+keep the exact operation sequence for replaying later; --backend runs the
+in-process app on another cache backend (CACHE_BACKEND), so one trace
+compares them.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import time
+
+import httpx
+
+from benchmarks.load_test import percentile
+
+
+CATEGORIES = ["Electronics", "Audio", "Gaming", "Accessories", "Furniture", "Software"]
+COUNTRIES = ["USA", "Canada", "UK", "Germany", "France", "Spain", "Italy", "Poland", "Australia", "Japan"]
+PRODUCTS, USERS, ORDERS = 1000, 500, 5000
+
+DB_EXECUTIONS = "querycache_db_execution_seconds_count"
+
+
+def read_catalogue() -> list[str]:
+    reads = [
+        "SELECT category, COUNT(*), AVG(price) FROM products GROUP BY category",
+        "SELECT country, COUNT(*) FROM users GROUP BY country",
+        "SELECT COUNT(*) FROM orders",
+    ]
+    reads += [f"SELECT id, name, price FROM products WHERE category = '{c}'" for c in CATEGORIES]
+    reads += [f"SELECT * FROM users WHERE country = '{c}'" for c in COUNTRIES]
+    reads += [f"SELECT * FROM products WHERE id = {i}" for i in range(1, PRODUCTS + 1)]
+    reads += [f"SELECT * FROM users WHERE id = {i}" for i in range(1, USERS + 1)]
+    reads += [f"SELECT * FROM orders WHERE user_id = {i}" for i in range(1, USERS + 1)]
+    reads += [
+        "SELECT orders.id, orders.quantity, products.name FROM orders "
+        f"JOIN products ON products.id = orders.product_id WHERE orders.user_id = {i}"
+        for i in range(1, USERS + 1)
+    ]
+    return reads
+
+
+def zipf_sampler(rng: random.Random, count: int, skew: float):
+    """Draws 0..count-1 with probability proportional to 1 / (rank + 1) ** skew."""
+    cumulative = []
+    total = 0.0
+    for rank in range(1, count + 1):
+        total += 1 / rank ** skew
+        cumulative.append(total)
+    return lambda: rng.choices(range(count), cum_weights=cumulative)[0]
+
+
+def build_trace(seed: int, operations: int, write_ratio: float, skew: float) -> list[dict]:
+    rng = random.Random(seed)
+    reads = read_catalogue()
+    # Which query is hottest is random, not "whatever comes first".
+    rng.shuffle(reads)
+    next_read = zipf_sampler(rng, len(reads), skew)
+    rows = {
+        table: zipf_sampler(rng, count, skew)
+        for table, count in (("products", PRODUCTS), ("users", USERS), ("orders", ORDERS))
+    }
+
+    trace = []
+    for _ in range(operations):
+        if rng.random() >= write_ratio:
+            trace.append({"kind": "read", "sql": reads[next_read()]})
+            continue
+
+        table = rng.choice(("products", "products", "users", "orders"))
+        row_id = rows[table]() + 1
+        if table == "products":
+            sql = f"UPDATE products SET stock = {rng.randint(0, 150)} WHERE id = {row_id}"
+        elif table == "users":
+            sql = f"UPDATE users SET country = '{rng.choice(COUNTRIES)}' WHERE id = {row_id}"
+        else:
+            sql = f"UPDATE orders SET quantity = {rng.randint(1, 5)} WHERE id = {row_id}"
+        trace.append({"kind": "write", "sql": sql})
+    return trace
+
+
+async def db_executions(client: httpx.AsyncClient) -> int:
+    text = (await client.get("/metrics")).text
+    return int(sum(
+        float(line.rsplit(" ", 1)[1]) for line in text.splitlines()
+        if line.startswith(DB_EXECUTIONS)
+    ))
+
+
+async def run_level(client: httpx.AsyncClient, trace: list[dict], concurrency: int) -> dict:
+    await client.delete("/cache", params={"clear_db": "false"})
+    executions_before = await db_executions(client)
+
+    latencies = []
+    reads = hits = errors = 0
+    operations = iter(trace)
+
+    async def worker():
+        nonlocal reads, hits, errors
+        for operation in operations:
+            start = time.perf_counter()
+            try:
+                if operation["kind"] == "read":
+                    response = await client.get("/query", params={"sql": operation["sql"]})
+                else:
+                    response = await client.post("/write", params={"sql": operation["sql"]})
+                body = response.json()
+            except (httpx.HTTPError, ValueError):
+                errors += 1
+                continue
+            latencies.append((time.perf_counter() - start) * 1000)
+
+            if response.status_code != 200 or "error" in body:
+                errors += 1
+            elif operation["kind"] == "read":
+                reads += 1
+                hits += body.get("source") == "cache"
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    return {
+        "concurrency": concurrency,
+        "operations": len(trace),
+        "errors": errors,
+        "ops_per_sec": round(len(trace) / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 50), 2) if latencies else None,
+        "p95_ms": round(percentile(latencies, 95), 2) if latencies else None,
+        "p99_ms": round(percentile(latencies, 99), 2) if latencies else None,
+        "hit_rate": round(hits / reads, 4) if reads else 0.0,
+        "db_executions": await db_executions(client) - executions_before,
+    }
+
+
+async def wait_until_ready(client: httpx.AsyncClient, timeout: float = 60):
+    # /health is 503 while the startup warm-up runs.
+    deadline = time.monotonic() + timeout
+    while (await client.get("/health")).status_code != 200:
+        if time.monotonic() > deadline:
+            raise RuntimeError("QueryCache did not become healthy")
+        await asyncio.sleep(0.1)
+
+
+async def replay(args, trace: list[dict]) -> list[dict]:
+    limits = httpx.Limits(max_connections=max(args.concurrency), max_keepalive_connections=max(args.concurrency))
+    if args.url:
+        client = httpx.AsyncClient(base_url=args.url, limits=limits, timeout=60)
+        app = None
+    else:
+        if args.backend:
+            # Read by Settings when the app is first imported.
+            os.environ["CACHE_BACKEND"] = args.backend
+        from app.main import app
+
+        await app.router.startup()
+        client = httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=app), base_url="http://querycache", timeout=60
+        )
+
+    try:
+        await wait_until_ready(client)
+        results = []
+        for concurrency in args.concurrency:
+            result = await run_level(client, trace, concurrency)
+            results.append(result)
+            print(
+                f"c={concurrency:>4}  {result['ops_per_sec']:>8} ops/s  p50={result['p50_ms']:>7} ms  "
+                f"p95={result['p95_ms']:>7} ms  p99={result['p99_ms']:>7} ms  "
+                f"hit rate={result['hit_rate']:.1%}  db={result['db_executions']}  errors={result['errors']}"
+            )
+        return results
+    finally:
+        await client.aclose()
+        if app is not None:
+            await app.router.shutdown()
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(args):
+    if args.trace:
+        with open(args.trace) as f:
+            trace = json.load(f)
+    else:
+        trace = build_trace(args.seed, args.operations, args.write_ratio, args.skew)
+    if args.save_trace:
+        with open(args.save_trace, "w") as f:
+            json.dump(trace, f)
+
+    results = asyncio.run(replay(args, trace))
+
+    if args.output:
+        report = {
+            "commit": git_commit(),
+            "target": args.url or "in-process",
+            "backend": None if args.url else args.backend or os.environ.get("CACHE_BACKEND", "redis"),
+            "trace": args.trace or {
+                "seed": args.seed, "operations": args.operations,
+                "write_ratio": args.write_ratio, "skew": args.skew,
+            },
+            "results": results,
+        }
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="QueryCache trace-driven benchmark")
+    parser.add_argument("--url", help="benchmark a running server instead of the app in-process")
+    parser.add_argument(
+        "--backend", choices=["redis", "memory", "sqlite"], help="cache backend of the in-process app"
+    )
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 16, 64])
+    parser.add_argument("--operations", type=int, default=5000)
+    parser.add_argument("--write-ratio", type=float, default=0.05)
+    parser.add_argument("--skew", type=float, default=1.1, help="Zipf exponent of query and row popularity")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--trace", help="replay operations from this JSON file instead of generating them")
+    parser.add_argument("--save-trace", help="write the generated operations to this JSON file")
+    parser.add_argument("--output", help="write results as JSON to this file")
+    main(parser.parse_args())
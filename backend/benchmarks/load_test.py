@@ -0,0 +1,94 @@
+"""
+Load benchmark for GET /query.
+
+Fires a fixed number of requests at a running QueryCache server for each
+concurrency level and reports requests/sec plus p50/p99 latency. Run it once
+against the old build and once against the new one to compare:
+
+    uvicorn app.main:app --port 8000
+    python -m benchmarks.load_test --url http://localhost:8000 --concurrency 1 50 500
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+
+import httpx
+
+
+DEFAULT_QUERIES = [
+    "SELECT * FROM products WHERE id = 1",
+    "SELECT * FROM products WHERE category = 'Audio'",
+    "SELECT COUNT(*) FROM orders",
+    "SELECT * FROM users WHERE country = 'Poland'",
+]
+
+
+def percentile(samples: list[float], pct: float) -> float:
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+async def run_level(client: httpx.AsyncClient, queries: list[str], concurrency: int, total: int) -> dict:
+    latencies = []
+    errors = 0
+    counter = iter(range(total))
+
+    async def worker():
+        nonlocal errors
+        for i in counter:
+            sql = queries[i % len(queries)]
+            start = time.perf_counter()
+            try:
+                response = await client.get("/query", params={"sql": sql})
+                if response.status_code != 200 or "error" in response.json():
+                    errors += 1
+            except httpx.HTTPError:
+                errors += 1
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    return {
+        "concurrency": concurrency,
+        "requests": total,
+        "errors": errors,
+        "requests_per_sec": round(total / elapsed, 1),
+        "p50_ms": round(statistics.median(latencies), 2),
+        "p99_ms": round(percentile(latencies, 99), 2),
+    }
+
+
+async def main(args):
+    limits = httpx.Limits(max_connections=max(args.concurrency), max_keepalive_connections=max(args.concurrency))
+    async with httpx.AsyncClient(base_url=args.url, limits=limits, timeout=60) as client:
+        # Warm the cache so every level measures the same hit/miss mix.
+        for sql in DEFAULT_QUERIES:
+            await client.get("/query", params={"sql": sql})
+
+        results = []
+        for concurrency in args.concurrency:
+            total = max(args.requests, concurrency * 4)
+            result = await run_level(client, DEFAULT_QUERIES, concurrency, total)
+            results.append(result)
+            print(
+                f"c={result['concurrency']:>4}  {result['requests_per_sec']:>8} req/s  "
+                f"p50={result['p50_ms']:>8} ms  p99={result['p99_ms']:>8} ms  errors={result['errors']}"
+            )
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"url": args.url, "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="QueryCache /query load benchmark")
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 50, 500])
+    parser.add_argument("--requests", type=int, default=1000, help="requests per concurrency level")
+    parser.add_argument("--output", help="write results as JSON to this file")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,23 @@
+import os
+import shutil
+import tempfile
+
+import pytest
+
+# Settings are read when the app is first imported, so this runs before any
+# test module: the tests write, clear and install triggers on a throwaway
+# database instead of the development querycache.db.
+_database_dir = tempfile.mkdtemp(prefix="querycache-tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_database_dir, 'querycache.db')}"
+os.environ["CACHE_SQLITE_PATH"] = os.path.join(_database_dir, "querycache-cache.db")
+
+
+@pytest.fixture(scope="session", autouse=True)
+def seeded_database():
+    from app.core.database import engine
+    from app.core.seed_database import seed_database
+
+    seed_database()
+    yield
+    engine.dispose()
+    shutil.rmtree(_database_dir, ignore_errors=True)
@@ -3,6 +3,8 @@ import os
 
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'app'))
 
+import time
+
 import pytest
 from fastapi.testclient import TestClient
 from main import app
@@ -10,6 +12,19 @@ from main import app
 client = TestClient(app)
 
 
+@pytest.fixture(scope="module", autouse=True)
+def app_lifespan():
+    # Keep one event loop for the whole module so pooled async Redis
+    # connections are not shared across loops.
+    with client:
+        # /health is not ready until the startup warm-up has finished.
+        for _ in range(100):
+            if client.get("/health").status_code == 200:
+                break
+            time.sleep(0.05)
+        yield
+
+
 def test_root_endpoint():
     response = client.get("/")
     assert response.status_code == 200
@@ -106,4 +121,901 @@ def test_query_with_error():
     response = client.get("/query?sql=SELECT * FROM nonexistent_table")
     assert response.status_code == 200
     data = response.json()
-    assert "error" in data
\ No newline at end of file
+    assert "error" in data
+
+def test_l1_cache_serves_hits_and_follows_invalidation():
+    from app.services.local_cache import local_cache
+
+    sql = "SELECT * FROM products WHERE id=2"
+    client.delete("/cache?clear_db=false")
+    local_cache.enabled = True
+    try:
+        client.get(f"/query?sql={sql}")
+        hits_before = local_cache.hits
+
+        response = client.get(f"/query?sql={sql}")
+        assert response.json()["source"] == "cache"
+        assert local_cache.hits == hits_before + 1
+
+        client.post("/invalidate?sql=UPDATE products SET price=100 WHERE id=2")
+        response = client.get(f"/query?sql={sql}")
+        assert response.json()["source"] == "database"
+    finally:
+        local_cache.enabled = False
+        local_cache.clear()
+
+
+def test_l1_cache_evicts_least_recently_used():
+    from app.services.local_cache import LocalCache
+
+    cache = LocalCache(enabled=True, max_entries=2, max_bytes=1024)
+    cache.set("a", b"1", ttl=60)
+    cache.set("b", b"2", ttl=60)
+    cache.get("a")
+    cache.set("c", b"3", ttl=60)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == b"1"
+    assert cache.evictions == 1
+
+
+def test_cache_hits_are_flushed_in_batches():
+    from app.core.database import SessionLocal
+    from app.core.models import QueryCache
+    from app.services.hit_counter import hit_counter
+
+    sql = "SELECT * FROM products WHERE id=3"
+    client.delete("/cache?clear_db=true")
+    client.get(f"/query?sql={sql}")
+    client.get(f"/query?sql={sql}")
+    client.get(f"/query?sql={sql}")
+
+    assert sum(hit_counter.pending().values()) >= 2
+
+    client.portal.call(hit_counter.flush)
+    db = SessionLocal()
+    entry = db.query(QueryCache).filter(QueryCache.original_query == sql).first()
+    db.close()
+    assert entry.hits == 2
+    assert hit_counter.pending() == {}
+
+
+def test_concurrent_misses_execute_query_once(monkeypatch):
+    import asyncio
+    import time
+    from app.api import query
+
+    sql = "SELECT * FROM products WHERE id=4"
+    client.delete("/cache?clear_db=false")
+
+    executions = 0
+    run_select = query._run_select
+
+    def counting_run_select(*args):
+        nonlocal executions
+        executions += 1
+        time.sleep(0.05)
+        return run_select(*args)
+
+    monkeypatch.setattr(query, "_run_select", counting_run_select)
+
+    async def fire_misses():
+        return await asyncio.gather(*(query.execute_query(sql) for _ in range(200)))
+
+    import json
+    responses = [json.loads(response.body) for response in client.portal.call(fire_misses)]
+
+    assert executions == 1
+    assert all("error" not in response for response in responses)
+    assert all(response["result"] == responses[0]["result"] for response in responses)
+
+
+def test_stale_entry_is_served_and_refreshed_in_background():
+    import time
+    from app.services.cache_entry import pack_entry
+    from app.services.normalizer import query_key
+    from app.services.cache import cache_backend
+
+    sql = "SELECT * FROM products WHERE id=5"
+    client.delete("/cache?clear_db=false")
+    fresh = client.get(f"/query?sql={sql}").json()["result"]
+
+    async def make_stale():
+        query_hash = query_key(sql).query_hash
+        stale = pack_entry(b'[{"id": 5, "name": "stale"}]', 10, soft_ttl=0)
+        await cache_backend.set(query_hash, stale)
+
+    client.portal.call(make_stale)
+
+    response = client.get(f"/query?sql={sql}").json()
+    assert response["source"] == "cache"
+    assert response["result"] == [{"id": 5, "name": "stale"}]
+
+    for _ in range(50):
+        time.sleep(0.05)
+        response = client.get(f"/query?sql={sql}").json()
+        if response["result"] == fresh:
+            break
+    assert response["source"] == "cache"
+    assert response["result"] == fresh
+
+
+def test_xfetch_refreshes_early_only_near_expiry():
+    from app.services.cache_entry import CacheEntry, should_refresh
+
+    entry = CacheEntry(created_at=1000.0, delta_ms=50, soft_ttl=300, payload=b"[]")
+
+    assert not should_refresh(entry, now=1000.0)
+    assert should_refresh(entry, now=1300.0)
+
+
+def test_invalidate_unlinks_tagged_keys_only():
+    client.delete("/cache?clear_db=false")
+    client.get("/query?sql=SELECT * FROM products WHERE stock > 5")
+    client.get("/query?sql=SELECT COUNT(*) FROM products")
+    client.get("/query?sql=SELECT * FROM users WHERE id=1")
+
+    response = client.post("/invalidate?sql=UPDATE products SET stock=1")
+    assert response.json()["cache_keys_invalidated"] == 2
+
+    assert client.get("/query?sql=SELECT COUNT(*) FROM products").json()["source"] == "database"
+    assert client.get("/query?sql=SELECT * FROM users WHERE id=1").json()["source"] == "cache"
+
+
+def test_invalidate_skips_queries_on_other_rows():
+    category = client.get("/query?sql=SELECT category FROM products WHERE id=1").json()["result"][0]["category"]
+    other = "Software" if category != "Software" else "Audio"
+
+    client.delete("/cache?clear_db=false")
+    client.get("/query?sql=SELECT * FROM products WHERE id=6")
+    client.get("/query?sql=SELECT * FROM products WHERE id=7")
+    client.get(f"/query?sql=SELECT * FROM products WHERE category='{category}'")
+    client.get(f"/query?sql=SELECT * FROM products WHERE category='{other}'")
+
+    response = client.post("/invalidate?sql=UPDATE products SET price=999 WHERE id=1")
+    assert response.json()["cache_keys_invalidated"] == 1
+    assert response.json()["cache_keys_kept"] == 3
+
+    assert client.get(f"/query?sql=SELECT * FROM products WHERE category='{category}'").json()["source"] == "database"
+    assert client.get(f"/query?sql=SELECT * FROM products WHERE category='{other}'").json()["source"] == "cache"
+    assert client.get("/query?sql=SELECT * FROM products WHERE id=6").json()["source"] == "cache"
+
+
+def test_row_lookup_binds_values_and_falls_back_on_errors():
+    row = client.get("/query?sql=SELECT id, category FROM products WHERE id=12").json()["result"][0]
+    by_category = f"SELECT id FROM products WHERE category='{row['category']}'"
+
+    for write in (
+        "UPDATE products SET stock = :stock WHERE id = 12 AND category = :category",
+        "UPDATE products AS p SET stock = 3 WHERE p.id = 12",
+        "UPDATE products SET stock = 3 WHERE id = 12 AND no_such_column = 1",
+    ):
+        client.delete("/cache?clear_db=false")
+        client.get("/query", params={"sql": by_category})
+        response = client.post("/invalidate", params={"sql": write})
+        assert response.status_code == 200
+        assert response.json()["cache_keys_invalidated"] == 1
+        assert client.get("/query", params={"sql": by_category}).json()["source"] == "database"
+
+
+def test_write_predicates_ignore_comments_and_upserts():
+    from app.services.predicates import can_skip, select_predicates, write_predicates
+
+    table, predicates, set_columns = write_predicates(
+        "UPDATE products SET price=1 WHERE id=1 -- and category='Gaming'"
+    )
+    assert (table, predicates, set_columns) == ("products", {"id": {"eq": [1]}}, ["price"])
+    assert not can_skip({"category": {"eq": ["Audio"]}}, predicates, set_columns)
+    assert select_predicates("SELECT * FROM products /* WHERE id=2 */ WHERE stock > -1") == \
+        {"stock": {"range": [-1, False, None, False]}}
+
+    for sql in (
+        "INSERT OR REPLACE INTO products (id, category) VALUES (1, 'Gaming')",
+        "REPLACE INTO products (id, category) VALUES (1, 'Gaming')",
+        "INSERT INTO products (id, category) VALUES (1, 'Gaming') ON CONFLICT (id) DO UPDATE SET category='Gaming'",
+        "INSERT INTO products (id, category) VALUES (1, 'Gaming') ON DUPLICATE KEY UPDATE category='Gaming'",
+    ):
+        assert write_predicates(sql) is None
+
+
+def test_cache_clear_leaves_foreign_keys_alone():
+    import time
+    from app.services.cache import cache_backend
+
+    client.portal.call(cache_backend.redis.set, "other-app:key", "keep")
+    client.get("/query?sql=SELECT * FROM products WHERE id=8")
+
+    response = client.delete("/cache?background=true")
+    job_url = response.json()["status_url"]
+
+    for _ in range(50):
+        job = client.get(job_url).json()
+        if job["status"] != "running":
+            break
+        time.sleep(0.05)
+
+    assert job["status"] == "finished"
+    assert job["redis_keys_deleted"] >= 2
+    assert client.portal.call(cache_backend.redis.get, "other-app:key") == "keep"
+    client.portal.call(cache_backend.redis.delete, "other-app:key")
+
+
+def test_normalization_preserves_literal_case():
+    from app.services.normalizer import normalize_query
+
+    assert normalize_query("SELECT * FROM products WHERE category = 'Audio'") != \
+        normalize_query("SELECT * FROM products WHERE category = 'audio'")
+    assert normalize_query("select * from PRODUCTS where category='Audio' -- hot") == \
+        normalize_query("SELECT  *  FROM products /* dashboard */ WHERE category = 'Audio';")
+
+
+def test_parse_finds_tables_in_ctes_subqueries_and_comma_joins():
+    sql = (
+        "WITH recent AS (SELECT * FROM orders WHERE id > 10) "
+        "SELECT * FROM recent, main.\"Users\" u "
+        "WHERE u.id IN (SELECT user_id FROM products p JOIN orders o ON o.product_id = p.id)"
+    )
+    response = client.get("/parse", params={"sql": sql})
+    assert sorted(response.json()["tables"]) == ["Users", "orders", "products"]
+
+
+def test_parse_finds_tables_after_join_conditions_and_update_from():
+    from app.services.sql_parser import extract_tables
+
+    assert extract_tables("SELECT a.x FROM a LEFT JOIN b ON a.id=b.id, c") == ["a", "b", "c"]
+    assert extract_tables("SELECT * FROM a JOIN (SELECT * FROM b) s USING (id), c WHERE c.id = a.id") == ["a", "b", "c"]
+    assert extract_tables("UPDATE products SET price = o.price FROM orders o WHERE o.product_id = products.id") == \
+        ["products", "orders"]
+    assert extract_tables("UPDATE products SET updated = EXTRACT(YEAR FROM now())") == ["products"]
+
+
+def test_parse_keeps_quoted_table_names_as_written():
+    from app.services.sql_parser import extract_tables
+
+    assert extract_tables('SELECT * FROM "Products" JOIN products ON 1 = 1') == ["Products", "products"]
+    assert extract_tables('SELECT * FROM "products"') == ["products"]
+
+
+def test_literals_share_a_template_but_not_a_result():
+    from app.services.normalizer import query_key
+
+    first = query_key("SELECT * FROM products WHERE id = 1")
+    second = query_key("select * from products where id=2")
+    assert first.template == second.template
+    assert first.query_hash != second.query_hash
+
+    client.delete("/cache?clear_db=false")
+    assert client.get("/query?sql=SELECT * FROM products WHERE id = 1").json()["result"][0]["id"] == 1
+    assert client.get("/query?sql=SELECT * FROM products WHERE id = 2").json()["result"][0]["id"] == 2
+    response = client.get("/query?sql=SELECT * FROM products WHERE name = 'a:b'").json()
+    assert response["result"] == []
+
+
+def test_explicit_bind_parameters():
+    client.delete("/cache?clear_db=false")
+    sql = "SELECT * FROM products WHERE id = :id"
+
+    response = client.get("/query", params={"sql": sql, "params": '{"id": 3}'}).json()
+    assert response["source"] == "database"
+    assert response["result"][0]["id"] == 3
+
+    response = client.get("/query", params={"sql": sql, "params": '{"id": 3}'}).json()
+    assert response["source"] == "cache"
+
+    response = client.get("/query", params={"sql": sql, "params": '{"id": 4}'}).json()
+    assert response["source"] == "database"
+    assert response["result"][0]["id"] == 4
+
+    response = client.get("/query", params={"sql": sql, "params": "[4]"}).json()
+    assert "error" in response
+
+
+def test_invalidate_template_family():
+    client.delete("/cache?clear_db=false")
+    client.get("/query?sql=SELECT * FROM products WHERE id = 1")
+    client.get("/query?sql=SELECT * FROM products WHERE id = 2")
+    client.get("/query?sql=SELECT * FROM users WHERE id = 1")
+
+    response = client.post("/invalidate/template?sql=SELECT * FROM products WHERE id = 99")
+    assert response.json()["cache_keys_invalidated"] == 2
+    assert client.get("/query?sql=SELECT * FROM products WHERE id = 1").json()["source"] == "database"
+    assert client.get("/query?sql=SELECT * FROM users WHERE id = 1").json()["source"] == "cache"
+
+
+def test_query_metadata_stores_values_the_response_can_encode():
+    import json
+    from datetime import date
+    from decimal import Decimal
+    from app.api.query import _save_query_metadata
+    from app.core.database import db_session
+    from app.core.models import QueryCache
+
+    _save_query_metadata("metadata-test", "SELECT 1", [{"price": Decimal("1.50"), "day": date(2026, 1, 2)}])
+    with db_session() as db:
+        entry = db.query(QueryCache).filter(QueryCache.query_hash == "metadata-test").one()
+        assert json.loads(entry.cached_result) == [{"price": "1.50", "day": "2026-01-02"}]
+        db.delete(entry)
+        db.commit()
+
+
+@pytest.mark.parametrize("compression, module, tag", [
+    ("none", None, b"C"), ("zstd", "zstandard", b"Z"), ("lz4", "lz4.frame", b"L"),
+])
+def test_columnar_encoding_round_trips(monkeypatch, compression, module, tag):
+    from app.core.config import settings
+    from app.services.result_codec import decode_rows, encode_rows
+
+    if module:
+        # Without the library the value is stored uncompressed.
+        pytest.importorskip(module)
+    monkeypatch.setattr(settings, "CACHE_COMPRESSION", compression)
+    monkeypatch.setattr(settings, "CACHE_COMPRESSION_THRESHOLD", 0)
+    rows = [{"id": i, "name": f"Product {i % 7}", "price": i * 1.5, "note": None} for i in range(500)]
+
+    encoded = encode_rows(rows, "columnar")
+    assert encoded[:1] == tag
+    assert decode_rows(encoded) == rows
+    assert len(encoded) < len(encode_rows(rows, "json"))
+    assert decode_rows(encode_rows(rows, "json")) == rows
+    assert decode_rows(encode_rows([], "columnar")) == []
+
+
+def test_cache_hit_as_msgpack(monkeypatch):
+    import msgpack
+    from app.core.config import settings
+
+    monkeypatch.setattr(settings, "CACHE_VALUE_FORMAT", "columnar")
+    sql = "SELECT id, name FROM products WHERE id < 4"
+    client.delete("/cache?clear_db=false")
+    rows = client.get("/query", params={"sql": sql}).json()["result"]
+
+    response = client.get("/query", params={"sql": sql}, headers={"Accept": "application/x-msgpack"})
+    assert response.headers["content-type"] == "application/x-msgpack"
+    body = msgpack.unpackb(response.content)
+    assert body["source"] == "cache"
+    assert body["result"]["columns"] == ["id", "name"]
+    assert [dict(zip(body["result"]["columns"], values)) for values in zip(*body["result"]["data"])] == rows
+
+
+@pytest.mark.parametrize("value_format", ["json", "columnar"])
+def test_cache_hit_body_matches_json_response(monkeypatch, value_format):
+    import json
+    from fastapi.responses import JSONResponse
+    from app.core.config import settings
+
+    monkeypatch.setattr(settings, "CACHE_VALUE_FORMAT", value_format)
+    sql = "SELECT * FROM products WHERE price > 10.5 -- café"
+    client.delete("/cache?clear_db=false")
+
+    miss = client.get("/query", params={"sql": sql})
+    hit = client.get("/query", params={"sql": sql})
+    assert hit.json()["source"] == "cache"
+
+    for response in (miss, hit):
+        assert response.content == JSONResponse(json.loads(response.content)).body
+    assert hit.json()["result"] == miss.json()["result"]
+
+
+def test_stream_query_fills_cache():
+    import json
+
+    sql = "SELECT * FROM orders"
+    client.delete("/cache?clear_db=false")
+
+    response = client.get("/query/stream", params={"sql": sql})
+    assert response.headers["x-cache-source"] == "database"
+    streamed = [json.loads(line) for line in response.text.splitlines()]
+
+    cached = client.get("/query", params={"sql": sql}).json()
+    assert cached["source"] == "cache"
+    assert cached["result"] == streamed
+
+    response = client.get("/query/stream", params={"sql": sql, "format": "json"})
+    assert response.headers["x-cache-source"] == "cache"
+    assert response.json() == streamed
+
+
+def test_stream_query_reports_errors_before_streaming():
+    sql = "SELECT * FROM no_such_table"
+    for fmt in ("ndjson", "json"):
+        response = client.get("/query/stream", params={"sql": sql, "format": fmt})
+        assert response.status_code == 200
+        assert response.headers["content-type"] == "application/json"
+        assert response.json()["query"] == sql
+        assert "no_such_table" in response.json()["error"]
+
+
+def test_stream_query_skips_caching_past_cutoff(monkeypatch):
+    from app.core.config import settings
+
+    monkeypatch.setattr(settings, "STREAM_CHUNK_ROWS", 2)
+    monkeypatch.setattr(settings, "STREAM_MAX_CACHEABLE_BYTES", 10)
+    sql = "SELECT * FROM products"
+    client.delete("/cache?clear_db=false")
+
+    response = client.get("/query/stream", params={"sql": sql, "format": "json"})
+    assert response.json() == client.get("/query", params={"sql": sql}).json()["result"]
+    assert client.get("/query", params={"sql": sql}).json()["source"] == "cache"
+
+    client.delete("/cache?clear_db=false")
+    client.get("/query/stream", params={"sql": sql})
+    assert client.get("/query", params={"sql": sql}).json()["source"] == "database"
+
+
+def test_database_pool_settings_and_metrics():
+    from sqlalchemy import text
+    from app.core.config import settings
+    from app.core.database import engine
+
+    assert engine.pool.size() == settings.DB_POOL_SIZE
+    with engine.connect() as connection:
+        assert connection.execute(text("PRAGMA journal_mode")).scalar() == "wal"
+        assert connection.execute(text("PRAGMA synchronous")).scalar() == 1  # NORMAL
+
+    pool = client.get("/stats").json()["db_pool"]
+    assert pool["checkouts"] > 0
+    assert pool["checked_out"] <= pool["peak_checked_out"]
+    assert 0 <= pool["saturation"] <= 1
+
+
+def test_batch_query_mixes_hits_and_misses():
+    client.delete("/cache?clear_db=false")
+    client.get("/query?sql=SELECT * FROM products WHERE id = 1")
+
+    response = client.post("/query/batch", json={"queries": [
+        {"sql": "SELECT * FROM products WHERE id = 1"},
+        {"sql": "SELECT * FROM products WHERE id = :id", "params": {"id": 2}},
+        {"sql": "select * from products where id = 2"},
+        {"sql": "DELETE FROM products"},
+        {"sql": "SELECT * FROM no_such_table"},
+    ]}).json()
+
+    first, second, third, delete, broken = response["results"]
+    assert first["source"] == "cache" and first["result"][0]["id"] == 1
+    assert second["source"] == "database" and second["result"][0]["id"] == 2
+    assert third["source"] == "database" and third["result"] == second["result"]
+    assert "error" in delete and "error" in broken
+    assert all("execution_time_ms" in result for result in (first, second, third))
+
+    again = client.post("/query/batch", json={"queries": [
+        {"sql": "SELECT * FROM products WHERE id = 2"},
+    ]}).json()
+    assert again["results"][0]["source"] == "cache"
+
+
+def test_batch_query_reports_stale_fills_per_item(monkeypatch):
+    from app.services.cache import cache_backend
+    from app.services.normalizer import query_key
+
+    client.delete("/cache?clear_db=false")
+    stale = query_key("SELECT * FROM products WHERE id = 14").query_hash
+    table_versions = cache_backend.table_versions
+
+    async def versions_before_a_write(tables, key=None):
+        versions = await table_versions(tables, key)
+        return {table: version - 1 for table, version in versions.items()} if key == stale else versions
+
+    monkeypatch.setattr(cache_backend, "table_versions", versions_before_a_write)
+    response = client.post("/query/batch", json={"queries": [
+        {"sql": "SELECT * FROM products WHERE id = 13"},
+        {"sql": "SELECT * FROM products WHERE id = 14"},
+    ]}).json()
+    fresh, stale_result = response["results"]
+    assert "not_cached" not in fresh
+    assert stale_result["not_cached"] == "stale"
+
+    again = client.post("/query/batch", json={"queries": [
+        {"sql": "SELECT * FROM products WHERE id = 13"},
+        {"sql": "SELECT * FROM products WHERE id = 14"},
+    ]}).json()
+    assert [result["source"] for result in again["results"]] == ["cache", "database"]
+
+
+def test_warmup_replays_recorded_queries():
+    from app.api import warmup
+
+    client.delete("/cache?clear_db=true")
+    client.get("/query?sql=SELECT * FROM products WHERE id = 11")
+    client.get("/query?sql=SELECT * FROM users WHERE id = 11")
+    client.get("/query", params={"sql": "SELECT * FROM users WHERE id = :id", "params": '{"id": 1}'})
+    client.delete("/cache?clear_db=false")
+
+    job = client.post("/warmup?score=decayed").json()
+    assert job["status"] == "finished"
+    assert job["warmed"] == 2
+    assert job["skipped"] == 1
+    assert client.get("/query?sql=SELECT * FROM products WHERE id = 11").json()["source"] == "cache"
+    assert client.post("/warmup").json()["already_cached"] == 2
+
+    warmup.warmup_job["status"] = "running"
+    try:
+        assert client.get("/health").status_code == 503
+    finally:
+        warmup.warmup_job["status"] = "finished"
+
+
+def test_warmup_ranks_by_decayed_hits_in_the_database():
+    from datetime import datetime, timedelta
+    from app.api import warmup
+    from app.core.database import db_session
+    from app.core.models import QueryCache
+
+    client.delete("/cache?clear_db=true")
+    now = datetime.now()
+    with db_session() as db:
+        db.add_all([
+            QueryCache(query_hash="old", original_query="SELECT 1", cached_result="[]",
+                       hits=1000, created_at=now - timedelta(days=30)),
+            QueryCache(query_hash="new", original_query="SELECT 2", cached_result="[]",
+                       hits=10, created_at=now - timedelta(hours=1)),
+        ])
+        db.commit()
+    try:
+        assert warmup._load_candidates(2, "hits") == ["SELECT 1", "SELECT 2"]
+        assert warmup._load_candidates(1, "decayed") == ["SELECT 2"]
+    finally:
+        client.delete("/cache?clear_db=true")
+
+
+def test_warmup_counts_only_stored_fills(monkeypatch):
+    from app.api import warmup
+
+    client.delete("/cache?clear_db=true")
+    client.get("/query?sql=SELECT * FROM products WHERE id = 11")
+    client.get("/query?sql=SELECT * FROM users WHERE id = 11")
+    client.delete("/cache?clear_db=false")
+
+    async def held_elsewhere(key, sql):
+        return False
+
+    monkeypatch.setattr(warmup, "refill", held_elsewhere)
+    job = client.post("/warmup").json()
+    assert (job["warmed"], job["not_cached"]) == (0, 2)
+
+
+def test_write_through_commits_and_invalidates():
+    sql = "SELECT id, stock FROM products WHERE id = 12"
+    client.delete("/cache?clear_db=false")
+    client.get("/query", params={"sql": sql})
+
+    response = client.post("/write", params={
+        "sql": "UPDATE products SET stock = :stock WHERE id = 12", "params": '{"stock": 7}'
+    }).json()
+    assert response["rows_affected"] == 1
+    assert response["cache_keys_invalidated"] == 1
+
+    fresh = client.get("/query", params={"sql": sql}).json()
+    assert fresh["source"] == "database"
+    assert fresh["result"] == [{"id": 12, "stock": 7}]
+
+    assert "error" in client.post("/write?sql=SELECT * FROM products").json()
+
+
+def test_write_through_reports_a_failed_invalidation(monkeypatch):
+    from app.api import invalidate
+
+    async def fail(sql):
+        raise RuntimeError("invalidation failed")
+
+    sql = "SELECT id, stock FROM products WHERE id = 12"
+    client.delete("/cache?clear_db=false")
+    client.get("/query", params={"sql": sql})
+
+    monkeypatch.setattr(invalidate, "invalidate_write", fail)
+    response = client.post("/write", params={"sql": "UPDATE products SET stock = 8 WHERE id = 12"})
+    assert response.status_code == 200
+    assert response.json()["rows_affected"] == 1
+    assert response.json()["invalidation_error"] == "invalidation failed"
+    assert response.json()["cache_keys_invalidated"] == 1
+
+    fresh = client.get("/query", params={"sql": sql}).json()
+    assert fresh["source"] == "database"
+    assert fresh["result"] == [{"id": 12, "stock": 8}]
+
+
+def test_fill_started_before_a_write_is_discarded(monkeypatch):
+    import redis as sync_redis
+    from app.api import query
+    from app.services.redis_service import version_key
+
+    sql = "SELECT id, stock FROM products WHERE id = 13"
+    client.delete("/cache?clear_db=false")
+    run_select = query._run_select
+
+    def run_select_then_write(*args):
+        rows = run_select(*args)
+        # A write lands after the rows were read but before they are cached.
+        sync_redis.Redis().incr(version_key("products"))
+        return rows
+
+    monkeypatch.setattr(query, "_run_select", run_select_then_write)
+    assert client.get("/query", params={"sql": sql}).json()["source"] == "database"
+
+    monkeypatch.setattr(query, "_run_select", run_select)
+    assert client.get("/query", params={"sql": sql}).json()["source"] == "database"
+    assert client.get("/query", params={"sql": sql}).json()["source"] == "cache"
+
+
+def test_change_capture_invalidates_external_writes():
+    from sqlalchemy import text
+    from app.core.database import engine
+    from app.services.change_capture import SQLiteTriggerSource, apply_changes
+
+    source = SQLiteTriggerSource()
+    source.install(["products", "users"])
+    try:
+        client.portal.call(apply_changes, source)
+
+        sql = "SELECT id, stock FROM products WHERE id = 14"
+        client.delete("/cache?clear_db=false")
+        client.get("/query", params={"sql": sql})
+        client.get("/query?sql=SELECT * FROM users WHERE id = 14")
+
+        # Another service writes straight to the database, several times.
+        with engine.begin() as connection:
+            for stock in (1, 2, 3):
+                connection.execute(text("UPDATE products SET stock = :stock WHERE id = 14"), {"stock": stock})
+            assert connection.execute(text("SELECT COUNT(*) FROM querycache_change_log")).scalar() == 1
+
+        assert client.portal.call(apply_changes, source) == ["products"]
+        assert client.portal.call(apply_changes, source) == []
+
+        fresh = client.get("/query", params={"sql": sql}).json()
+        assert fresh["source"] == "database"
+        assert fresh["result"] == [{"id": 14, "stock": 3}]
+        assert client.get("/query?sql=SELECT * FROM users WHERE id = 14").json()["source"] == "cache"
+    finally:
+        source.uninstall(["products", "users"])
+        with engine.connect() as connection:
+            assert not connection.execute(text(
+                "SELECT name FROM sqlite_master WHERE type = 'trigger' AND name LIKE 'querycache_cdc_%'"
+            )).all()
+
+
+def test_admission_refuses_large_and_over_budget_entries(monkeypatch):
+    from app.core.config import settings
+
+    sql = "SELECT * FROM products"
+    client.delete("/cache?clear_db=false")
+
+    monkeypatch.setattr(settings, "CACHE_MAX_ENTRY_BYTES", 10)
+    response = client.get("/query", params={"sql": sql}).json()
+    assert response["not_cached"] == "entry_too_large"
+    assert client.get("/query", params={"sql": sql}).json()["source"] == "database"
+
+    monkeypatch.setattr(settings, "CACHE_MAX_ENTRY_BYTES", 0)
+    monkeypatch.setattr(settings, "CACHE_BYTE_BUDGET", 10)
+    assert client.get("/query", params={"sql": sql}).json()["not_cached"] == "over_byte_budget"
+
+    monkeypatch.setattr(settings, "CACHE_BYTE_BUDGET", 0)
+    response = client.get("/query", params={"sql": sql}).json()
+    assert "not_cached" not in response
+    assert client.get("/query", params={"sql": sql}).json()["source"] == "cache"
+
+
+def test_fills_over_the_byte_budget_evict_older_entries(monkeypatch):
+    from app.core.config import settings
+    from app.services.cache import cache_backend
+
+    monkeypatch.setattr(settings, "CACHE_MAX_ENTRY_BYTES", 0)
+    client.delete("/cache?clear_db=false")
+    first, second = "SELECT * FROM products WHERE id = 21", "SELECT * FROM products WHERE id = 22"
+    client.get("/query", params={"sql": first})
+    size = client.portal.call(cache_backend.cached_bytes)
+
+    # Room for one entry: the second evicts the first instead of being refused.
+    monkeypatch.setattr(settings, "CACHE_BYTE_BUDGET", size * 3 // 2)
+    assert "not_cached" not in client.get("/query", params={"sql": second}).json()
+    assert client.get("/query", params={"sql": second}).json()["source"] == "cache"
+    assert client.portal.call(cache_backend.cached_bytes) <= size * 3 // 2
+    assert client.get("/query", params={"sql": first}).json()["source"] == "database"
+
+
+def test_admission_by_cost_counts_misses(monkeypatch):
+    from app.api import query
+    from app.core.config import settings
+
+    monkeypatch.setattr(settings, "CACHE_ADMISSION_MIN_COST_MS", 1000)
+    run_select = query._run_select
+
+    def slow_run_select(template, params):
+        time.sleep(0.3)
+        return run_select(template, params)
+
+    monkeypatch.setattr(query, "_run_select", slow_run_select)
+    sql = "SELECT * FROM users WHERE id = 2"
+    client.delete("/cache?clear_db=false")
+
+    # ~300 ms per miss: worth caching from the fourth miss in the window.
+    for _ in range(3):
+        assert client.get("/query", params={"sql": sql}).json()["not_cached"] == "below_admission_cost"
+    assert "not_cached" not in client.get("/query", params={"sql": sql}).json()
+    assert client.get("/query", params={"sql": sql}).json()["source"] == "cache"
+
+
+def test_stats_reports_bytes_of_cached_entries():
+    client.delete("/cache?clear_db=false")
+    assert client.get("/stats").json()["cache_bytes"] == 0
+
+    client.get("/query", params={"sql": "SELECT * FROM orders"})
+    stored = client.get("/stats").json()["cache_bytes"]
+    assert stored > 0
+
+    client.get("/query", params={"sql": "SELECT * FROM orders WHERE id = 1"})
+    assert client.get("/stats").json()["cache_bytes"] > stored
+
+    client.post("/invalidate", params={"sql": "UPDATE orders SET status = 'shipped'"})
+    assert client.get("/stats").json()["cache_bytes"] == 0
+
+
+def test_metrics_endpoint_counts_and_times_requests():
+    from app.core.config import settings
+
+    def sample(text, series):
+        for line in text.splitlines():
+            if line.startswith(series + " "):
+                return float(line.rsplit(" ", 1)[1])
+        return 0.0
+
+    sql = "SELECT * FROM orders WHERE id = 3"
+    client.delete("/cache?clear_db=false")
+    before = client.get("/metrics").text
+
+    client.get("/query", params={"sql": sql})
+    client.get("/query", params={"sql": sql})
+    client.post("/invalidate", params={"sql": "UPDATE orders SET status = 'shipped' WHERE id = 3"})
+
+    response = client.get("/metrics")
+    assert response.headers["content-type"].startswith("text/plain")
+    after = response.text
+
+    def delta(series):
+        return sample(after, series) - sample(before, series)
+
+    # Requests are only made here, so their counts are exact. Cache and DB
+    # counters are process-wide: background refreshes and change capture
+    # may add to them while the test runs.
+    assert delta('querycache_request_seconds_count{source="database",table="orders"}') == 1
+    assert delta('querycache_request_seconds_count{source="cache",table="orders"}') == 1
+    assert delta('querycache_request_seconds_bucket{source="cache",table="orders",le="+Inf"}') == 1
+    assert delta('querycache_cache_misses_total{table="orders"}') >= 1
+    assert delta('querycache_cache_fills_total{table="orders"}') >= 1
+    assert delta(f'querycache_cache_hits_total{{layer="{settings.CACHE_BACKEND}",table="orders"}}') >= 1
+    assert delta('querycache_invalidations_total{table="orders"}') >= 1
+    assert delta('querycache_db_execution_seconds_count{table="orders"}') >= 1
+    assert sample(after, 'querycache_redis_seconds_count{operation="get"}') >= 2
+    assert 'querycache_evictions_total{cache="l1"}' in after
+
+
+def test_trace_header_reports_stage_timings():
+    sql = "SELECT * FROM users WHERE id = 4"
+    client.delete("/cache?clear_db=false")
+    trace = {"X-QueryCache-Trace": "1"}
+
+    def stages(response):
+        return {part.split(";")[0] for part in response.headers["server-timing"].split(", ")}
+
+    miss = client.get("/query", params={"sql": sql}, headers=trace)
+    assert {"normalize", "hash", "redis_get", "db_execute", "row_conversion", "encode",
+            "redis_set", "metadata_commit", "response", "total"} <= stages(miss)
+
+    hit = client.get("/query", params={"sql": sql}, headers=trace)
+    assert {"redis_get", "response", "total"} <= stages(hit)
+    assert "db_execute" not in stages(hit)
+    assert hit.json()["execution_time_ms"] != 2
+
+    assert "server-timing" not in client.get("/query", params={"sql": sql}).headers
+
+    response = client.post(
+        "/invalidate", params={"sql": "UPDATE users SET country = 'Japan' WHERE id = 4"}, headers=trace
+    )
+    assert {"parse", "bump_versions", "dependents", "unlink", "total"} <= stages(response)
+
+
+def test_slowest_requests_are_profiled(monkeypatch):
+    from app.core.config import settings
+    from app.services.tracing import slowest_profiles
+
+    monkeypatch.setattr(settings, "TRACE_PROFILE_SLOWEST", 2)
+    monkeypatch.setattr(settings, "TRACE_STAGES", True)
+    client.delete("/cache?clear_db=false")
+    for i in range(1, 5):
+        client.get("/query", params={"sql": f"SELECT * FROM products WHERE id = {i}"})
+
+    profiles = client.get("/debug/profiles").json()["profiles"]
+    assert len(profiles) == 2
+    assert profiles[0]["total_ms"] >= profiles[1]["total_ms"]
+    assert profiles[0]["query"].startswith("SELECT * FROM products")
+    assert "function calls" in profiles[0]["profile"]
+    assert profiles[0]["profile_scope"] == "db_threads" and profiles[0]["profiled_calls"] >= 1
+    assert "_run_select" in profiles[0]["profile"]
+    assert 'querycache_stage_seconds_count{endpoint="/query",stage="redis_get"}' in client.get("/metrics").text
+    slowest_profiles._heap.clear()
+
+
+def test_stats_are_served_from_running_totals():
+    from sqlalchemy import event
+    from app.core.database import engine
+
+    client.delete("/cache?clear_db=true")
+    for sql, hits in [("SELECT * FROM users WHERE id = 7", 3), ("SELECT * FROM users WHERE id = 8", 1)]:
+        for _ in range(hits + 1):
+            client.get("/query", params={"sql": sql})
+
+    statements = []
+
+    def record(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", record)
+    try:
+        stats = client.get("/stats").json()
+    finally:
+        event.remove(engine, "before_cursor_execute", record)
+
+    assert statements == []
+    assert stats["total_queries"] == 2
+    assert stats["total_hits"] == 4
+    assert [(q["query"], q["hits"]) for q in stats["top_queries"]] == [
+        ("SELECT * FROM users WHERE id = 7", 3), ("SELECT * FROM users WHERE id = 8", 1),
+    ]
+    assert stats["hit_rate"]["last_minute"]["hits"] >= 4
+    assert stats["hit_rate"]["last_hour"]["misses"] >= 2
+
+
+def test_top_queries_survive_with_few_counters():
+    from app.services.query_stats import QueryStats
+
+    stats = QueryStats(capacity=3)
+    for query_hash, hits in [("a", 50), ("b", 30), ("c", 2), ("d", 1), ("e", 1), ("b", 5)]:
+        for _ in range(hits):
+            stats.record_hit(query_hash)
+
+    top = stats.top(2)
+    assert [(query_hash, hits) for query_hash, hits, _ in top] == [("a", 50), ("b", 35)]
+    assert stats.total_hits == 89
+
+
+def test_hit_rate_windows_forget_old_requests():
+    from app.services.query_stats import Window
+
+    window = Window(60, 60)
+    window.record(True, now=1000.0)
+    window.record(False, now=1030.0)
+    window.record(True, now=1059.5)
+
+    assert window.totals(now=1059.9) == {"hits": 2, "misses": 1, "hit_rate": 0.6667}
+    assert window.totals(now=1075.0) == {"hits": 1, "misses": 1, "hit_rate": 0.5}
+    assert window.totals(now=2000.0) == {"hits": 0, "misses": 0, "hit_rate": None}
+
+
+def test_migrations_index_an_existing_query_cache(tmp_path):
+    from sqlalchemy import create_engine, inspect, text
+    from app.core.migrations import migrate
+
+    old = create_engine(f"sqlite:///{tmp_path / 'old.db'}")
+    with old.begin() as connection:
+        connection.execute(text(
+            "CREATE TABLE query_cache (id INTEGER PRIMARY KEY, query_hash VARCHAR UNIQUE NOT NULL, "
+            "original_query VARCHAR NOT NULL, cached_result VARCHAR NOT NULL, created_at DATETIME, hits INTEGER)"
+        ))
+
+        connection.execute(text(
+            "CREATE TABLE table_query_mapping (id INTEGER PRIMARY KEY, table_name VARCHAR NOT NULL, "
+            "query_hash VARCHAR NOT NULL, created_at DATETIME)"
+        ))
+        connection.execute(text(
+            "INSERT INTO table_query_mapping (table_name, query_hash) VALUES ('products', 'a'), ('products', 'a')"
+        ))
+
+    assert migrate(old) == ["0001_index_query_cache_hits", "0002_index_table_query_mapping"]
+    assert "ix_query_cache_hits" in {index["name"] for index in inspect(old).get_indexes("query_cache")}
+    mapping_indexes = {index["name"]: index["unique"] for index in inspect(old).get_indexes("table_query_mapping")}
+    assert mapping_indexes == {
+        "ix_table_query_mapping_table_name": False,
+        "uq_table_query_mapping_table_name_query_hash": True,
+    }
+    with old.connect() as connection:
+        assert connection.execute(text("SELECT COUNT(*) FROM table_query_mapping")).scalar() == 1
+    assert migrate(old) == []
+    old.dispose()
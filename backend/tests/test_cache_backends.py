@@ -0,0 +1,144 @@
+import asyncio
+import json
+
+import pytest
+import redis.asyncio as redis
+
+from app.services.cache_backend import query_hash_from_key
+from app.services.memory_backend import MemoryBackend
+from app.services.redis_service import RedisService
+from app.services.sqlite_backend import SQLiteBackend
+
+
+def item(key: str, tags=("products",), **options) -> dict:
+    return {"key": key, "value": f"value-{key}".encode(), "tags": list(tags), **options}
+
+
+@pytest.fixture(params=["redis", "memory", "sqlite"])
+def make_backend(request, tmp_path):
+    def make():
+        if request.param == "redis":
+            return RedisService(
+                redis.Redis(decode_responses=True), redis.Redis(), prefix="querycache-backend-test:"
+            )
+        if request.param == "memory":
+            return MemoryBackend()
+        return SQLiteBackend(str(tmp_path / "cache.db"))
+
+    return make
+
+
+def test_backends_store_tag_and_invalidate_alike(make_backend):
+    async def scenario():
+        backend = make_backend()
+        await backend.clear_namespace(100)
+        predicates = json.dumps({"id": {"eq": [1]}})
+
+        assert await backend.set_many([
+            item("a", predicates=predicates), item("b", template="t1"), item("c", tags=("users",)),
+        ]) == ["a", "b", "c"]
+        assert await backend.get("a") == b"value-a"
+        assert await backend.mget(["a", "missing", "c"]) == [b"value-a", None, b"value-c"]
+        value, ttl = await backend.get_with_ttl("b")
+        assert value == b"value-b" and 0 < ttl <= 900
+        assert sorted([key async for key in backend.scan(2)]) == ["a", "b", "c"]
+        assert await backend.cached_bytes() == 3 * len(b"value-a")
+
+        members, stored_predicates = await backend.get_dependents("products")
+        assert sorted(map(query_hash_from_key, members)) == ["a", "b"]
+        assert list(stored_predicates.values()) == [predicates]
+        a_key = next(iter(stored_predicates))
+        assert await backend.unlink_dependents("products", [a_key]) == 1
+        assert await backend.get("a") is None
+
+        assert await backend.invalidate_tags(["template:t1"]) == 1
+        assert await backend.invalidate_tags(["products"]) == 0
+        assert await backend.get("c") == b"value-c"
+        await backend.delete("c")
+        assert await backend.mget(["a", "b", "c"]) == [None] * 3
+        assert await backend.cached_bytes() == 0
+
+        # A fill that read a table before a write is dropped.
+        versions = await backend.table_versions(["products"], "d")
+        await backend.bump_versions(["products"])
+        assert not await backend.set(**item("d", versions=versions))
+        fresh = await backend.table_versions(["products"], "e")
+        assert await backend.set_many([item("d", versions=versions), item("e", versions=fresh)]) == ["e"]
+        await backend.delete("e")
+        assert await backend.set(**item("d", versions=await backend.table_versions(["products"], "d")))
+
+        assert [(await backend.record_fill("d", 60))[0] for _ in range(3)] == [1, 2, 3]
+        assert await backend.reconcile_bytes(100) == len(b"value-d")
+
+        token = await backend.acquire_lock("d", 1000)
+        assert token and await backend.acquire_lock("d", 1000) is None
+        assert await backend.wait_for("d", 0.5, 0.01) == b"value-d"
+        await backend.release_lock("d", token)
+        assert await backend.wait_for("e", 0.5, 0.01) is None
+
+        await backend.set(**item("f"))
+        evicted = await backend.evicted_keys()
+        assert await backend.evict(1) == len(b"value-f")
+        assert await backend.evicted_keys() == evicted + 1
+        assert await backend.cached_bytes() == len(b"value-f")
+        assert sum(value is not None for value in await backend.mget(["d", "f"])) == 1
+
+        versions = await backend.table_versions(["products"], "d")
+        assert await backend.clear_namespace(100) > 0
+        assert await backend.get("d") is None
+        # Versions survive a clear, so a fill from before it cannot match again.
+        assert await backend.table_versions(["products"], "d") == versions
+        assert await backend.evicted_keys() == evicted + 1
+        assert await backend.ping()
+        await backend.close()
+
+    asyncio.run(scenario())
+
+
+def test_memory_backend_evicts_least_recently_used_first():
+    async def scenario():
+        backend = MemoryBackend()
+        for key in ("a", "b", "c"):
+            await backend.set(**item(key))
+        await backend.get("a")
+        await backend.evict(len(b"value-b") + 1)
+        return await backend.mget(["a", "b", "c"]), await backend.evicted_keys()
+
+    assert asyncio.run(scenario()) == ([b"value-a", None, None], 2)
+
+
+def test_sqlite_backend_keeps_entries_across_restarts(tmp_path):
+    path = str(tmp_path / "cache.db")
+
+    async def fill():
+        backend = SQLiteBackend(path)
+        await backend.set(**item("a"))
+        await backend.close()
+
+    async def restart():
+        backend = SQLiteBackend(path)
+        value = await backend.get("a"), await backend.cached_bytes()
+        await backend.close()
+        return value
+
+    asyncio.run(fill())
+    assert asyncio.run(restart()) == (b"value-a", len(b"value-a"))
+
+
+def test_sqlite_backend_delivers_messages_to_workers_sharing_the_file(tmp_path):
+    path = str(tmp_path / "cache.db")
+
+    async def scenario():
+        publisher, subscriber = SQLiteBackend(path), SQLiteBackend(path)
+        messages = subscriber.listen("invalidations")
+        receive = asyncio.ensure_future(anext(messages))
+        await asyncio.sleep(0.05)
+        await publisher.publish("other", "ignored")
+        await publisher.publish("invalidations", '{"all": true}')
+        message = await asyncio.wait_for(receive, 2)
+        await messages.aclose()
+        await publisher.close()
+        await subscriber.close()
+        return message
+
+    assert asyncio.run(scenario()) == '{"all": true}'
@@ -0,0 +1,186 @@
+import asyncio
+import shutil
+import socket
+import subprocess
+import time
+
+import pytest
+import redis as sync_redis
+
+from app.core.config import settings
+from app.services.redis_service import (
+    HashRing,
+    RedisService,
+    ShardedRedisService,
+    create_redis_service,
+)
+
+
+pytestmark = pytest.mark.skipif(shutil.which("redis-server") is None, reason="needs redis-server")
+
+
+def free_port(cluster: bool = False) -> int:
+    while True:
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            port = sock.getsockname()[1]
+        if not cluster:
+            return port
+        # Cluster nodes also listen on port + 10000 for the cluster bus.
+        if port + 10000 <= 65535:
+            with socket.socket() as sock:
+                try:
+                    sock.bind(("127.0.0.1", port + 10000))
+                    return port
+                except OSError:
+                    pass
+
+
+def start_server(tmp_path, *args) -> tuple[subprocess.Popen, int]:
+    port = free_port(cluster="--cluster-enabled" in args)
+    process = subprocess.Popen(
+        ["redis-server", "--port", str(port), "--save", "", "--appendonly", "no", "--dir", str(tmp_path), *args],
+        stdout=subprocess.DEVNULL,
+    )
+    client = sync_redis.Redis(port=port)
+    for _ in range(100):
+        try:
+            client.ping()
+            break
+        except sync_redis.ConnectionError:
+            time.sleep(0.05)
+    return process, port
+
+
+@pytest.fixture
+def servers(tmp_path):
+    processes = []
+
+    def start(*args) -> int:
+        process, port = start_server(tmp_path, *args)
+        processes.append(process)
+        return port
+
+    yield start
+    for process in processes:
+        process.terminate()
+        process.wait()
+
+
+def item(key: str, tags=("products",), versions=None) -> dict:
+    return {"key": key, "value": f"value-{key}".encode(), "tags": list(tags), "versions": versions}
+
+
+def test_hash_ring_moves_few_keys_when_a_node_joins():
+    keys = [f"{i:032x}" for i in range(10000)]
+    three = HashRing(["a", "b", "c"], 160)
+    four = HashRing(["a", "b", "c", "d"], 160)
+
+    owners = [three.node_for(key) for key in keys]
+    assert all(abs(owners.count(node) - len(keys) / 3) < len(keys) * 0.05 for node in range(3))
+
+    moved = sum(three.node_for(key) != four.node_for(key) for key in keys)
+    assert moved < len(keys) * 0.35
+    assert all(four.node_for(key) == 3 for key in keys if three.node_for(key) != four.node_for(key))
+
+
+def test_sharded_service_routes_entries_and_invalidations(servers):
+    ports = [servers(), servers()]
+    urls = [f"redis://127.0.0.1:{port}" for port in ports]
+
+    async def scenario():
+        shards = [RedisService.from_url(url) for url in urls]
+        service = ShardedRedisService(shards, urls, shards[0].redis)
+        keys = [f"{i:032x}" for i in range(50)]
+
+        assert sorted(await service.set_many([item(key) for key in keys])) == sorted(keys)
+        assert await service.mget(keys) == [f"value-{key}".encode() for key in keys]
+        assert await service.get(keys[0]) == f"value-{keys[0]}".encode()
+        assert await service.cached_bytes() == sum(len(f"value-{key}") for key in keys)
+
+        members, _ = await service.get_dependents("products")
+        assert len(members) == len(keys)
+        assert await service.unlink_dependents("products", members[:10]) == 10
+
+        assert await service.invalidate_tags(["products"]) == len(keys) - 10
+        assert await service.mget(keys) == [None] * len(keys)
+        assert await service.cached_bytes() == 0
+
+        # Every shard fences fills that read a table before a write.
+        versions = await service.table_versions(["products"], keys[1])
+        await service.bump_versions(["products"])
+        assert not await service.set(**item(keys[1], versions=versions))
+        assert await service.set(**item(keys[1], versions=await service.table_versions(["products"], keys[1])))
+
+        await service.close()
+
+    asyncio.run(scenario())
+
+    counts = [sync_redis.Redis(port=port).dbsize() for port in ports]
+    assert all(count > 0 for count in counts)
+
+
+def test_hits_are_read_from_replicas(servers):
+    primary = servers()
+    replica = servers("--replicaof", "127.0.0.1", str(primary))
+    replica_client = sync_redis.Redis(port=replica)
+
+    async def scenario():
+        service = RedisService.from_url(f"redis://127.0.0.1:{primary}", [f"redis://127.0.0.1:{replica}"])
+        await service.set(**item("abc"))
+        for _ in range(100):
+            if replica_client.exists("querycache:q:abc"):
+                break
+            await asyncio.sleep(0.05)
+
+        hits_before = replica_client.info("stats")["keyspace_hits"]
+        assert await service.get("abc") == b"value-abc"
+        assert replica_client.info("stats")["keyspace_hits"] == hits_before + 1
+        await service.close()
+
+    asyncio.run(scenario())
+
+
+@pytest.mark.skipif(shutil.which("redis-cli") is None, reason="needs redis-cli")
+def test_cluster_mode(servers, monkeypatch):
+    ports = [
+        servers("--cluster-enabled", "yes", "--cluster-config-file", f"nodes-{i}.conf")
+        for i in range(3)
+    ]
+    subprocess.run(
+        ["redis-cli", "--cluster", "create", *(f"127.0.0.1:{port}" for port in ports),
+         "--cluster-replicas", "0", "--cluster-yes"],
+        check=True, stdout=subprocess.DEVNULL, timeout=30,
+    )
+    for _ in range(100):
+        if b"cluster_state:ok" in subprocess.run(
+            ["redis-cli", "-p", str(ports[0]), "cluster", "info"], capture_output=True
+        ).stdout:
+            break
+        time.sleep(0.1)
+
+    monkeypatch.setattr(settings, "REDIS_CLUSTER_URL", f"redis://127.0.0.1:{ports[0]}")
+    monkeypatch.setattr(settings, "REDIS_CLUSTER_SHARDS", 8)
+
+    async def scenario():
+        service = create_redis_service()
+        keys = [f"{i:032x}" for i in range(40)]
+
+        assert sorted(await service.set_many([item(key) for key in keys])) == sorted(keys)
+        assert await service.mget(keys) == [f"value-{key}".encode() for key in keys]
+        token = await service.acquire_lock(keys[0], 1000)
+        assert token and await service.acquire_lock(keys[0], 1000) is None
+        await service.release_lock(keys[0], token)
+
+        evicted = await service.evicted_keys()
+        assert await service.evict(len(b"value-") + 32) == len(b"value-") + 32
+        assert await service.evicted_keys() == evicted + 1
+
+        assert await service.invalidate_tags(["products"]) == len(keys) - 1
+        assert await service.get(keys[0]) is None
+        await service.close()
+
+    asyncio.run(scenario())
+
+    counts = [sync_redis.Redis(port=port).dbsize() for port in ports]
+    assert sum(count > 0 for count in counts) >= 2